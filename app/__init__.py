@@ -3,8 +3,10 @@ from datetime import datetime
 from flask import Flask
 from flask_login import current_user
 from .extensions import db, login_manager
-from .models import User, Ingredient
+from .models import Ingredient
 from .routes import ALL_BLUEPRINTS
+from . import assets, compression, data_versions, metrics, migrations, price_history, profiling, rollups, routing, user_cache
+from .pool import engine_options
 
 
 def create_app():
@@ -14,12 +16,21 @@ def create_app():
     # Ensure instance folder exists (for SQLite local dev)
     os.makedirs(os.path.join(os.path.dirname(os.path.dirname(__file__)), "instance"), exist_ok=True)
 
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
     db.init_app(app)
     login_manager.init_app(app)
+    routing.init_app(app)
+    profiling.init_app(app)
+    metrics.init_app(app, db)
+    data_versions.init_app(app)
+    rollups.init_app(app)
+    price_history.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.get(User, int(user_id))
+        return user_cache.load_user(int(user_id))
 
     for bp in ALL_BLUEPRINTS:
         app.register_blueprint(bp)
@@ -49,7 +60,41 @@ def create_app():
             "now": datetime.utcnow,
         }
 
+    @app.cli.command("migrate")
+    def migrate_command():
+        """Apply pending schema migrations."""
+        applied = migrations.migrate(db)
+        for step in applied:
+            print(f"Applied {step}")
+        if not applied:
+            print("Schema is up to date.")
+
+    @app.cli.command("check-recipe-units")
+    def check_recipe_units_command():
+        """List recipe lines whose unit no longer converts; exits 1 if there are any."""
+        from . import cost_matrix
+        from .models import Shop
+        problems = 0
+        for shop_id, name in db.session.execute(db.select(Shop.id, Shop.name)).all():
+            for problem in cost_matrix.get(shop_id).problems:
+                print(f"{name}: {problem}")
+                problems += 1
+        if problems:
+            raise SystemExit(1)
+        print("Every recipe line converts.")
+
+    @app.cli.command("backfill-sale-costs")
+    def backfill_sale_costs_command():
+        """Cost sale lines sold before unit costs were captured at checkout."""
+        from .models import Shop
+        from .services.reports import backfill_unit_costs
+        total = 0
+        for shop_id in db.session.scalars(db.select(Shop.id)).all():
+            total += backfill_unit_costs(shop_id)
+            db.session.commit()
+        print(f"Costed {total} sale lines.")
+
     with app.app_context():
-        db.create_all()
+        migrations.ensure_schema(db, app.config["SCHEMA_CHECK"])
 
     return app
@@ -0,0 +1,112 @@
+"""Response compression for HTML, JSON, CSV and other text responses.
+
+Responses of an allowlisted type get brotli when the client accepts it, or
+gzip. Brotli is in requirements.txt; an environment without it falls back
+to gzip only. Buffered responses are compressed only above COMPRESS_MIN_SIZE
+bytes. Streamed responses are
+compressed as they go and flushed every STREAM_FLUSH_BYTES of input, so
+the client still receives rows as they are produced. Responses that already carry a
+Content-Encoding (precompressed static files), file passthroughs, partial
+content and `Cache-Control: no-transform` are left alone.
+"""
+import gzip
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript",
+    "application/javascript", "application/json", "application/xml", "image/svg+xml",
+}
+# Cheap settings: dynamic responses are compressed on every request
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Streamed responses are flushed to the client after this much input
+STREAM_FLUSH_BYTES = 16 * 1024
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _compress_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+        compress = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            out = compress(chunk)
+            pending += len(chunk)
+            # Flushing every tiny chunk would cost more bytes than it saves
+            if pending >= STREAM_FLUSH_BYTES:
+                out += flush()
+                pending = 0
+            if out:
+                yield out
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response, min_size):
+    if (
+        response.mimetype not in COMPRESSIBLE_TYPES
+        or not 200 <= response.status_code < 300
+        or response.status_code in (204, 206)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.cache_control.no_transform
+    ):
+        return response
+    if not response.is_streamed and response.calculate_content_length() < min_size:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(_compress(response.get_data(), encoding))
+    response.content_encoding = encoding
+    # A strong validator names exact bytes, which just changed
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def init_app(app):
+    if not app.config["COMPRESS_RESPONSES"]:
+        return
+    min_size = app.config["COMPRESS_MIN_SIZE"]
+
+    @app.after_request
+    def compress(response):
+        return compress_response(response, min_size)
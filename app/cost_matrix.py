@@ -0,0 +1,183 @@
+"""Per-worker cache of each shop's recipe and product costs as a sparse matrix.
+
+Recipes and products are rows of base quantities per ingredient: a recipe row
+holds what one unit of its yield uses, a product row what one product uses
+through its recipes. Their costs are then one matrix-vector product with the
+vector of ingredient prices, so what-if prices are costed in memory, without
+the ORM property chain behind Product.total_recipe_cost.
+
+A shop's matrix is built in two queries and keyed on its ingredients, recipes
+and products data versions. Any change to prices, units, recipe lines, yields
+or product links rebuilds it on the next read. Analyses derived from the
+matrix alone (see `CostMatrix.memo`) are kept with it for as long.
+"""
+import threading
+from array import array
+from collections import OrderedDict, defaultdict
+from flask import current_app
+from sqlalchemy import select
+from . import data_versions
+from .extensions import db
+from .models import Ingredient, Product, ProductRecipe, Recipe, RecipeIngredient
+from .units import UnitError, registry
+
+DEPENDS_ON = ("ingredients", "recipes", "products")
+
+_cache = OrderedDict()  # shop id -> (data versions, CostMatrix), least recently used first
+_lock = threading.Lock()
+
+
+class Rows:
+    """Sparse rows of (ingredient column, base quantity) pairs."""
+
+    def __init__(self):
+        self.cols = []
+        self.qtys = []
+
+    def append(self, usage):
+        self.cols.append(array("l", usage.keys()))
+        self.qtys.append(array("d", usage.values()))
+
+    def dot(self, vector):
+        """Rows times a column vector: one total per row."""
+        return [sum(vector[c] * q for c, q in zip(cols, qtys)) for cols, qtys in zip(self.cols, self.qtys)]
+
+    def tdot(self, size, *weights):
+        """Row vectors times the rows, in one pass: per vector, one total per column."""
+        totals = [[0.0] * size for _ in weights]
+        for i, (cols, qtys) in enumerate(zip(self.cols, self.qtys)):
+            for out, row_weights in zip(totals, weights):
+                w = row_weights[i]
+                if w:
+                    for c, q in zip(cols, qtys):
+                        out[c] += w * q
+        return totals
+
+
+class CostMatrix:
+    """One shop's recipes and products over the ingredients their recipes use."""
+
+    def __init__(self, lines, products):
+        self.ingredients = []  # column -> {"id", "name", "base_unit"}
+        self.column = {}  # ingredient id -> column
+        prices = []
+        self.problems = []
+        self.incomplete_recipes = set()  # ids of recipes whose cost leaves out a line
+
+        usage = {}  # recipe id -> {column: base quantity per unit of yield}
+        self.recipes = []
+        units = None
+        for row in lines:  # every recipe, with its lines if any
+            recipe = usage.get(row.recipe_id)
+            if recipe is None:
+                recipe = usage[row.recipe_id] = defaultdict(float)
+                self.recipes.append({"id": row.recipe_id, "name": row.recipe})
+            if row.id is None:
+                continue
+            col = self.column.get(row.id)
+            if col is None:
+                col = self.column[row.id] = len(self.ingredients)
+                self.ingredients.append({"id": row.id, "name": row.name, "base_unit": row.base_unit})
+                prices.append(row.cost_per_base_unit or 0.0)
+            units = units or registry(row.shop_id)
+            try:
+                base = units.to_base(row.quantity, row.unit, row)
+            except UnitError as e:
+                self.problems.append(f"{row.recipe}: {e}")
+                self.incomplete_recipes.add(row.recipe_id)
+                continue
+            per_batch = row.yield_quantity if row.yield_quantity and row.yield_quantity > 0 else 1
+            recipe[col] += base / per_batch
+        self.prices = array("d", prices)
+        self.recipe_rows = Rows()
+        for recipe in self.recipes:
+            self.recipe_rows.append(usage[recipe["id"]])
+
+        self.products = []
+        self.incomplete_products = set()
+        combined = {}
+        for row in products:  # every product, with its recipe links if any
+            product = combined.get(row.id)
+            if product is None:
+                product = combined[row.id] = defaultdict(float)
+                self.products.append({"id": row.id, "name": row.name, "category": row.category or "",
+                                      "selling_price": row.selling_price or 0.0, "is_active": row.is_active})
+            if row.recipe_id in self.incomplete_recipes:
+                self.incomplete_products.add(row.id)
+            for col, qty in usage.get(row.recipe_id, {}).items():
+                product[col] += qty * (row.quantity_needed or 0)
+        self.product_rows = Rows()
+        for product in self.products:
+            self.product_rows.append(combined[product["id"]])
+
+        self.recipe_costs = self.recipe_rows.dot(self.prices)
+        self.product_costs = self.product_rows.dot(self.prices)
+        self._memo = {}
+
+    def memo(self, key, compute):
+        """compute(), kept with this matrix: valid until prices, recipes or products change."""
+        if key not in self._memo:
+            if len(self._memo) >= 16:  # e.g. one key per day for a matrix that never changes
+                self._memo.clear()
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def prices_with(self, changes):
+        """The price vector with {ingredient id: cost_per_base_unit} applied."""
+        prices = array("d", self.prices)
+        for ingredient_id, cost in changes.items():
+            col = self.column.get(ingredient_id)
+            if col is not None:
+                prices[col] = cost
+        return prices
+
+    def unit_costs(self):
+        """{product id: recipe cost of one unit} at current prices; checkout's cost table.
+
+        Products whose recipes have a line that doesn't convert are left out
+        rather than costed low."""
+        return self.memo("unit_costs", lambda: {
+            product["id"]: cost for product, cost in zip(self.products, self.product_costs)
+            if product["id"] not in self.incomplete_products})
+
+
+def _build(shop_id):
+    lines = db.session.execute(
+        select(
+            Recipe.shop_id, Recipe.id.label("recipe_id"), Recipe.name.label("recipe"), Recipe.yield_quantity,
+            RecipeIngredient.quantity, RecipeIngredient.unit, Ingredient.id, Ingredient.name,
+            Ingredient.base_unit, Ingredient.density, Ingredient.cost_per_base_unit,
+        )
+        .outerjoin(RecipeIngredient, RecipeIngredient.recipe_id == Recipe.id)
+        .outerjoin(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .where(Recipe.shop_id == shop_id)
+        .order_by(Recipe.name, Recipe.id, Ingredient.name)
+    ).all()
+    products = db.session.execute(
+        select(Product.id, Product.name, Product.category, Product.selling_price, Product.is_active,
+               ProductRecipe.recipe_id, ProductRecipe.quantity_needed)
+        .outerjoin(ProductRecipe, ProductRecipe.product_id == Product.id)
+        .where(Product.shop_id == shop_id)
+        .order_by(Product.name, Product.id)
+    ).all()
+    return CostMatrix(lines, products)
+
+
+def get(shop_id):
+    """The shop's CostMatrix, from this worker's cache unless its inputs changed."""
+    current = data_versions.versions(shop_id)
+    key = tuple(current.get(entity, 0) for entity in DEPENDS_ON)
+    with _lock:
+        entry = _cache.get(shop_id)
+        if entry is not None and entry[0] == key:
+            _cache.move_to_end(shop_id)
+            return entry[1]
+
+    matrix = _build(shop_id)
+    size = current_app.config["COST_MATRIX_CACHE_SIZE"]
+    if size:
+        with _lock:
+            _cache[shop_id] = (key, matrix)
+            while len(_cache) > size:
+                _cache.popitem(last=False)
+    return matrix
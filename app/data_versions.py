@@ -0,0 +1,94 @@
+"""Per-shop data versions: a counter per (shop, entity) bumped by every write.
+
+A session listener bumps the counters for whatever a flush inserted, updated
+or deleted, in the same transaction, so a version never moves ahead of the
+data it describes. Bulk statements bypass the ORM's unit of work and must
+call `bump` themselves (the importer, and the bulk deletes of recipe lines
+and product links in the edit views).
+
+Readers get every counter of a shop in one query with `versions`, memoized
+for the request.
+"""
+from flask import g, has_request_context
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from .extensions import db
+from .models import CustomUnit, DataVersion, Ingredient, Product, ProductRecipe, Recipe, RecipeIngredient
+
+# Model -> (entity, parent model holding shop_id or None, foreign key column to it)
+TRACKED = {
+    Ingredient: ("ingredients", None, None),
+    # Units change what recipe lines convert to, so costs move with them
+    CustomUnit: ("ingredients", None, None),
+    Recipe: ("recipes", None, None),
+    RecipeIngredient: ("recipes", Recipe, "recipe_id"),
+    Product: ("products", None, None),
+    ProductRecipe: ("products", Product, "product_id"),
+}
+
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def _upsert(conn, shop_id, entity):
+    insert = _UPSERTS[conn.dialect.name](DataVersion.__table__)
+    stmt = insert.values(shop_id=shop_id, entity=entity, version=1).on_conflict_do_update(
+        index_elements=["shop_id", "entity"],
+        set_={"version": DataVersion.__table__.c.version + 1},
+    )
+    conn.execute(stmt)
+
+
+def _shop_of(session, obj, parent, fk):
+    if parent is None:
+        return obj.shop_id
+    parent_id = getattr(obj, fk)
+    loaded = session.identity_map.get(session.identity_key(parent, parent_id))
+    if loaded is not None:
+        return loaded.shop_id
+    return session.connection().execute(
+        select(parent.shop_id).where(parent.id == parent_id)).scalar()
+
+
+def _after_flush(session, flush_context):
+    touched = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tracked = TRACKED.get(type(obj))
+        if tracked is None or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        entity, parent, fk = tracked
+        shop_id = _shop_of(session, obj, parent, fk)
+        if shop_id is not None:
+            touched.add((shop_id, entity))
+    conn = session.connection()
+    for shop_id, entity in sorted(touched):
+        _upsert(conn, shop_id, entity)
+    if touched and has_request_context():
+        g.pop("data_versions", None)
+
+
+def bump(shop_id, *entities):
+    """Bump versions for writes made with bulk statements; commits with the session."""
+    conn = db.session.connection()
+    for entity in sorted(entities):
+        _upsert(conn, shop_id, entity)
+    if has_request_context():
+        g.pop("data_versions", None)
+
+
+def versions(shop_id):
+    """{entity: version} for a shop; entities never written to are missing (version 0)."""
+    cached = g.get("data_versions") if has_request_context() else None
+    if cached and cached[0] == shop_id:
+        return cached[1]
+    rows = db.session.execute(
+        select(DataVersion.entity, DataVersion.version).where(DataVersion.shop_id == shop_id))
+    current = dict(rows.all())
+    if has_request_context():
+        g.data_versions = (shop_id, current)
+    return current
+
+
+def init_app(app):
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
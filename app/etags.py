@@ -0,0 +1,71 @@
+"""Weak ETags and 304 Not Modified for read views, from per-shop data versions.
+
+A view decorated with `conditional(*entities)` gets an ETag hashed from the
+versions of those entities (see app/data_versions.py) plus everything else the
+response shows that is not versioned: the user and shop the layout prints,
+today's date, the URL, whether HTMX asked for a partial, and the deployed
+templates. A client revalidating with a matching If-None-Match costs one
+version query and an empty 304; the view itself never runs.
+"""
+import hashlib
+import os
+from datetime import date
+from functools import wraps
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from . import data_versions
+
+_release = None
+
+
+def _templates_digest():
+    """Identifies the deployed templates, so a release changes every ETag."""
+    global _release
+    if _release is None:
+        digest = hashlib.sha1()
+        root = os.path.join(current_app.root_path, current_app.template_folder)
+        for folder, _, files in sorted(os.walk(root)):
+            for name in sorted(files):
+                path = os.path.join(folder, name)
+                digest.update(f"{os.path.relpath(path, root)}:{os.stat(path).st_mtime_ns};".encode())
+        _release = digest.hexdigest()[:12]
+    return _release
+
+
+def _etag(entities):
+    user, shop = current_user, current_user.shop
+    current = data_versions.versions(shop.id)
+    parts = [
+        _templates_digest(), request.full_path, request.headers.get("HX-Request", ""),
+        user.id, user.display_name, user.role, shop.id, shop.name, shop.currency,
+        date.today().isoformat(), *(f"{e}={current.get(e, 0)}" for e in entities),
+    ]
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20]
+
+
+def conditional(*entities):
+    """Serve the view with a weak ETag and answer matching revalidations with 304.
+
+    List every entity the response shows or computes from; pages with the
+    full layout also depend on ingredients through the low-stock badge.
+    Goes under @login_required.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            # Flashed messages are shown once, so such a page can't be revalidated
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+            tag = _etag(entities)
+            if request.if_none_match.contains_weak(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag, weak=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.vary.add("HX-Request")
+            return response
+        return wrapped
+    return decorator
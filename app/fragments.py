@@ -0,0 +1,52 @@
+"""Per-worker cache of rendered HTMX partials.
+
+A fragment is keyed by the shop, the endpoint and its query string, the shop's
+currency and today's date (both appear in the markup), and the data versions
+of the entities it is built from. Any write to those entities bumps a version,
+so stale fragments are never served; they just age out of the LRU. A hit
+costs the one query reading the versions and skips both the list query and
+the template.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+from flask import current_app, request
+from flask_login import current_user
+from . import data_versions, metrics
+
+_fragments = OrderedDict()  # key -> rendered markup, least recently used first
+_lock = threading.Lock()
+
+
+def cached(depends_on, render):
+    """The fragment for this request, from cache or from `render()` on a miss.
+
+    `depends_on` names the entities (see data_versions.TRACKED) whose rows the
+    fragment shows, including those it computes from, e.g. costs from ingredients.
+    """
+    size = current_app.config["FRAGMENT_CACHE_SIZE"]
+    if not size:
+        return render()
+
+    shop = current_user.shop
+    current = data_versions.versions(shop.id)
+    key = (
+        shop.id, request.endpoint, tuple(sorted(request.args.items(multi=True))),
+        shop.currency, date.today(), tuple(current.get(entity, 0) for entity in depends_on),
+    )
+    with _lock:
+        html = _fragments.get(key)
+        if html is not None:
+            _fragments.move_to_end(key)
+    if html is not None:
+        metrics.FRAGMENT_CACHE.labels("hit").inc()
+        return html
+
+    metrics.FRAGMENT_CACHE.labels("miss").inc()
+    html = render()
+    with _lock:
+        _fragments[key] = html
+        while len(_fragments) > size:
+            _fragments.popitem(last=False)
+    return html
+
@@ -0,0 +1,121 @@
+"""Prometheus metrics for requests, the database and business events.
+
+Under gunicorn every worker records into PROMETHEUS_MULTIPROC_DIR (set up by
+gunicorn.conf.py) and /metrics aggregates across all of them. Without that
+variable, e.g. under the dev server, the process-local registry is used.
+"""
+import os
+import time
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import pool
+
+REQUEST_LATENCY = Histogram(
+    "pastrycloud_request_duration_seconds", "Request latency by endpoint",
+    ["endpoint", "method"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    "pastrycloud_requests_total", "Requests by endpoint and status",
+    ["endpoint", "method", "status"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "pastrycloud_db_query_duration_seconds", "SQL statement latency",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "pastrycloud_db_pool_checked_out", "Connections in use", ["database"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "pastrycloud_db_pool_overflow", "Connections open beyond pool_size", ["database"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT = Histogram(
+    "pastrycloud_db_pool_wait_seconds", "Time to acquire a pooled connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+CHECKOUTS = Counter("pastrycloud_checkouts_total", "Quick-sale checkouts", ["result"])
+CHECKOUT_LATENCY = Histogram(
+    "pastrycloud_checkout_duration_seconds", "Checkout processing time",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+SALES_AMOUNT = Counter("pastrycloud_sales_amount_total", "Checked-out sales value incl. VAT")
+PRODUCTION_COMPLETIONS = Counter(
+    "pastrycloud_production_completions_total", "Production run completions", ["result"],
+)
+PRODUCTION_LATENCY = Histogram(
+    "pastrycloud_production_completion_duration_seconds", "Production completion time",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+FRAGMENT_CACHE = Counter("pastrycloud_fragment_cache_total", "Cached HTMX partial lookups", ["result"])
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None:
+        return
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    DB_QUERY_LATENCY.labels(verb if verb in _OPERATIONS else "OTHER").observe(time.perf_counter() - start)
+
+
+def _track_pool(name, engine):
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    overflow = DB_POOL_OVERFLOW.labels(name)
+
+    def on_checkout(*args):
+        checked_out.inc()
+        if hasattr(engine.pool, "overflow"):
+            overflow.set(max(engine.pool.overflow(), 0))
+
+    def on_checkin(*args):
+        checked_out.dec()
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+
+def render():
+    """(body, content_type) for the /metrics endpoint."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_app(app, db):
+    if not event.contains(Engine, "before_cursor_execute", _before_execute):
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+        pool.WAIT_OBSERVERS.append(DB_POOL_WAIT.observe)
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            _track_pool(bind or "default", engine)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            # Unmatched URLs share one label so 404 scans can't blow up cardinality
+            endpoint = request.endpoint or "unmatched"
+            REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - start)
+            REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        return response
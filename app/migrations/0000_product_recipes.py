@@ -0,0 +1,27 @@
+"""Replace products.recipe_id with the product_recipes junction table (was migrate_product_recipes.sql)."""
+from sqlalchemy import Column, Float, ForeignKey, Integer, MetaData, Table, inspect, text
+
+metadata = MetaData()
+Table("products", metadata, Column("id", Integer, primary_key=True))
+Table("recipes", metadata, Column("id", Integer, primary_key=True))
+product_recipes = Table(
+    "product_recipes", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("recipe_id", Integer, ForeignKey("recipes.id"), nullable=False),
+    Column("quantity_needed", Float, default=1.0),
+)
+
+
+def upgrade(conn):
+    product_recipes.create(conn, checkfirst=True)
+    columns = {c["name"] for c in inspect(conn).get_columns("products")}
+    if "recipe_id" not in columns:
+        return
+    conn.execute(text(
+        "INSERT INTO product_recipes (product_id, recipe_id, quantity_needed) "
+        "SELECT id, recipe_id, 1.0 FROM products WHERE recipe_id IS NOT NULL"
+    ))
+    # SQLite can't drop a column that carries a foreign key; the leftover column is unused.
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE products DROP COLUMN recipe_id"))
@@ -0,0 +1,32 @@
+"""Add updated_at to products, production_runs, sales and waste_logs, and the
+deleted_records tombstone table, for incremental exports."""
+from datetime import datetime
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, MetaData, String, Table, text
+from app.migrations import add_column
+
+BACKFILL = {
+    "products": "created_at",
+    "production_runs": "COALESCE(produced_at, created_at)",
+    "sales": "created_at",
+    "waste_logs": "logged_at",
+    "ingredients": "created_at",
+    "recipes": "created_at",
+}
+
+metadata = MetaData()
+Table("shops", metadata, Column("id", Integer, primary_key=True))
+deleted_records = Table(
+    "deleted_records", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("shop_id", Integer, ForeignKey("shops.id"), nullable=False),
+    Column("entity", String(30), nullable=False),
+    Column("entity_id", Integer, nullable=False),
+    Column("deleted_at", DateTime, default=datetime.utcnow),
+)
+
+
+def upgrade(conn):
+    for table, source in BACKFILL.items():
+        add_column(conn, table, "updated_at", "TIMESTAMP")
+        conn.execute(text(f"UPDATE {table} SET updated_at = {source} WHERE updated_at IS NULL"))
+    deleted_records.create(conn, checkfirst=True)
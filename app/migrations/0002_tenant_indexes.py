@@ -0,0 +1,36 @@
+"""Indexes for tenant-scoped list, dashboard and export queries, plus unindexed foreign keys."""
+from app.migrations import create_index
+
+INDEXES = [
+    ("ix_users_shop_id", "users", ["shop_id"]),
+    ("ix_ingredients_shop_name", "ingredients", ["shop_id", "name"]),
+    ("ix_ingredients_shop_updated", "ingredients", ["shop_id", "updated_at"]),
+    ("ix_recipes_shop_name", "recipes", ["shop_id", "name"]),
+    ("ix_recipes_shop_updated", "recipes", ["shop_id", "updated_at"]),
+    ("ix_recipe_ingredients_recipe_id", "recipe_ingredients", ["recipe_id"]),
+    ("ix_recipe_ingredients_ingredient_id", "recipe_ingredients", ["ingredient_id"]),
+    ("ix_products_shop_name", "products", ["shop_id", "name"]),
+    ("ix_products_shop_updated", "products", ["shop_id", "updated_at"]),
+    ("ix_product_recipes_product_id", "product_recipes", ["product_id"]),
+    ("ix_product_recipes_recipe_id", "product_recipes", ["recipe_id"]),
+    ("ix_production_runs_shop_created", "production_runs", ["shop_id", "created_at"]),
+    ("ix_production_runs_shop_updated", "production_runs", ["shop_id", "updated_at"]),
+    ("ix_production_runs_recipe_id", "production_runs", ["recipe_id"]),
+    ("ix_sales_shop_date", "sales", ["shop_id", "sale_date"]),
+    ("ix_sales_shop_created", "sales", ["shop_id", "created_at"]),
+    ("ix_sales_shop_updated", "sales", ["shop_id", "updated_at"]),
+    ("ix_sale_items_sale_id", "sale_items", ["sale_id"]),
+    ("ix_sale_items_product_id", "sale_items", ["product_id"]),
+    ("ix_waste_logs_shop_logged", "waste_logs", ["shop_id", "logged_at"]),
+    ("ix_waste_logs_shop_updated", "waste_logs", ["shop_id", "updated_at"]),
+    ("ix_waste_logs_ingredient_id", "waste_logs", ["ingredient_id"]),
+    ("ix_waste_logs_product_id", "waste_logs", ["product_id"]),
+    ("ix_deleted_records_shop_entity", "deleted_records", ["shop_id", "entity", "deleted_at"]),
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns)
+    create_index(conn, "ix_ingredients_shop_low_stock", "ingredients",
+                 ["shop_id", "quantity_on_hand"], where="quantity_on_hand <= min_stock_level")
@@ -0,0 +1,15 @@
+"""Add the data_versions table: per-shop write counters keying the fragment cache."""
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table
+
+metadata = MetaData()
+Table("shops", metadata, Column("id", Integer, primary_key=True))
+data_versions = Table(
+    "data_versions", metadata,
+    Column("shop_id", Integer, ForeignKey("shops.id"), primary_key=True),
+    Column("entity", String(30), primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+
+def upgrade(conn):
+    data_versions.create(conn, checkfirst=True)
@@ -0,0 +1,24 @@
+"""Add ingredient densities and the custom_units table (see app/units.py)."""
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table
+from app.migrations import add_column
+
+metadata = MetaData()
+Table("shops", metadata, Column("id", Integer, primary_key=True))
+Table("ingredients", metadata, Column("id", Integer, primary_key=True))
+custom_units = Table(
+    "custom_units", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("shop_id", Integer, ForeignKey("shops.id"), nullable=False),
+    Column("ingredient_id", Integer, ForeignKey("ingredients.id"), nullable=True),
+    Column("name", String(30), nullable=False),
+    Column("dimension", String(10), nullable=False),
+    Column("factor", Float, nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow),
+    Index("ix_custom_units_shop_name", "shop_id", "name"),
+)
+
+
+def upgrade(conn):
+    add_column(conn, "ingredients", "density", "FLOAT")
+    custom_units.create(conn, checkfirst=True)
@@ -0,0 +1,85 @@
+"""Add the waste and activity rollup tables (see app/rollups.py) and fill them
+from the existing waste logs, completed production runs and sales."""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, select
+
+metadata = MetaData()
+Table("shops", metadata, Column("id", Integer, primary_key=True))
+waste_rollups = Table(
+    "waste_rollups", metadata,
+    Column("shop_id", Integer, ForeignKey("shops.id"), primary_key=True),
+    Column("period", String(5), primary_key=True),
+    Column("period_start", Date, primary_key=True),
+    Column("category", String(30), primary_key=True),
+    Column("ingredient_id", Integer, primary_key=True, default=0),
+    Column("product_id", Integer, primary_key=True, default=0),
+    Column("entries", Integer, nullable=False, default=0),
+    Column("cost", Float, nullable=False, default=0.0),
+)
+activity_rollups = Table(
+    "activity_rollups", metadata,
+    Column("shop_id", Integer, ForeignKey("shops.id"), primary_key=True),
+    Column("period", String(5), primary_key=True),
+    Column("period_start", Date, primary_key=True),
+    Column("production_cost", Float, nullable=False, default=0.0),
+    Column("sales", Float, nullable=False, default=0.0),
+)
+waste_logs = Table(
+    "waste_logs", metadata,
+    Column("shop_id", Integer), Column("category", String(30)), Column("ingredient_id", Integer),
+    Column("product_id", Integer), Column("logged_at", DateTime), Column("cost_estimate", Float),
+)
+production_runs = Table(
+    "production_runs", metadata,
+    Column("shop_id", Integer), Column("status", String(20)),
+    Column("produced_at", DateTime), Column("cost_total", Float),
+)
+sales = Table(
+    "sales", metadata,
+    Column("shop_id", Integer), Column("sale_date", Date),
+    Column("total_amount", Float), Column("vat_amount", Float),
+)
+
+
+def _starts(day):
+    if isinstance(day, datetime):
+        day = day.date()
+    return {"week": day - timedelta(days=day.weekday()), "month": day.replace(day=1)}
+
+
+def upgrade(conn):
+    waste_rollups.create(conn, checkfirst=True)
+    activity_rollups.create(conn, checkfirst=True)
+    if conn.execute(select(waste_rollups.c.shop_id).limit(1)).first() or \
+            conn.execute(select(activity_rollups.c.shop_id).limit(1)).first():
+        return
+
+    waste = defaultdict(lambda: [0, 0.0])
+    activity = defaultdict(lambda: [0.0, 0.0])
+    for row in conn.execute(select(waste_logs).where(waste_logs.c.logged_at.is_not(None))):
+        for period, start in _starts(row.logged_at).items():
+            entry = waste[(row.shop_id, period, start, row.category or "other",
+                           row.ingredient_id or 0, row.product_id or 0)]
+            entry[0] += 1
+            entry[1] += row.cost_estimate or 0.0
+    for row in conn.execute(select(production_runs).where(
+            production_runs.c.status == "completed", production_runs.c.produced_at.is_not(None))):
+        for period, start in _starts(row.produced_at).items():
+            activity[(row.shop_id, period, start)][0] += row.cost_total or 0.0
+    for row in conn.execute(select(sales).where(sales.c.sale_date.is_not(None))):
+        for period, start in _starts(row.sale_date).items():
+            activity[(row.shop_id, period, start)][1] += (row.total_amount or 0.0) - (row.vat_amount or 0.0)
+
+    if waste:
+        conn.execute(waste_rollups.insert(), [
+            {"shop_id": k[0], "period": k[1], "period_start": k[2], "category": k[3],
+             "ingredient_id": k[4], "product_id": k[5], "entries": v[0], "cost": v[1]}
+            for k, v in waste.items()
+        ])
+    if activity:
+        conn.execute(activity_rollups.insert(), [
+            {"shop_id": k[0], "period": k[1], "period_start": k[2],
+             "production_cost": v[0], "sales": v[1]}
+            for k, v in activity.items()
+        ])
@@ -0,0 +1,7 @@
+"""Record on each waste entry how much ingredient stock it deducted, so deleting
+the entry can put exactly that back. Older entries deducted nothing."""
+from app.migrations import add_column
+
+
+def upgrade(conn):
+    add_column(conn, "waste_logs", "stock_deducted", "FLOAT DEFAULT 0")
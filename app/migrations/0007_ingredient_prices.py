@@ -0,0 +1,33 @@
+"""Add the ingredient_prices history (see app/price_history.py), starting each
+ingredient's history at its current price."""
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, Table, func, select
+
+metadata = MetaData()
+Table("shops", metadata, Column("id", Integer, primary_key=True))
+ingredients = Table(
+    "ingredients", metadata,
+    Column("id", Integer, primary_key=True), Column("shop_id", Integer),
+    Column("cost_per_base_unit", Float), Column("created_at", DateTime),
+)
+ingredient_prices = Table(
+    "ingredient_prices", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("shop_id", Integer, ForeignKey("shops.id"), nullable=False),
+    Column("ingredient_id", Integer, ForeignKey("ingredients.id", ondelete="CASCADE"), nullable=False),
+    Column("cost_per_base_unit", Float, nullable=False),
+    Column("effective_at", DateTime, nullable=False, default=datetime.utcnow),
+    Index("ix_ingredient_prices_shop_ingredient", "shop_id", "ingredient_id", "effective_at"),
+)
+
+
+def upgrade(conn):
+    ingredient_prices.create(conn, checkfirst=True)
+    if conn.execute(select(ingredient_prices.c.id).limit(1)).first():
+        return
+    conn.execute(ingredient_prices.insert().from_select(
+        ["shop_id", "ingredient_id", "cost_per_base_unit", "effective_at"],
+        select(ingredients.c.shop_id, ingredients.c.id,
+               func.coalesce(ingredients.c.cost_per_base_unit, 0.0),
+               func.coalesce(ingredients.c.created_at, datetime.utcnow())),
+    ))
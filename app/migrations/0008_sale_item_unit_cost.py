@@ -0,0 +1,7 @@
+"""Capture the recipe cost of each sale line at checkout. Older lines stay NULL
+until `flask backfill-sale-costs` costs them at their day's prices."""
+from app.migrations import add_column
+
+
+def upgrade(conn):
+    add_column(conn, "sale_items", "unit_cost", "FLOAT")
@@ -0,0 +1,143 @@
+"""Versioned schema migrations.
+
+Each module in this package named ``NNNN_description.py`` defines
+``upgrade(conn)``. Migrations run in version order, each in its own
+transaction, and applied versions are recorded in ``schema_migrations``.
+Write them to be idempotent so they are safe on databases that were
+created from the models by ``db.create_all``.
+"""
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+log = logging.getLogger(__name__)
+
+# Arbitrary key for the PostgreSQL advisory lock serialising concurrent upgrades
+LOCK_KEY = 7263001
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def discover():
+    """Return [(version, name, module)] for every migration, oldest first."""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        prefix, _, rest = info.name.partition("_")
+        if not prefix.isdigit():
+            continue
+        module = importlib.import_module(f"{__name__}.{info.name}")
+        found.append((int(prefix), rest, module))
+    return sorted(found, key=lambda m: m[0])
+
+
+def applied_versions(conn):
+    if not inspect(conn).has_table(schema_migrations.name):
+        return set()
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def head():
+    return max(m[0] for m in discover())
+
+
+def pending(engine):
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+    return [m for m in discover() if m[0] not in done]
+
+
+def upgrade(engine):
+    """Apply all pending migrations. Returns the names of the ones applied."""
+    metadata.create_all(engine)
+    applied = []
+    with engine.connect() as lock_conn:
+        if engine.dialect.name == "postgresql":
+            # Workers booting at the same time must not run the same migration twice
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+        try:
+            for version, name, module in pending(engine):
+                with engine.begin() as conn:
+                    module.upgrade(conn)
+                    conn.execute(schema_migrations.insert().values(version=version, name=name))
+                applied.append(f"{version:04d}_{name}")
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+                lock_conn.commit()
+    return applied
+
+
+def stamp(engine):
+    """Mark every migration as applied without running it (schema built from the models)."""
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+        rows = [{"version": v, "name": n} for v, n, _ in discover() if v not in done]
+        if rows:
+            conn.execute(schema_migrations.insert(), rows)
+
+
+def current_version(engine):
+    """Highest applied version in one query; None if the database was never migrated."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return None
+
+
+def migrate(db):
+    """Bring the schema to head. Returns a list of what was done.
+
+    An empty database is built from the models and stamped instead of
+    replaying every migration.
+    """
+    engine = db.engine
+    if current_version(engine) is None and not inspect(engine).has_table("shops"):
+        db.create_all(bind_key=None)
+        stamp(engine)
+        return ["schema created from models"]
+    return upgrade(engine)
+
+
+def ensure_schema(db, mode="auto"):
+    """Boot-time schema check.
+
+    "auto" costs one SELECT when the schema is current and never issues DDL
+    in that case; otherwise the schema is migrated. "off" skips the check
+    entirely, for deploys that run ``flask migrate`` before starting workers.
+    """
+    if mode == "off":
+        return
+    version = current_version(db.engine)
+    if version is not None and version >= head():
+        return
+    for step in migrate(db):
+        log.info("Schema migration: %s", step)
+
+
+# --- Helpers for migration modules ---
+
+def add_column(conn, table, column, ddl_type):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def create_index(conn, name, table, columns, where=None):
+    """CREATE INDEX IF NOT EXISTS, optionally partial (SQLite and PostgreSQL both support it)."""
+    sql = f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    if where:
+        sql += f" WHERE {where}"
+    conn.execute(text(sql))
@@ -3,6 +3,7 @@ from datetime import datetime, date
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from .extensions import db
+from .units import UnitError, format_quantity, registry
 
 
 class Shop(db.Model):
@@ -30,7 +31,7 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     display_name = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(20), default="member")  # owner / member
-    shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     shop = db.relationship("Shop", back_populates="users")
@@ -44,6 +45,16 @@ class User(UserMixin, db.Model):
 
 class Ingredient(db.Model):
     __tablename__ = "ingredients"
+    __table_args__ = (
+        db.Index("ix_ingredients_shop_name", "shop_id", "name"),
+        db.Index("ix_ingredients_shop_updated", "shop_id", "updated_at"),
+        # Low-stock lookups compare two columns, so index just the rows that match
+        db.Index(
+            "ix_ingredients_shop_low_stock", "shop_id", "quantity_on_hand",
+            sqlite_where=db.text("quantity_on_hand <= min_stock_level"),
+            postgresql_where=db.text("quantity_on_hand <= min_stock_level"),
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
@@ -54,12 +65,14 @@ class Ingredient(db.Model):
     cost_per_base_unit = db.Column(db.Float, default=0.0)
     min_stock_level = db.Column(db.Float, default=0.0)  # in base units
     expiry_date = db.Column(db.Date, nullable=True)
+    density = db.Column(db.Float, nullable=True)  # g per mL, for converting mass <-> volume
     notes = db.Column(db.Text, default="")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     recipe_ingredients = db.relationship("RecipeIngredient", back_populates="ingredient", cascade="all, delete-orphan")
     waste_logs = db.relationship("WasteLog", back_populates="ingredient")
+    custom_units = db.relationship("CustomUnit", back_populates="ingredient", cascade="all, delete-orphan")
 
     @property
     def stock_status(self):
@@ -91,6 +104,10 @@ class Ingredient(db.Model):
 
 class Recipe(db.Model):
     __tablename__ = "recipes"
+    __table_args__ = (
+        db.Index("ix_recipes_shop_name", "shop_id", "name"),
+        db.Index("ix_recipes_shop_updated", "shop_id", "updated_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
@@ -109,11 +126,13 @@ class Recipe(db.Model):
 
     @property
     def total_cost(self):
-        total = 0.0
-        for ri in self.ingredients:
-            base_qty = convert_to_base(ri.quantity, ri.unit, ri.ingredient.base_unit)
-            total += base_qty * ri.ingredient.cost_per_base_unit
-        return total
+        """Cost of the lines whose unit converts; incomplete if `unit_errors` lists any."""
+        return sum(ri.line_cost for ri in self.ingredients if ri.unit_error is None)
+
+    @property
+    def unit_errors(self):
+        """'Ingredient: why' for each line left out of total_cost."""
+        return [f"{ri.ingredient.name}: {ri.unit_error}" for ri in self.ingredients if ri.unit_error is not None]
 
     @property
     def cost_per_unit(self):
@@ -126,25 +145,47 @@ class RecipeIngredient(db.Model):
     __tablename__ = "recipe_ingredients"
 
     id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.id"), nullable=False)
-    ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredients.id"), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.id"), nullable=False, index=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredients.id"), nullable=False, index=True)
     quantity = db.Column(db.Float, nullable=False)
     unit = db.Column(db.String(10), nullable=False)  # display unit
 
     recipe = db.relationship("Recipe", back_populates="ingredients")
     ingredient = db.relationship("Ingredient", back_populates="recipe_ingredients")
 
+    @property
+    def unit_error(self):
+        """Why this line's unit doesn't convert to the ingredient's base unit, or None.
+
+        Lines can stop converting when an ingredient's base unit or density
+        changes; they then count as nothing until the recipe is fixed
+        (`flask check-recipe-units` lists them)."""
+        try:
+            registry(self.ingredient.shop_id).factor(self.unit, self.ingredient)
+        except UnitError as e:
+            return str(e)
+        return None
+
     @property
     def base_quantity(self):
-        return convert_to_base(self.quantity, self.unit, self.ingredient.base_unit)
+        """Quantity in the ingredient's base unit; None if the unit doesn't convert."""
+        try:
+            return registry(self.ingredient.shop_id).to_base(self.quantity, self.unit, self.ingredient)
+        except UnitError:
+            return None
 
     @property
     def line_cost(self):
-        return self.base_quantity * self.ingredient.cost_per_base_unit
+        base = self.base_quantity
+        return base * self.ingredient.cost_per_base_unit if base is not None else None
 
 
 class Product(db.Model):
     __tablename__ = "products"
+    __table_args__ = (
+        db.Index("ix_products_shop_name", "shop_id", "name"),
+        db.Index("ix_products_shop_updated", "shop_id", "updated_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
@@ -154,6 +195,7 @@ class Product(db.Model):
     vat_rate = db.Column(db.Float, default=20.0)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     product_recipes = db.relationship("ProductRecipe", back_populates="product", cascade="all, delete-orphan")
     sale_items = db.relationship("SaleItem", back_populates="product")
@@ -167,6 +209,11 @@ class Product(db.Model):
     def total_recipe_cost(self):
         return sum(pr.recipe.cost_per_unit * pr.quantity_needed for pr in self.product_recipes)
 
+    @property
+    def unit_errors(self):
+        """Recipe lines left out of total_recipe_cost, as 'Recipe: Ingredient: why'."""
+        return [f"{pr.recipe.name}: {e}" for pr in self.product_recipes for e in pr.recipe.unit_errors]
+
     @property
     def profit_margin(self):
         if self.selling_price > 0:
@@ -178,8 +225,8 @@ class ProductRecipe(db.Model):
     __tablename__ = "product_recipes"
 
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False, index=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.id"), nullable=False, index=True)
     quantity_needed = db.Column(db.Float, default=1.0)
 
     product = db.relationship("Product", back_populates="product_recipes")
@@ -188,22 +235,32 @@ class ProductRecipe(db.Model):
 
 class ProductionRun(db.Model):
     __tablename__ = "production_runs"
+    __table_args__ = (
+        db.Index("ix_production_runs_shop_created", "shop_id", "created_at"),
+        db.Index("ix_production_runs_shop_updated", "shop_id", "updated_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.id"), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.id"), nullable=False, index=True)
     quantity_produced = db.Column(db.Float, default=1.0)
     status = db.Column(db.String(20), default="planned")  # planned, completed
     produced_at = db.Column(db.DateTime, nullable=True)
     notes = db.Column(db.Text, default="")
     cost_total = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     recipe = db.relationship("Recipe", back_populates="production_runs")
 
 
 class Sale(db.Model):
     __tablename__ = "sales"
+    __table_args__ = (
+        db.Index("ix_sales_shop_date", "shop_id", "sale_date"),
+        db.Index("ix_sales_shop_created", "shop_id", "created_at"),
+        db.Index("ix_sales_shop_updated", "shop_id", "updated_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
@@ -214,6 +271,7 @@ class Sale(db.Model):
     customer_name = db.Column(db.String(100), default="")
     notes = db.Column(db.Text, default="")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     items = db.relationship("SaleItem", back_populates="sale", cascade="all, delete-orphan")
 
@@ -226,12 +284,15 @@ class SaleItem(db.Model):
     __tablename__ = "sale_items"
 
     id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey("sales.id"), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey("sales.id"), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False, index=True)
     quantity = db.Column(db.Float, default=1.0)
     unit_price = db.Column(db.Float, default=0.0)
     vat_rate = db.Column(db.Float, default=20.0)
     line_total = db.Column(db.Float, default=0.0)
+    # Recipe cost of one unit at checkout; NULL on lines sold before it was
+    # captured, until `flask backfill-sale-costs` fills them in
+    unit_cost = db.Column(db.Float, nullable=True)
 
     sale = db.relationship("Sale", back_populates="items")
     product = db.relationship("Product", back_populates="sale_items")
@@ -239,75 +300,122 @@ class SaleItem(db.Model):
 
 class WasteLog(db.Model):
     __tablename__ = "waste_logs"
+    __table_args__ = (
+        db.Index("ix_waste_logs_shop_logged", "shop_id", "logged_at"),
+        db.Index("ix_waste_logs_shop_updated", "shop_id", "updated_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
-    ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredients.id"), nullable=True)
-    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredients.id"), nullable=True, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=True, index=True)
     quantity = db.Column(db.Float, default=0.0)
     unit = db.Column(db.String(10), default="")
     cost_estimate = db.Column(db.Float, default=0.0)
     category = db.Column(db.String(30), default="other")  # expired, spoiled, failed_batch, unsold, other
     notes = db.Column(db.Text, default="")
+    stock_deducted = db.Column(db.Float, default=0.0)  # base units taken out of the ingredient's stock
     logged_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     ingredient = db.relationship("Ingredient", back_populates="waste_logs")
     product = db.relationship("Product", back_populates="waste_logs")
 
 
-# --- Unit conversion helpers ---
-
-CONVERSION_TO_BASE = {
-    "g": 1.0,
-    "kg": 1000.0,
-    "mL": 1.0,
-    "ml": 1.0,
-    "L": 1000.0,
-    "l": 1000.0,
-    "pcs": 1.0,
-    "dozen": 12.0,
-}
-
-UNIT_FAMILIES = {
-    "g": "mass",
-    "kg": "mass",
-    "mL": "volume",
-    "ml": "volume",
-    "L": "volume",
-    "l": "volume",
-    "pcs": "count",
-    "dozen": "count",
-}
-
-BASE_UNITS = {"mass": "g", "volume": "mL", "count": "pcs"}
-
-
-def convert_to_base(quantity, from_unit, base_unit):
-    """Convert a quantity from display unit to base unit."""
-    factor = CONVERSION_TO_BASE.get(from_unit, 1.0)
-    return quantity * factor
-
-
-def convert_from_base(quantity, base_unit):
-    """Convert from base unit to a readable display unit."""
-    if base_unit == "g" and quantity >= 1000:
-        return quantity / 1000, "kg"
-    if base_unit == "mL" and quantity >= 1000:
-        return quantity / 1000, "L"
-    return quantity, base_unit
-
-
-def format_quantity(quantity, base_unit):
-    """Format a base-unit quantity for display."""
-    val, unit = convert_from_base(quantity, base_unit)
-    if val == int(val):
-        return f"{int(val)} {unit}"
-    return f"{val:.2f} {unit}"
-
-
-def get_compatible_units(base_unit):
-    """Return list of units compatible with a base unit."""
-    family = UNIT_FAMILIES.get(base_unit, None)
-    if not family:
-        return [base_unit]
-    return [u for u, f in UNIT_FAMILIES.items() if f == family]
+class DeletedRecord(db.Model):
+    """Tombstone left behind when an exportable row is deleted, so incremental
+    exports can tell downstream consumers to drop it."""
+    __tablename__ = "deleted_records"
+    __table_args__ = (
+        db.Index("ix_deleted_records_shop_entity", "shop_id", "entity", "deleted_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
+    entity = db.Column(db.String(30), nullable=False)  # key in EXPORTABLE
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DataVersion(db.Model):
+    """Per-shop counter bumped by every write to an entity (see app/data_versions.py);
+    cached fragments are keyed on it."""
+    __tablename__ = "data_versions"
+
+    shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), primary_key=True)
+    entity = db.Column(db.String(30), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CustomUnit(db.Model):
+    """A shop's own unit, e.g. "sack" = 25000 g; with ingredient_id set it only
+    applies to that ingredient, e.g. "tray" = 30 pcs of eggs. See app/units.py."""
+    __tablename__ = "custom_units"
+    __table_args__ = (
+        db.Index("ix_custom_units_shop_name", "shop_id", "name"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredients.id"), nullable=True)
+    name = db.Column(db.String(30), nullable=False)
+    dimension = db.Column(db.String(10), nullable=False)  # mass, volume, count
+    factor = db.Column(db.Float, nullable=False)  # base units (g, mL, pcs) per one of this unit
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    ingredient = db.relationship("Ingredient", back_populates="custom_units")
+
+
+class IngredientPrice(db.Model):
+    """An ingredient's cost_per_base_unit from effective_at until the next row;
+    a row is only written when the price changes (see app/price_history.py)."""
+    __tablename__ = "ingredient_prices"
+    __table_args__ = (
+        db.Index("ix_ingredient_prices_shop_ingredient", "shop_id", "ingredient_id", "effective_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), nullable=False)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey("ingredients.id", ondelete="CASCADE"), nullable=False)
+    cost_per_base_unit = db.Column(db.Float, nullable=False)
+    effective_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class WasteRollup(db.Model):
+    """Waste cost per shop, week or month, category and ingredient or product,
+    kept up to date on every write (see app/rollups.py)."""
+    __tablename__ = "waste_rollups"
+
+    shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)  # week, month
+    period_start = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(30), primary_key=True)
+    # 0 rather than NULL so the columns can be part of the key
+    ingredient_id = db.Column(db.Integer, primary_key=True, default=0)
+    product_id = db.Column(db.Integer, primary_key=True, default=0)
+    entries = db.Column(db.Integer, nullable=False, default=0)
+    cost = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class ActivityRollup(db.Model):
+    """Completed production cost and net sales per shop, week or month; what
+    waste is measured against (see app/rollups.py)."""
+    __tablename__ = "activity_rollups"
+
+    shop_id = db.Column(db.Integer, db.ForeignKey("shops.id"), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    production_cost = db.Column(db.Float, nullable=False, default=0.0)
+    sales = db.Column(db.Float, nullable=False, default=0.0)  # excluding VAT
+
+
+# --- Eager-loading options for list views ---
+
+# Everything Recipe.total_cost walks, loaded in two queries for any number of recipes
+RECIPE_COSTING = db.selectinload(Recipe.ingredients).joinedload(RecipeIngredient.ingredient)
+# ...and Product.total_recipe_cost on top of that
+PRODUCT_COSTING = (
+    db.selectinload(Product.product_recipes).joinedload(ProductRecipe.recipe)
+    .selectinload(Recipe.ingredients).joinedload(RecipeIngredient.ingredient)
+)
+
@@ -0,0 +1,108 @@
+"""Connection pool setup from config, and live pool statistics."""
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+# Callables receiving each checkout wait in seconds (used by app.metrics)
+WAIT_OBSERVERS = []
+
+
+class PoolStats:
+    """Counters for connection checkouts. Wait time includes opening a new
+    connection when none is idle, which is where reconnect latency shows up."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_avg_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+class TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        waited = time.perf_counter() - start
+        self.stats.record_wait(waited)
+        for observe in WAIT_OBSERVERS:
+            observe(waited)
+        return conn
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+    pass
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_POOL_* settings."""
+    options = dict(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    if not config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql"):
+        return options
+
+    options["pool_pre_ping"] = config["DB_POOL_PRE_PING"]
+    # TCP keepalives so idle connections dropped by the server are noticed early
+    options["connect_args"] = {
+        "keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 3,
+        **options.get("connect_args", {}),
+    }
+    if config["DB_PGBOUNCER"]:
+        options["poolclass"] = TimedNullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+            pool_recycle=config["DB_POOL_RECYCLE"],
+        )
+    return options
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, TimedPoolMixin):
+        stats.update(pool.stats.snapshot())
+    return stats
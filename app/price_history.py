@@ -0,0 +1,124 @@
+"""Ingredient price history and "cost as of" lookups.
+
+Every change to an ingredient's cost_per_base_unit appends a row to
+`ingredient_prices`. A session listener records ORM writes. Bulk statements
+(the importer, the API) call `sync(shop_id)` afterwards, which records
+whatever differs from the latest row in one INSERT ... SELECT.
+
+For lookups, each worker keeps a shop's whole history in memory. Each
+ingredient gets two sorted arrays, one of timestamps and one of prices,
+and `cost_as_of` finds the price in force at a moment by binary search. The
+entry is keyed on the shop's "ingredients" data version, which every price
+change bumps. So the history is reloaded, in one query, only after a write.
+"""
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, time
+from flask import current_app
+from sqlalchemy import event, func, insert, inspect, literal, or_, select
+from sqlalchemy.orm import Session
+from . import data_versions
+from .extensions import db
+from .models import Ingredient, IngredientPrice
+
+EPOCH = datetime(1970, 1, 1)
+
+_cache = OrderedDict()  # shop id -> (ingredients version, PriceHistory), least recently used first
+_lock = threading.Lock()
+
+
+def _seconds(when):
+    if not isinstance(when, datetime):
+        # A whole day: the price at its close
+        when = datetime.combine(when, time.max)
+    return (when - EPOCH).total_seconds()
+
+
+class PriceHistory:
+    """One shop's prices: per ingredient, parallel sorted arrays of times and costs."""
+
+    def __init__(self, rows):
+        self._series = {}
+        for ingredient_id, effective_at, cost in rows:  # ordered by ingredient, then time
+            times, costs = self._series.setdefault(ingredient_id, (array("d"), array("d")))
+            times.append(_seconds(effective_at))
+            costs.append(cost)
+
+    def cost_as_of(self, ingredient_id, when, default=0.0):
+        """cost_per_base_unit in force at `when` (a datetime, or a date meaning its end)."""
+        series = self._series.get(ingredient_id)
+        if series is None:
+            return default
+        times, costs = series
+        # Before the first recorded price the earliest one is the best estimate
+        return costs[max(bisect_right(times, _seconds(when)) - 1, 0)]
+
+    def current(self, ingredient_id, default=0.0):
+        series = self._series.get(ingredient_id)
+        return series[1][-1] if series else default
+
+
+def history(shop_id):
+    """The shop's PriceHistory, from this worker's cache unless prices changed."""
+    version = data_versions.versions(shop_id).get("ingredients", 0)
+    with _lock:
+        entry = _cache.get(shop_id)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(shop_id)
+            return entry[1]
+
+    rows = db.session.execute(
+        select(IngredientPrice.ingredient_id, IngredientPrice.effective_at, IngredientPrice.cost_per_base_unit)
+        .where(IngredientPrice.shop_id == shop_id)
+        .order_by(IngredientPrice.ingredient_id, IngredientPrice.effective_at, IngredientPrice.id)
+    )
+    prices = PriceHistory(rows)
+    size = current_app.config["PRICE_HISTORY_CACHE_SIZE"]
+    if size:
+        with _lock:
+            _cache[shop_id] = (version, prices)
+            while len(_cache) > size:
+                _cache.popitem(last=False)
+    return prices
+
+
+def sync(shop_id):
+    """Record current prices that differ from the latest history row, after bulk writes."""
+    latest = (
+        select(IngredientPrice.cost_per_base_unit)
+        .where(IngredientPrice.ingredient_id == Ingredient.id)
+        .order_by(IngredientPrice.effective_at.desc(), IngredientPrice.id.desc())
+        .limit(1)
+        .correlate(Ingredient)
+        .scalar_subquery()
+    )
+    cost = func.coalesce(Ingredient.cost_per_base_unit, 0.0)
+    db.session.execute(insert(IngredientPrice).from_select(
+        ["shop_id", "ingredient_id", "cost_per_base_unit", "effective_at"],
+        select(Ingredient.shop_id, Ingredient.id, cost, literal(datetime.utcnow()))
+        .where(Ingredient.shop_id == shop_id, or_(latest.is_(None), latest != cost)),
+    ))
+
+
+def _after_flush(session, flush_context):
+    now = datetime.utcnow()
+    rows = []
+    for obj in (*session.new, *session.dirty):
+        if not isinstance(obj, Ingredient) or obj in session.deleted:
+            continue
+        cost = obj.cost_per_base_unit or 0.0
+        if obj not in session.new:
+            changed = session.is_modified(obj) and inspect(obj).attrs.cost_per_base_unit.history
+            if not changed or not changed.added or (changed.deleted and (changed.deleted[0] or 0.0) == cost):
+                continue
+        rows.append({"shop_id": obj.shop_id, "ingredient_id": obj.id,
+                     "cost_per_base_unit": cost, "effective_at": now})
+    if rows:
+        session.connection().execute(insert(IngredientPrice), rows)
+
+
+def init_app(app):
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
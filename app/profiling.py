@@ -0,0 +1,116 @@
+"""Per-request profiling: SQL statement count and time, template render time,
+and repeated-statement detection (N+1 queries).
+
+Enabled with PROFILING=1. When disabled no hooks are installed at all; when
+enabled, PROFILING_SAMPLE_RATE limits the share of requests that are
+measured. Results go out as a Server-Timing header (visible in the browser's
+network panel) and suspected N+1 patterns are logged as warnings.
+"""
+import random
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\((\s*(\?|%\(\w+\)s|:\w+)\s*,?)+\)")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """Collapse a statement so calls differing only in literals or IN-list length match."""
+    statement = _NUMBER.sub("?", statement)
+    statement = _PARAM_LIST.sub("(?)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+        self._sql_start = None
+        self._template_starts = []
+
+    def repeated(self, threshold):
+        """[(fingerprint, count)] for statements run at least `threshold` times."""
+        return [(fp, n) for fp, n in self.statements.most_common() if n >= threshold]
+
+    def server_timing(self):
+        total = (time.perf_counter() - self.start) * 1000
+        return (
+            f'sql;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries", '
+            f'tpl;dur={self.template_time * 1000:.1f};desc="templates", '
+            f'app;dur={total:.1f};desc="total"'
+        )
+
+
+def current_profile():
+    if has_request_context():
+        return g.get("profile")
+    return None
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    if profile is not None:
+        profile._sql_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    if profile is not None and profile._sql_start is not None:
+        profile.sql_time += time.perf_counter() - profile._sql_start
+        profile.sql_count += 1
+        profile.statements[fingerprint(statement)] += 1
+        profile._sql_start = None
+
+
+def _before_render(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None:
+        profile._template_starts.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None and profile._template_starts:
+        elapsed = time.perf_counter() - profile._template_starts.pop()
+        # Nested renders are already inside the outer one's time
+        if not profile._template_starts:
+            profile.template_time += elapsed
+
+
+def init_app(app):
+    if not app.config["PROFILING"]:
+        return
+    sample_rate = app.config["PROFILING_SAMPLE_RATE"]
+    threshold = app.config["PROFILING_N_PLUS_ONE"]
+
+    if not event.contains(Engine, "before_cursor_execute", _before_execute):
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_profile():
+        if sample_rate >= 1.0 or random.random() < sample_rate:
+            g.profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        response.headers["Server-Timing"] = profile.server_timing()
+        for statement, count in profile.repeated(threshold):
+            app.logger.warning(
+                "Possible N+1 on %s %s: %d x %s",
+                request.method, request.endpoint, count, statement[:300],
+            )
+        return response
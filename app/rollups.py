@@ -0,0 +1,159 @@
+"""Pre-aggregated rollups for waste analytics.
+
+Waste cost is summed per shop, week or month, category and ingredient or
+product in `waste_rollups`. The cost of completed production and net sales,
+which waste is measured against, are summed per shop and period in
+`activity_rollups`. A session listener applies each flush's changes to
+both tables as deltas, in the same transaction. Charts over years of logs
+then read a few hundred rollup rows instead of scanning the logs.
+
+Like data_versions, bulk statements bypass the listener. Pass rows bulk
+inserted that way to `add`, or call `rebuild(shop_id)` (or run
+`flask rebuild-rollups`) after larger rewrites.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event, inspect, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from .extensions import db
+from .models import ActivityRollup, ProductionRun, Sale, WasteLog, WasteRollup
+
+PERIODS = ("week", "month")
+
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def period_start(day, period):
+    """First day of the week (Monday) or month holding `day`."""
+    if isinstance(day, datetime):
+        day = day.date()
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+# Model -> (attributes read, function from their values to [(rollup, key, day, amounts)])
+
+def _waste(v):
+    key = {"category": v["category"] or "other",
+           "ingredient_id": v["ingredient_id"] or 0, "product_id": v["product_id"] or 0}
+    return [(WasteRollup, key, v["logged_at"], {"entries": 1, "cost": v["cost_estimate"] or 0.0})]
+
+
+def _production(v):
+    if v["status"] != "completed" or v["produced_at"] is None:
+        return []
+    return [(ActivityRollup, {}, v["produced_at"], {"production_cost": v["cost_total"] or 0.0})]
+
+
+def _sale(v):
+    net = (v["total_amount"] or 0.0) - (v["vat_amount"] or 0.0)
+    return [(ActivityRollup, {}, v["sale_date"], {"sales": net})]
+
+
+TRACKED = {
+    WasteLog: (("shop_id", "category", "ingredient_id", "product_id", "logged_at", "cost_estimate"), _waste),
+    ProductionRun: (("shop_id", "status", "produced_at", "cost_total"), _production),
+    Sale: (("shop_id", "sale_date", "total_amount", "vat_amount"), _sale),
+}
+
+
+def _values(obj, fields, before):
+    attrs = inspect(obj).attrs
+    values = {}
+    for name in fields:
+        history = attrs[name].history
+        values[name] = history.deleted[0] if before and history.deleted else getattr(obj, name)
+    return values
+
+
+def _collect(deltas, shop_id, contributions, sign):
+    for rollup, key, day, amounts in contributions:
+        if day is None:
+            continue
+        for period in PERIODS:
+            full_key = (rollup, shop_id, period, period_start(day, period), tuple(sorted(key.items())))
+            for column, amount in amounts.items():
+                deltas[full_key][column] += sign * amount
+
+
+def _apply(conn, deltas):
+    """Upsert the deltas, one executemany per rollup table and set of columns."""
+    insert_for = _UPSERTS[conn.dialect.name]
+    batches = defaultdict(list)
+    for (rollup, shop_id, period, start, key), amounts in sorted(deltas.items(), key=lambda d: repr(d[0])):
+        if any(amounts.values()):
+            batches[(rollup, tuple(sorted(amounts)))].append(
+                {"shop_id": shop_id, "period": period, "period_start": start, **dict(key), **amounts})
+    for (rollup, columns), rows in batches.items():
+        table = rollup.__table__
+        stmt = insert_for(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.name for c in table.primary_key.columns],
+            set_={column: table.c[column] + stmt.excluded[column] for column in columns},
+        )
+        conn.execute(stmt, rows)
+
+
+def _after_flush(session, flush_context):
+    deltas = defaultdict(lambda: defaultdict(float))
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tracked = TRACKED.get(type(obj))
+        if tracked is None:
+            continue
+        fields, contribute = tracked
+        if obj in session.new:
+            _collect(deltas, obj.shop_id, contribute(_values(obj, fields, False)), 1)
+        elif obj in session.deleted:
+            before = _values(obj, fields, True)
+            _collect(deltas, before["shop_id"], contribute(before), -1)
+        elif session.is_modified(obj):
+            before = _values(obj, fields, True)
+            _collect(deltas, before["shop_id"], contribute(before), -1)
+            _collect(deltas, obj.shop_id, contribute(_values(obj, fields, False)), 1)
+    if deltas:
+        _apply(session.connection(), deltas)
+
+
+def add(model, rows):
+    """Apply rows written with a bulk insert: dicts holding the tracked attributes."""
+    fields, contribute = TRACKED[model]
+    deltas = defaultdict(lambda: defaultdict(float))
+    for row in rows:
+        _collect(deltas, row["shop_id"], contribute(row), 1)
+    if deltas:
+        _apply(db.session.connection(), deltas)
+
+
+def rebuild(shop_id):
+    """Recompute a shop's rollups from the logs; commits with the session."""
+    for rollup in (WasteRollup, ActivityRollup):
+        db.session.execute(delete(rollup).where(rollup.shop_id == shop_id))
+    totals = defaultdict(lambda: defaultdict(float))
+    for model, (fields, contribute) in TRACKED.items():
+        rows = db.session.execute(
+            select(*(getattr(model, name) for name in fields)).where(model.shop_id == shop_id)
+            .execution_options(yield_per=1000))
+        for row in rows:
+            _collect(totals, shop_id, contribute(row._asdict()), 1)
+    for rollup in (WasteRollup, ActivityRollup):
+        zero = {c.name: 0 for c in rollup.__table__.columns if not c.primary_key}
+        rows = [{"shop_id": s, "period": p, "period_start": start, **dict(key), **zero, **amounts}
+                for (model, s, p, start, key), amounts in totals.items() if model is rollup]
+        if rows:
+            db.session.execute(insert(rollup), rows)
+
+
+def init_app(app):
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+
+    @app.cli.command("rebuild-rollups")
+    def rebuild_command():
+        """Recompute waste and activity rollups for every shop."""
+        from .models import Shop
+        for shop_id in db.session.scalars(select(Shop.id)).all():
+            rebuild(shop_id)
+        db.session.commit()
+        print("Rollups rebuilt.")
@@ -7,7 +7,11 @@ from .production import bp as production_bp
 from .sales import bp as sales_bp
 from .waste import bp as waste_bp
 from .exports import bp as exports_bp
+from .imports import bp as imports_bp
 from .settings import bp as settings_bp
+from .ops import bp as ops_bp
+from .reports import bp as reports_bp
+from .api import bp as api_bp
 
 ALL_BLUEPRINTS = [
     auth_bp,
@@ -19,5 +23,9 @@ ALL_BLUEPRINTS = [
     sales_bp,
     waste_bp,
     exports_bp,
+    imports_bp,
+    reports_bp,
     settings_bp,
+    ops_bp,
+    api_bp,
 ]
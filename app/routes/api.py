@@ -0,0 +1,557 @@
+"""JSON API for the mobile app and integrations, under /api/v1.
+
+Every resource supports:
+
+    GET    /api/v1/<resource>?fields=id,name&limit=100&cursor=...&<filters>
+    GET    /api/v1/<resource>/<id>?fields=...
+
+and ingredients and products also take bulk writes of up to MAX_BULK rows:
+
+    POST   /api/v1/<resource>   [{...}, ...]             create, returns the new ids
+    PATCH  /api/v1/<resource>   [{"id": 1, ...}, ...]    update the given fields
+    DELETE /api/v1/<resource>   {"ids": [1, 2]}
+
+Reads select only the requested columns; computed fields such as a recipe's
+cost are SQL expressions, so no ORM objects are built. Lists are ordered by id
+and paged with the opaque `next_cursor`. Quantities and costs are in base
+units (g, mL, pcs). A bulk write is validated as a whole: one bad row and
+nothing is written. Authentication is the web session; without one the API
+answers 401 rather than redirecting to the login page.
+"""
+import base64
+import math
+from datetime import date, datetime
+from types import SimpleNamespace
+from flask import Blueprint, jsonify, request
+from flask_login import current_user
+from sqlalchemy import case, func, insert, literal, select, update
+from app import data_versions, price_history
+from app.extensions import db
+from app.models import (
+    Ingredient, Recipe, RecipeIngredient, Product, ProductRecipe, ProductionRun,
+    Sale, SaleItem, WasteLog,
+)
+from app.units import BASE_UNITS, recipe_unit_errors, sql_factor
+from app.services.export import record_deletion
+from app.utils import query_budget
+
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_BULK = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+@bp.errorhandler(ApiError)
+def api_error(e):
+    body = {"error": str(e)}
+    if e.details:
+        body["details"] = e.details
+    return jsonify(body), e.status
+
+
+@bp.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        return jsonify({"error": "Authentication required"}), 401
+
+
+# --- Computed columns ---
+
+def _recipe_cost(recipe_id):
+    """Correlated subquery: Recipe.total_cost for the recipe with this id."""
+    return (
+        select(func.coalesce(func.sum(
+            RecipeIngredient.quantity * sql_factor(RecipeIngredient.unit, Ingredient)
+            * Ingredient.cost_per_base_unit), 0.0))
+        .join(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .where(RecipeIngredient.recipe_id == recipe_id)
+        .scalar_subquery()
+    )
+
+
+def _per_unit(total, yield_quantity):
+    return case((yield_quantity > 0, total / yield_quantity), else_=total)
+
+
+def _product_recipe_cost():
+    """Correlated subquery: Product.total_recipe_cost."""
+    per_unit = _per_unit(_recipe_cost(Recipe.id), Recipe.yield_quantity)
+    return (
+        select(func.coalesce(func.sum(per_unit * ProductRecipe.quantity_needed), 0.0))
+        .join(Recipe, Recipe.id == ProductRecipe.recipe_id)
+        .where(ProductRecipe.product_id == Product.id)
+        .scalar_subquery()
+    )
+
+
+def _name_of(model, fk):
+    return select(model.name).where(model.id == fk).scalar_subquery()
+
+
+# --- Field coercion for writes ---
+
+def _text(max_len):
+    def convert(value):
+        if not isinstance(value, str):
+            raise ValueError("must be a string")
+        value = value.strip()
+        if len(value) > max_len:
+            raise ValueError(f"must be at most {max_len} characters")
+        return value
+    return convert
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("must be a number")
+    try:
+        value = float(value)
+    except OverflowError:  # an integer literal too large for a float
+        raise ValueError("must be a finite number")
+    if not math.isfinite(value):
+        raise ValueError("must be a finite number")
+    if value < 0:
+        raise ValueError("must not be negative")
+    return value
+
+
+def _flag(value):
+    if not isinstance(value, bool):
+        raise ValueError("must be true or false")
+    return value
+
+
+def _iso_date(value):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError("must be a date (YYYY-MM-DD) or null")
+
+
+def _density(value):
+    if value is None:
+        return None
+    if _number(value) <= 0:
+        raise ValueError("must be greater than zero or null")
+    return float(value)
+
+
+def _base_unit(value):
+    if value not in BASE_UNITS.values():
+        raise ValueError(f"must be one of {', '.join(BASE_UNITS.values())}")
+    return value
+
+
+# --- Filters: query parameter -> (column, converter, comparison) ---
+
+def _param_date(value):
+    return date.fromisoformat(value)
+
+
+def _param_datetime(value):
+    return datetime.fromisoformat(value)
+
+
+def _param_bool(value):
+    if value.lower() not in ("true", "false", "1", "0"):
+        raise ValueError("must be true or false")
+    return value.lower() in ("true", "1")
+
+
+def _contains(col, value):
+    return col.ilike(f"%{value}%")
+
+
+def _eq(col, value):
+    return col == value
+
+
+def _gte(col, value):
+    return col >= value
+
+
+def _lte(col, value):
+    return col <= value
+
+
+def _updated_since(model):
+    return {"updated_since": (model.updated_at, _param_datetime, _gte)}
+
+
+RESOURCES = {
+    "ingredients": {
+        "model": Ingredient,
+        "fields": {
+            "id": Ingredient.id, "name": Ingredient.name, "category": Ingredient.category,
+            "base_unit": Ingredient.base_unit, "quantity_on_hand": Ingredient.quantity_on_hand,
+            "cost_per_base_unit": Ingredient.cost_per_base_unit,
+            "min_stock_level": Ingredient.min_stock_level, "expiry_date": Ingredient.expiry_date,
+            "density": Ingredient.density, "notes": Ingredient.notes,
+            "updated_at": Ingredient.updated_at,
+            "stock_value": Ingredient.quantity_on_hand * Ingredient.cost_per_base_unit,
+            "stock_status": case(
+                (Ingredient.quantity_on_hand <= 0, literal("out")),
+                (Ingredient.quantity_on_hand <= Ingredient.min_stock_level, literal("low")),
+                else_=literal("ok"),
+            ),
+        },
+        "filters": {
+            "q": (Ingredient.name, str, _contains),
+            "category": (Ingredient.category, str, _eq),
+            "base_unit": (Ingredient.base_unit, str, _eq),
+            **_updated_since(Ingredient),
+        },
+        "writable": {
+            "name": _text(100), "category": _text(50), "base_unit": _base_unit,
+            "quantity_on_hand": _number, "cost_per_base_unit": _number,
+            "min_stock_level": _number, "expiry_date": _iso_date, "density": _density,
+            "notes": _text(10_000),
+        },
+        "required": ("name", "base_unit"),
+    },
+    "recipes": {
+        "model": Recipe,
+        "fields": {
+            "id": Recipe.id, "name": Recipe.name, "description": Recipe.description,
+            "yield_quantity": Recipe.yield_quantity, "yield_unit": Recipe.yield_unit,
+            "estimated_time_minutes": Recipe.estimated_time_minutes, "is_active": Recipe.is_active,
+            "updated_at": Recipe.updated_at,
+            "total_cost": _recipe_cost(Recipe.id),
+            "cost_per_unit": _per_unit(_recipe_cost(Recipe.id), Recipe.yield_quantity),
+        },
+        "filters": {
+            "q": (Recipe.name, str, _contains),
+            "is_active": (Recipe.is_active, _param_bool, _eq),
+            **_updated_since(Recipe),
+        },
+    },
+    "products": {
+        "model": Product,
+        "fields": {
+            "id": Product.id, "name": Product.name, "category": Product.category,
+            "selling_price": Product.selling_price, "vat_rate": Product.vat_rate,
+            "is_active": Product.is_active, "updated_at": Product.updated_at,
+            "price_with_vat": Product.selling_price * (1 + Product.vat_rate / 100),
+            "recipe_cost": _product_recipe_cost(),
+        },
+        "filters": {
+            "q": (Product.name, str, _contains),
+            "category": (Product.category, str, _eq),
+            "is_active": (Product.is_active, _param_bool, _eq),
+            **_updated_since(Product),
+        },
+        "writable": {
+            "name": _text(100), "category": _text(50), "selling_price": _number,
+            "vat_rate": _number, "is_active": _flag,
+        },
+        "required": ("name", "selling_price"),
+    },
+    "sales": {
+        "model": Sale,
+        "fields": {
+            "id": Sale.id, "sale_date": Sale.sale_date, "total_amount": Sale.total_amount,
+            "vat_amount": Sale.vat_amount, "payment_method": Sale.payment_method,
+            "customer_name": Sale.customer_name, "notes": Sale.notes,
+            "created_at": Sale.created_at, "updated_at": Sale.updated_at,
+        },
+        # Loaded with one extra query for the whole page, only when asked for
+        "children": {
+            "items": (SaleItem.sale_id, {
+                "product_id": SaleItem.product_id, "quantity": SaleItem.quantity,
+                "unit_price": SaleItem.unit_price, "vat_rate": SaleItem.vat_rate,
+                "line_total": SaleItem.line_total, "unit_cost": SaleItem.unit_cost,
+            }),
+        },
+        "filters": {
+            "date_from": (Sale.sale_date, _param_date, _gte),
+            "date_to": (Sale.sale_date, _param_date, _lte),
+            "payment_method": (Sale.payment_method, str, _eq),
+            **_updated_since(Sale),
+        },
+    },
+    "production_runs": {
+        "model": ProductionRun,
+        "fields": {
+            "id": ProductionRun.id, "recipe_id": ProductionRun.recipe_id,
+            "recipe_name": _name_of(Recipe, ProductionRun.recipe_id),
+            "quantity_produced": ProductionRun.quantity_produced, "status": ProductionRun.status,
+            "produced_at": ProductionRun.produced_at, "cost_total": ProductionRun.cost_total,
+            "notes": ProductionRun.notes, "created_at": ProductionRun.created_at,
+            "updated_at": ProductionRun.updated_at,
+        },
+        "filters": {
+            "status": (ProductionRun.status, str, _eq),
+            "recipe_id": (ProductionRun.recipe_id, int, _eq),
+            "created_from": (ProductionRun.created_at, _param_datetime, _gte),
+            "created_to": (ProductionRun.created_at, _param_datetime, _lte),
+            **_updated_since(ProductionRun),
+        },
+    },
+    "waste": {
+        "model": WasteLog,
+        "fields": {
+            "id": WasteLog.id, "ingredient_id": WasteLog.ingredient_id,
+            "product_id": WasteLog.product_id, "quantity": WasteLog.quantity, "unit": WasteLog.unit,
+            "cost_estimate": WasteLog.cost_estimate, "category": WasteLog.category,
+            "notes": WasteLog.notes, "logged_at": WasteLog.logged_at, "updated_at": WasteLog.updated_at,
+        },
+        "filters": {
+            "category": (WasteLog.category, str, _eq),
+            "ingredient_id": (WasteLog.ingredient_id, int, _eq),
+            "product_id": (WasteLog.product_id, int, _eq),
+            "logged_from": (WasteLog.logged_at, _param_datetime, _gte),
+            "logged_to": (WasteLog.logged_at, _param_datetime, _lte),
+            **_updated_since(WasteLog),
+        },
+    },
+}
+
+WRITABLE = [name for name, spec in RESOURCES.items() if "writable" in spec]
+_resource = "any(" + ", ".join(RESOURCES) + "):resource"
+_writable = "any(" + ", ".join(WRITABLE) + "):resource"
+
+
+# --- Reads ---
+
+def _encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(token):
+    try:
+        return int(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        raise ApiError("Invalid cursor")
+
+
+def _selected_fields(spec):
+    """Requested field names, split into (columns, children)."""
+    available = {**spec["fields"], **spec.get("children", {})}
+    raw = request.args.get("fields", "").strip()
+    if not raw:
+        return list(spec["fields"]), []
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}",
+                       details={"available": sorted(available)})
+    columns = [name for name in names if name in spec["fields"]]
+    if "id" not in columns:
+        columns.insert(0, "id")  # cursors and children key on it
+    return columns, [name for name in names if name in spec.get("children", {})]
+
+
+def _filters(spec):
+    clauses = []
+    for param, (col, convert, compare) in spec["filters"].items():
+        value = request.args.get(param)
+        if value is None:
+            continue
+        try:
+            clauses.append(compare(col, convert(value)))
+        except ValueError as e:
+            raise ApiError(f"Invalid value for '{param}': {e}")
+    return clauses
+
+
+def _jsonable(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _select(spec, columns):
+    return select(*(spec["fields"][name].label(name) for name in columns))
+
+
+def _fetch(stmt):
+    return [{k: _jsonable(v) for k, v in row._mapping.items()} for row in db.session.execute(stmt)]
+
+
+def _attach_children(spec, rows, children):
+    ids = [row["id"] for row in rows]
+    for name in children:
+        fk, fields = spec["children"][name]
+        grouped = {}
+        if ids:
+            stmt = select(fk.label("_parent"), *(col.label(k) for k, col in fields.items())).where(fk.in_(ids))
+            for child in db.session.execute(stmt):
+                values = dict(child._mapping)
+                grouped.setdefault(values.pop("_parent"), []).append(
+                    {k: _jsonable(v) for k, v in values.items()})
+        for row in rows:
+            row[name] = grouped.get(row["id"], [])
+
+
+@bp.route(f"/<{_resource}>")
+@query_budget(3)
+def list_resource(resource):
+    spec = RESOURCES[resource]
+    model = spec["model"]
+    columns, children = _selected_fields(spec)
+    limit = request.args.get("limit", DEFAULT_LIMIT, type=int)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    where = [model.shop_id == current_user.shop_id, *_filters(spec)]
+    cursor = request.args.get("cursor")
+    if cursor:
+        where.append(model.id > _decode_cursor(cursor))
+    # One row past the page tells whether there is a next one
+    rows = _fetch(_select(spec, columns).where(*where).order_by(model.id).limit(limit + 1))
+    more = len(rows) > limit
+    rows = rows[:limit]
+    _attach_children(spec, rows, children)
+    return jsonify({
+        "data": rows,
+        "next_cursor": _encode_cursor(rows[-1]["id"]) if more else None,
+    })
+
+
+@bp.route(f"/<{_resource}>/<int:id>")
+@query_budget(3)
+def get_resource(resource, id):
+    spec = RESOURCES[resource]
+    model = spec["model"]
+    columns, children = _selected_fields(spec)
+    rows = _fetch(_select(spec, columns).where(model.shop_id == current_user.shop_id, model.id == id))
+    if not rows:
+        raise ApiError("Not found", 404)
+    _attach_children(spec, rows, children)
+    return jsonify(rows[0])
+
+
+# --- Bulk writes ---
+
+def _payload(key=None):
+    data = request.get_json(silent=True)
+    if key:
+        data = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(data, list) or not data:
+        raise ApiError(f"Expected a non-empty JSON list{f' in {key!r}' if key else ''}")
+    if len(data) > MAX_BULK:
+        raise ApiError(f"At most {MAX_BULK} rows per request")
+    return data
+
+
+def _validate(spec, items, creating):
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "must be an object"})
+            continue
+        row, problems = {}, []
+        if not creating:
+            if not isinstance(item.get("id"), int):
+                problems.append("id: required integer")
+            row["id"] = item.get("id")
+        for key, value in item.items():
+            if key == "id":
+                continue
+            convert = spec["writable"].get(key)
+            if convert is None:
+                problems.append(f"{key}: not writable")
+                continue
+            try:
+                row[key] = convert(value)
+            except ValueError as e:
+                problems.append(f"{key}: {e}")
+        if creating:
+            problems += [f"{key}: required" for key in spec["required"] if key not in item]
+        elif len(row) == 1:
+            problems.append("no fields to update")
+        if problems:
+            errors.append({"index": index, "error": "; ".join(problems)})
+        rows.append(row)
+    if errors:
+        raise ApiError("Validation failed; nothing was written", details=errors)
+    return rows
+
+
+def _owned_ids(model, ids):
+    """Fail unless every id belongs to the user's shop."""
+    found = set(db.session.scalars(
+        select(model.id).where(model.shop_id == current_user.shop_id, model.id.in_(ids))))
+    missing = sorted(set(ids) - found)
+    if missing:
+        raise ApiError("Not found", 404, details={"ids": missing})
+
+
+def _check_recipe_units(rows):
+    """Refuse base unit or density changes that would leave recipe lines unconvertible."""
+    indexes = {row["id"]: i for i, row in enumerate(rows) if "base_unit" in row or "density" in row}
+    if not indexes:
+        return
+    changed = {}
+    for current in db.session.execute(
+        select(Ingredient.id, Ingredient.name, Ingredient.base_unit, Ingredient.density)
+        .where(Ingredient.id.in_(list(indexes)))
+    ):
+        row = rows[indexes[current.id]]
+        changed[current.id] = SimpleNamespace(
+            id=current.id, name=row.get("name", current.name),
+            base_unit=row.get("base_unit", current.base_unit), density=row.get("density", current.density))
+    errors = recipe_unit_errors(current_user.shop_id, changed)
+    if errors:
+        raise ApiError("Validation failed; nothing was written", details=[
+            {"index": indexes[ingredient_id], "error": error} for ingredient_id, error in sorted(errors.items())])
+
+
+@bp.route(f"/<{_writable}>", methods=["POST"])
+@query_budget(4)
+def bulk_create(resource):
+    spec = RESOURCES[resource]
+    model = spec["model"]
+    rows = _validate(spec, _payload(), creating=True)
+    shop_id = current_user.shop_id
+    created = db.session.execute(
+        insert(model).returning(model.id), [{"shop_id": shop_id, **row} for row in rows]
+    ).scalars().all()
+    data_versions.bump(shop_id, resource)
+    if model is Ingredient:
+        price_history.sync(shop_id)
+    db.session.commit()
+    return jsonify({"created": len(created), "ids": created}), 201
+
+
+@bp.route(f"/<{_writable}>", methods=["PATCH"])
+@query_budget(5)
+def bulk_update(resource):
+    spec = RESOURCES[resource]
+    model = spec["model"]
+    rows = _validate(spec, _payload(), creating=False)
+    _owned_ids(model, [row["id"] for row in rows])
+    if model is Ingredient:
+        _check_recipe_units(rows)
+    db.session.execute(update(model), rows)
+    data_versions.bump(current_user.shop_id, resource)
+    if model is Ingredient:
+        price_history.sync(current_user.shop_id)
+    db.session.commit()
+    return jsonify({"updated": len(rows)})
+
+
+@bp.route(f"/<{_writable}>", methods=["DELETE"])
+@query_budget(14)
+def bulk_delete(resource):
+    model = RESOURCES[resource]["model"]
+    ids = _payload("ids")
+    if not all(isinstance(i, int) for i in ids):
+        raise ApiError("ids must be integers")
+    _owned_ids(model, ids)
+    # Through the ORM, so cascades, tombstones and version bumps all apply
+    for obj in db.session.scalars(select(model).where(model.id.in_(ids))):
+        record_deletion(obj)
+        db.session.delete(obj)
+    db.session.commit()
+    return jsonify({"deleted": len(ids)})
@@ -2,11 +2,13 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, current_user
 from app.extensions import db
 from app.models import User, Shop
+from app.utils import query_budget
 
 bp = Blueprint("auth", __name__)
 
 
 @bp.route("/landing")
+@query_budget(0)
 def landing():
     if current_user.is_authenticated:
         return redirect(url_for("dashboard.index"))
@@ -14,6 +16,7 @@ def landing():
 
 
 @bp.route("/login", methods=["GET", "POST"])
+@query_budget(2, ms=500)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("dashboard.index"))
@@ -34,6 +37,7 @@ def login():
 
 
 @bp.route("/register", methods=["GET", "POST"])
+@query_budget(5, ms=500)
 def register():
     if current_user.is_authenticated:
         return redirect(url_for("dashboard.index"))
@@ -92,6 +96,7 @@ def register():
 
 
 @bp.route("/logout")
+@query_budget(2)
 def logout():
     logout_user()
     return redirect(url_for("auth.landing"))
@@ -5,11 +5,13 @@ from sqlalchemy import func
 from app.extensions import db
 from app.models import Ingredient, Product, Sale, SaleItem, ProductionRun, WasteLog
 from app.services.inventory import get_low_stock_ingredients
+from app.utils import query_budget
 
 bp = Blueprint("dashboard", __name__)
 
 
 @bp.route("/")
+@query_budget(15)
 def index():
     if not current_user.is_authenticated:
         return redirect(url_for("auth.landing"))
@@ -33,29 +35,34 @@ def index():
     today_sales_count = Sale.query.filter_by(shop_id=sid, sale_date=today).count()
 
     # Today's production
+    today_start = datetime.combine(today, datetime.min.time())
     today_production = ProductionRun.query.filter(
         ProductionRun.shop_id == sid,
-        func.date(ProductionRun.created_at) == today,
+        ProductionRun.created_at >= today_start,
+        ProductionRun.created_at < today_start + timedelta(days=1),
     ).count()
 
     # Recent sales (last 5)
     recent_sales = Sale.query.filter_by(shop_id=sid).order_by(Sale.created_at.desc()).limit(5).all()
 
     # Recent production (last 5)
-    recent_production = ProductionRun.query.filter_by(shop_id=sid).order_by(
-        ProductionRun.created_at.desc()
-    ).limit(5).all()
+    recent_production = ProductionRun.query.options(db.joinedload(ProductionRun.recipe)).filter_by(
+        shop_id=sid
+    ).order_by(ProductionRun.created_at.desc()).limit(5).all()
 
     # Sales data for chart (last 7 days)
+    daily_totals = dict(
+        db.session.query(Sale.sale_date, func.sum(Sale.total_amount))
+        .filter(Sale.shop_id == sid, Sale.sale_date >= today - timedelta(days=6))
+        .group_by(Sale.sale_date)
+        .all()
+    )
     chart_labels = []
     chart_data = []
     for i in range(6, -1, -1):
         d = today - timedelta(days=i)
         chart_labels.append(d.strftime("%b %d"))
-        day_total = db.session.query(func.sum(Sale.total_amount)).filter(
-            Sale.shop_id == sid, Sale.sale_date == d
-        ).scalar() or 0
-        chart_data.append(round(day_total, 2))
+        chart_data.append(round(daily_totals.get(d) or 0, 2))
 
     # Top products (by quantity sold, last 30 days)
     thirty_days_ago = today - timedelta(days=30)
@@ -1,40 +1,53 @@
 from flask import Blueprint, render_template, request, Response
 from flask_login import login_required, current_user
-from app.services.export import export_csv, export_json, export_excel, EXPORTABLE
+from app.services.export import export_csv, export_json, export_excel, decode_cursor, EXPORTABLE
+from app.utils import query_budget
 
 bp = Blueprint("exports", __name__, url_prefix="/export")
 
 
 @bp.route("/", methods=["GET"])
+@query_budget(4)
 @login_required
 def index():
     return render_template("exports/export.html", entities=list(EXPORTABLE.keys()))
 
 
 @bp.route("/download", methods=["GET"])
+@query_budget(4, ms=500)
 @login_required
 def download():
     entity = request.args.get("entity", "")
     fmt = request.args.get("format", "csv")
+    # Incremental mode: `since` holds the X-Export-Cursor of the previous pull
+    # (empty for the first one). Without it the whole table is exported.
+    since = request.args.get("since")
+    limit = request.args.get("limit", type=int)
 
     if entity not in EXPORTABLE:
         return "Invalid entity", 400
+    if since is not None:
+        try:
+            decode_cursor(since)
+        except ValueError:
+            return "Invalid cursor", 400
 
     shop_id = current_user.shop_id
     filename = f"{entity}.{fmt}" if fmt != "excel" else f"{entity}.xlsx"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
 
     if fmt == "csv":
-        data = export_csv(entity, shop_id)
-        return Response(data, mimetype="text/csv",
-                        headers={"Content-Disposition": f"attachment; filename={filename}"})
+        data, cursor = export_csv(entity, shop_id, since, limit)
+        mimetype = "text/csv"
     elif fmt == "json":
-        data = export_json(entity, shop_id)
-        return Response(data, mimetype="application/json",
-                        headers={"Content-Disposition": f"attachment; filename={filename}"})
+        data, cursor = export_json(entity, shop_id, since, limit)
+        mimetype = "application/json"
     elif fmt == "excel":
-        data = export_excel(entity, shop_id)
-        return Response(data,
-                        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        headers={"Content-Disposition": f"attachment; filename={filename}"})
-
-    return "Invalid format", 400
+        data, cursor = export_excel(entity, shop_id, since, limit)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        return "Invalid format", 400
+
+    if cursor is not None:
+        headers["X-Export-Cursor"] = cursor
+    return Response(data, mimetype=mimetype, headers=headers)
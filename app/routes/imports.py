@@ -0,0 +1,45 @@
+from flask import Blueprint, render_template, request, flash
+from flask_login import login_required, current_user
+from app.services.importer import import_rows, read_rows, IMPORTABLE
+from app.utils import query_budget
+
+bp = Blueprint("imports", __name__, url_prefix="/import")
+
+# Largest error list shown back to the user
+MAX_ERRORS_SHOWN = 100
+
+
+@bp.route("/", methods=["GET", "POST"])
+@query_budget(8, ms=500)
+@login_required
+def index():
+    result = None
+    entity = request.form.get("entity", "ingredients")
+
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if entity not in IMPORTABLE:
+            flash("Invalid entity.", "error")
+        elif not upload or not upload.filename:
+            flash("Choose a CSV or Excel file to import.", "error")
+        elif not upload.filename.lower().endswith((".csv", ".xlsx", ".xlsm")):
+            flash("Only .csv and .xlsx files are supported.", "error")
+        else:
+            try:
+                rows = read_rows(upload.filename, upload.read())
+            except ValueError as e:
+                flash(f"Could not read file: {e}", "error")
+            else:
+                result = import_rows(entity, rows, current_user.shop_id,
+                                     dry_run=bool(request.form.get("dry_run")))
+                if result["errors"]:
+                    flash(f"{len(result['errors'])} row(s) have errors. Nothing was imported.", "error")
+                elif result["dry_run"]:
+                    flash("Dry run OK. No changes were saved.", "info")
+                else:
+                    flash(f"Imported {result['created']} new and updated {result['updated']} "
+                          f"{entity}.", "success")
+
+    return render_template("imports/import.html", importable=IMPORTABLE,
+                           sel_entity=entity, result=result,
+                           max_errors=MAX_ERRORS_SHOWN)
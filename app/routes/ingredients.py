@@ -1,9 +1,13 @@
 from datetime import date
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
+from app import fragments
 from app.extensions import db
-from app.models import Ingredient, CONVERSION_TO_BASE
-from app.utils import get_or_404
+from app.models import Ingredient, RecipeIngredient
+from app.units import BUILTIN_UNITS, UnitError, base_unit_for, registry
+from app.services.export import record_deletion
+from app.etags import conditional
+from app.utils import get_or_404, query_budget
 
 bp = Blueprint("ingredients", __name__, url_prefix="/ingredients")
 
@@ -12,12 +16,26 @@ CATEGORIES = ["Flour & Grains", "Dairy", "Sweeteners", "Nuts & Dried Fruits",
 
 
 @bp.route("/")
+@query_budget(5)
 @login_required
+@conditional("ingredients")
 def index():
     search = request.args.get("search", "").strip()
     category = request.args.get("category", "").strip()
     status = request.args.get("status", "").strip()
 
+    if request.headers.get("HX-Request"):
+        return fragments.cached(("ingredients",), lambda: render_template(
+            "ingredients/table_body.html",
+            ingredients=_filtered(search, category, status), today=date.today()))
+
+    return render_template("ingredients/list.html",
+                           ingredients=_filtered(search, category, status), categories=CATEGORIES,
+                           search=search, sel_category=category,
+                           sel_status=status, today=date.today())
+
+
+def _filtered(search, category, status):
     query = Ingredient.query.filter_by(shop_id=current_user.shop_id)
 
     if search:
@@ -34,19 +52,29 @@ def index():
     elif status == "ok":
         query = query.filter(Ingredient.quantity_on_hand > Ingredient.min_stock_level)
 
-    ingredients = query.order_by(Ingredient.name).all()
+    return query.order_by(Ingredient.name).all()
 
-    if request.headers.get("HX-Request"):
-        return render_template("ingredients/table_body.html",
-                               ingredients=ingredients, today=date.today())
 
-    return render_template("ingredients/list.html",
-                           ingredients=ingredients, categories=CATEGORIES,
-                           search=search, sel_category=category,
-                           sel_status=status, today=date.today())
+def _stock_unit(display_unit):
+    """(base unit, factor) for the unit stock and prices are entered in."""
+    return base_unit_for(display_unit), BUILTIN_UNITS[display_unit][1]
+
+
+def _density(value):
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        density = float(value)
+    except ValueError:
+        raise UnitError("Density must be a number (g per mL)")
+    if density <= 0:
+        raise UnitError("Density must be greater than zero")
+    return density
 
 
 @bp.route("/create", methods=["GET", "POST"])
+@query_budget(4)
 @login_required
 def create():
     if request.method == "POST":
@@ -55,10 +83,12 @@ def create():
         min_stock = float(request.form.get("min_stock_level", 0))
         cost_input = float(request.form.get("cost_per_unit", 0))
 
-        base_unit_map = {"g": "g", "kg": "g", "mL": "mL", "ml": "mL",
-                         "L": "mL", "l": "mL", "pcs": "pcs", "dozen": "pcs"}
-        base_unit = base_unit_map.get(display_unit, display_unit)
-        factor = CONVERSION_TO_BASE.get(display_unit, 1.0)
+        try:
+            base_unit, factor = _stock_unit(display_unit)
+            density = _density(request.form.get("density", ""))
+        except UnitError as e:
+            flash(str(e), "error")
+            return redirect(url_for("ingredients.create"))
 
         qty_base = qty * factor
         min_stock_base = min_stock * factor
@@ -74,6 +104,7 @@ def create():
             quantity_on_hand=qty_base,
             cost_per_base_unit=cost_per_base,
             min_stock_level=min_stock_base,
+            density=density,
             expiry_date=date.fromisoformat(expiry) if expiry else None,
             notes=request.form.get("notes", ""),
         )
@@ -87,6 +118,7 @@ def create():
 
 
 @bp.route("/<int:id>/edit", methods=["GET", "POST"])
+@query_budget(6)
 @login_required
 def edit(id):
     ingredient = get_or_404(Ingredient, id)
@@ -97,10 +129,12 @@ def edit(id):
         min_stock = float(request.form.get("min_stock_level", 0))
         cost_input = float(request.form.get("cost_per_unit", 0))
 
-        base_unit_map = {"g": "g", "kg": "g", "mL": "mL", "ml": "mL",
-                         "L": "mL", "l": "mL", "pcs": "pcs", "dozen": "pcs"}
-        base_unit = base_unit_map.get(display_unit, display_unit)
-        factor = CONVERSION_TO_BASE.get(display_unit, 1.0)
+        try:
+            base_unit, factor = _stock_unit(display_unit)
+            density = _density(request.form.get("density", ""))
+        except UnitError as e:
+            flash(str(e), "error")
+            return redirect(url_for("ingredients.edit", id=id))
 
         ingredient.name = request.form["name"].strip()
         ingredient.category = request.form.get("category", "")
@@ -108,10 +142,22 @@ def edit(id):
         ingredient.quantity_on_hand = qty * factor
         ingredient.cost_per_base_unit = cost_input / factor if factor else cost_input
         ingredient.min_stock_level = min_stock * factor
+        ingredient.density = density
         expiry = request.form.get("expiry_date", "").strip()
         ingredient.expiry_date = date.fromisoformat(expiry) if expiry else None
         ingredient.notes = request.form.get("notes", "")
 
+        # Recipe lines must still convert, e.g. cups of flour need its density
+        used = db.session.scalars(db.select(RecipeIngredient.unit).distinct()
+                                  .where(RecipeIngredient.ingredient_id == id))
+        try:
+            for unit in used:
+                registry(current_user.shop_id).factor(unit, ingredient)
+        except UnitError as e:
+            db.session.rollback()
+            flash(f"{e}; recipes use it in that unit.", "error")
+            return redirect(url_for("ingredients.edit", id=id))
+
         db.session.commit()
         flash(f"Ingredient '{ingredient.name}' updated!", "success")
         return redirect(url_for("ingredients.index"))
@@ -121,10 +167,12 @@ def edit(id):
 
 
 @bp.route("/<int:id>/delete", methods=["POST"])
+@query_budget(7)
 @login_required
 def delete(id):
     ingredient = get_or_404(Ingredient, id)
     name = ingredient.name
+    record_deletion(ingredient)
     db.session.delete(ingredient)
     db.session.commit()
     flash(f"Ingredient '{name}' deleted.", "warning")
@@ -0,0 +1,54 @@
+from functools import wraps
+from flask import Blueprint, Response, current_app, jsonify, request, abort
+from flask_login import current_user
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from app.extensions import db
+from app import metrics
+from app.pool import pool_stats
+from app.utils import query_budget
+
+bp = Blueprint("ops", __name__)
+
+
+def ops_required(view):
+    """Allow a matching OPS_TOKEN bearer token, or a logged-in shop owner."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        token = current_app.config["OPS_TOKEN"]
+        if token and request.headers.get("Authorization") == f"Bearer {token}":
+            return view(*args, **kwargs)
+        if current_user.is_authenticated and current_user.role == "owner":
+            return view(*args, **kwargs)
+        abort(403)
+    return wrapped
+
+
+@bp.route("/health/")
+@query_budget(2)
+def health():
+    """Liveness check for the load balancer."""
+    try:
+        db.session.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        return jsonify({"status": "error", "database": "unreachable"}), 503
+    return jsonify({"status": "ok"})
+
+
+@bp.route("/health/pool")
+@query_budget(2)
+@ops_required
+def pool():
+    """Live connection pool statistics for this worker, per database engine."""
+    return jsonify({
+        (bind or "default"): pool_stats(engine) for bind, engine in db.engines.items()
+    })
+
+
+@bp.route("/metrics")
+@query_budget(2)
+@ops_required
+def prometheus():
+    """Prometheus scrape endpoint, aggregated across gunicorn workers."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
@@ -1,28 +1,38 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
+from app import metrics
 from app.extensions import db
-from app.models import ProductionRun, Recipe
-from app.services.production import complete_production_run
+from app.models import ProductionRun, Recipe, RECIPE_COSTING
+from app.services.production import complete_production_run, production_sheet
 from app.services.inventory import check_recipe_stock
-from app.utils import get_or_404
+from app.services.export import record_deletion
+from app.units import format_quantity
+from app.utils import get_or_404, query_budget
 
 bp = Blueprint("production", __name__, url_prefix="/production")
 
 
 @bp.route("/")
+@query_budget(6)
 @login_required
 def index():
-    runs = ProductionRun.query.filter_by(shop_id=current_user.shop_id).order_by(ProductionRun.created_at.desc()).all()
+    runs = ProductionRun.query.options(db.joinedload(ProductionRun.recipe)).filter_by(
+        shop_id=current_user.shop_id).order_by(ProductionRun.created_at.desc()).all()
     return render_template("production/list.html", runs=runs)
 
 
 @bp.route("/create", methods=["GET", "POST"])
+@query_budget(8)
 @login_required
 def create():
     if request.method == "POST":
         recipe_id = int(request.form["recipe_id"])
         qty = float(request.form.get("quantity_produced", 1))
-        recipe = get_or_404(Recipe, recipe_id)
+        recipe = get_or_404(Recipe, recipe_id, RECIPE_COSTING)
+        if recipe.unit_errors:
+            # Its cost would leave those lines out; fix the recipe first
+            flash(f"Can't cost {recipe.name}: {'; '.join(recipe.unit_errors)}", "error")
+            return redirect(url_for("production.create"))
 
         multiplier = qty / recipe.yield_quantity if recipe.yield_quantity else qty
         cost = recipe.total_cost * multiplier
@@ -43,11 +53,39 @@ def create():
     return render_template("production/form.html", recipes=recipes)
 
 
+@bp.route("/sheet")
+@query_budget(6)
+@login_required
+def sheet():
+    """Pick list for a day's production: `qty_<recipe id>` per recipe, or
+    every planned run when none are given."""
+    recipes = Recipe.query.filter_by(shop_id=current_user.shop_id, is_active=True).order_by(Recipe.name).all()
+    quantities = {}
+    if any(key.startswith("qty_") for key in request.args):
+        for recipe in recipes:
+            qty = request.args.get(f"qty_{recipe.id}", type=float)
+            if qty and qty > 0:
+                quantities[recipe.id] = qty
+    else:
+        planned = db.session.execute(
+            db.select(ProductionRun.recipe_id, db.func.sum(ProductionRun.quantity_produced))
+            .where(ProductionRun.shop_id == current_user.shop_id, ProductionRun.status == "planned")
+            .group_by(ProductionRun.recipe_id)
+        )
+        quantities = dict(planned.all())
+    result = production_sheet(current_user.shop_id, quantities) if quantities else None
+    return render_template("production/sheet.html", recipes=recipes,
+                           quantities=quantities, sheet=result, format_quantity=format_quantity)
+
+
 @bp.route("/<int:id>/complete", methods=["POST"])
+@query_budget(7)
 @login_required
 def complete(id):
     get_or_404(ProductionRun, id)
-    result = complete_production_run(id)
+    with metrics.PRODUCTION_LATENCY.time():
+        result = complete_production_run(id)
+    metrics.PRODUCTION_COMPLETIONS.labels("ok" if result is True else "error").inc()
     if result is True:
         flash(f"Production run #{id} completed! Stock deducted.", "success")
     else:
@@ -56,12 +94,14 @@ def complete(id):
 
 
 @bp.route("/<int:id>/delete", methods=["POST"])
+@query_budget(6)
 @login_required
 def delete(id):
     run = get_or_404(ProductionRun, id)
     if run.status == "completed":
         flash("Cannot delete a completed production run.", "error")
         return redirect(url_for("production.index"))
+    record_deletion(run)
     db.session.delete(run)
     db.session.commit()
     flash("Production run deleted.", "warning")
@@ -69,10 +109,11 @@ def delete(id):
 
 
 @bp.route("/check_stock/<int:recipe_id>")
+@query_budget(7)
 @login_required
 def check_stock(recipe_id):
     """HTMX endpoint: check stock availability for a recipe."""
-    recipe = get_or_404(Recipe, recipe_id)
+    recipe = get_or_404(Recipe, recipe_id, RECIPE_COSTING)
 
     qty = float(request.args.get("qty", recipe.yield_quantity or 1))
     multiplier = qty / recipe.yield_quantity if recipe.yield_quantity else qty
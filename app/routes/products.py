@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
+from app import data_versions, fragments
 from app.extensions import db
-from app.models import Product, ProductRecipe, Recipe
-from app.utils import get_or_404
+from app.models import Product, ProductRecipe, Recipe, RECIPE_COSTING, PRODUCT_COSTING
+from app.services.export import record_deletion
+from app.etags import conditional
+from app.utils import get_or_404, query_budget
 
 bp = Blueprint("products", __name__, url_prefix="/products")
 
@@ -11,22 +14,29 @@ PRODUCT_CATEGORIES = ["Pastries", "Cakes", "Cookies", "Bread", "Viennoiserie",
 
 
 @bp.route("/")
+@query_budget(8)
 @login_required
+@conditional("products", "recipes", "ingredients")
 def index():
     search = request.args.get("search", "").strip()
-    query = Product.query.filter_by(shop_id=current_user.shop_id)
-    if search:
-        query = query.filter(Product.name.ilike(f"%{search}%"))
-    products = query.order_by(Product.name).all()
+
+    def products():
+        query = Product.query.options(PRODUCT_COSTING).filter_by(shop_id=current_user.shop_id)
+        if search:
+            query = query.filter(Product.name.ilike(f"%{search}%"))
+        return query.order_by(Product.name).all()
 
     if request.headers.get("HX-Request") and request.args.get("partial"):
-        return render_template("products/table_body.html", products=products)
+        # Costs come from recipes and their ingredients
+        return fragments.cached(("products", "recipes", "ingredients"), lambda: render_template(
+            "products/table_body.html", products=products()))
 
-    return render_template("products/list.html", products=products,
+    return render_template("products/list.html", products=products(),
                            categories=PRODUCT_CATEGORIES, search=search)
 
 
 @bp.route("/create", methods=["GET", "POST"])
+@query_budget(7)
 @login_required
 def create():
     if request.method == "POST":
@@ -55,12 +65,14 @@ def create():
         flash(f"Product '{product.name}' created!", "success")
         return redirect(url_for("products.index"))
 
-    recipes = Recipe.query.filter_by(shop_id=current_user.shop_id, is_active=True).order_by(Recipe.name).all()
+    recipes = Recipe.query.options(RECIPE_COSTING).filter_by(
+        shop_id=current_user.shop_id, is_active=True).order_by(Recipe.name).all()
     return render_template("products/form.html", product=None,
                            categories=PRODUCT_CATEGORIES, recipes=recipes)
 
 
 @bp.route("/<int:id>/edit", methods=["GET", "POST"])
+@query_budget(9)
 @login_required
 def edit(id):
     product = get_or_404(Product, id)
@@ -73,6 +85,7 @@ def edit(id):
 
         # Replace all linked recipes
         ProductRecipe.query.filter_by(product_id=product.id).delete()
+        data_versions.bump(current_user.shop_id, "products")
         recipe_ids = request.form.getlist("recipe_ids")
         recipe_qtys = request.form.getlist("recipe_qtys")
         for i, rid in enumerate(recipe_ids):
@@ -88,16 +101,19 @@ def edit(id):
         flash(f"Product '{product.name}' updated!", "success")
         return redirect(url_for("products.index"))
 
-    recipes = Recipe.query.filter_by(shop_id=current_user.shop_id, is_active=True).order_by(Recipe.name).all()
+    recipes = Recipe.query.options(RECIPE_COSTING).filter_by(
+        shop_id=current_user.shop_id, is_active=True).order_by(Recipe.name).all()
     return render_template("products/form.html", product=product,
                            categories=PRODUCT_CATEGORIES, recipes=recipes)
 
 
 @bp.route("/<int:id>/delete", methods=["POST"])
+@query_budget(9)
 @login_required
 def delete(id):
     product = get_or_404(Product, id)
     name = product.name
+    record_deletion(product)
     db.session.delete(product)
     db.session.commit()
     flash(f"Product '{name}' deleted.", "warning")
@@ -105,7 +121,9 @@ def delete(id):
 
 
 @bp.route("/search")
+@query_budget(5)
 @login_required
+@conditional("products")
 def search():
     """HTMX/JSON endpoint for product search (used in quick sale)."""
     q = request.args.get("q", "").strip()
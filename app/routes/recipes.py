@@ -1,31 +1,78 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
+from app import data_versions, fragments
 from app.extensions import db
-from app.models import Recipe, RecipeIngredient, Ingredient, get_compatible_units
-from app.utils import get_or_404
+from app.models import Recipe, RecipeIngredient, Ingredient, ProductRecipe, RECIPE_COSTING
+from app.units import UnitError, registry
+from app.services.export import record_deletion
+from app.etags import conditional
+from app.utils import get_or_404, query_budget
 
 bp = Blueprint("recipes", __name__, url_prefix="/recipes")
 
 
+def _lines(form):
+    """(ingredient id, quantity, unit) for each filled-in recipe line, checked
+    against the shop's units. Raises UnitError for a unit an ingredient can't use."""
+    rows = []
+    idx = 0
+    while f"ingredient_id_{idx}" in form:
+        ing_id = form.get(f"ingredient_id_{idx}")
+        qty = form.get(f"ingredient_qty_{idx}")
+        if ing_id and qty:
+            rows.append((int(ing_id), float(qty), form.get(f"ingredient_unit_{idx}") or "g"))
+        idx += 1
+    if not rows:
+        return rows
+    ingredients = {i.id: i for i in Ingredient.query.filter(
+        Ingredient.shop_id == current_user.shop_id,
+        Ingredient.id.in_({ing_id for ing_id, _, _ in rows}),
+    )}
+    units = registry(current_user.shop_id)
+    for ing_id, _, unit in rows:
+        if ing_id not in ingredients:
+            raise UnitError("Unknown ingredient")
+        units.factor(unit, ingredients[ing_id])
+    return rows
+
+
+def _form(recipe):
+    ingredients = Ingredient.query.filter_by(shop_id=current_user.shop_id).order_by(Ingredient.name).all()
+    units = registry(current_user.shop_id)
+    return render_template("recipes/form.html", recipe=recipe, ingredients=ingredients,
+                           units={i.id: units.compatible_units(i) for i in ingredients})
+
+
 @bp.route("/")
+@query_budget(6)
 @login_required
+@conditional("recipes", "ingredients")
 def index():
     search = request.args.get("search", "").strip()
-    query = Recipe.query.filter_by(shop_id=current_user.shop_id)
-    if search:
-        query = query.filter(Recipe.name.ilike(f"%{search}%"))
-    recipes = query.order_by(Recipe.name).all()
+
+    def recipes():
+        query = Recipe.query.options(RECIPE_COSTING).filter_by(shop_id=current_user.shop_id)
+        if search:
+            query = query.filter(Recipe.name.ilike(f"%{search}%"))
+        return query.order_by(Recipe.name).all()
 
     if request.headers.get("HX-Request") and request.args.get("partial"):
-        return render_template("recipes/table_body.html", recipes=recipes)
+        return fragments.cached(("recipes", "ingredients"), lambda: render_template(
+            "recipes/table_body.html", recipes=recipes()))
 
-    return render_template("recipes/list.html", recipes=recipes, search=search)
+    return render_template("recipes/list.html", recipes=recipes(), search=search)
 
 
 @bp.route("/create", methods=["GET", "POST"])
+@query_budget(12)
 @login_required
 def create():
     if request.method == "POST":
+        try:
+            lines = _lines(request.form)
+        except UnitError as e:
+            flash(str(e), "error")
+            return redirect(url_for("recipes.create"))
         recipe = Recipe(
             shop_id=current_user.shop_id,
             name=request.form["name"].strip(),
@@ -37,43 +84,39 @@ def create():
         db.session.add(recipe)
         db.session.flush()
 
-        idx = 0
-        while f"ingredient_id_{idx}" in request.form:
-            ing_id = request.form.get(f"ingredient_id_{idx}")
-            qty = request.form.get(f"ingredient_qty_{idx}")
-            unit = request.form.get(f"ingredient_unit_{idx}")
-            if ing_id and qty:
-                ri = RecipeIngredient(
-                    recipe_id=recipe.id,
-                    ingredient_id=int(ing_id),
-                    quantity=float(qty),
-                    unit=unit or "g",
-                )
-                db.session.add(ri)
-            idx += 1
+        for ing_id, qty, unit in lines:
+            db.session.add(RecipeIngredient(
+                recipe_id=recipe.id, ingredient_id=ing_id, quantity=qty, unit=unit))
 
         db.session.commit()
         flash(f"Recipe '{recipe.name}' created!", "success")
         return redirect(url_for("recipes.detail", id=recipe.id))
 
-    ingredients = Ingredient.query.filter_by(shop_id=current_user.shop_id).order_by(Ingredient.name).all()
-    return render_template("recipes/form.html", recipe=None, ingredients=ingredients)
+    return _form(None)
 
 
 @bp.route("/<int:id>")
+@query_budget(8)
 @login_required
 def detail(id):
-    recipe = get_or_404(Recipe, id)
+    recipe = get_or_404(Recipe, id, RECIPE_COSTING,
+                        db.selectinload(Recipe.product_recipes).joinedload(ProductRecipe.product))
     scale = float(request.args.get("scale", 1.0))
     return render_template("recipes/detail.html", recipe=recipe, scale=scale)
 
 
 @bp.route("/<int:id>/edit", methods=["GET", "POST"])
+@query_budget(14)
 @login_required
 def edit(id):
     recipe = get_or_404(Recipe, id)
 
     if request.method == "POST":
+        try:
+            lines = _lines(request.form)
+        except UnitError as e:
+            flash(str(e), "error")
+            return redirect(url_for("recipes.edit", id=id))
         recipe.name = request.form["name"].strip()
         recipe.description = request.form.get("description", "")
         recipe.yield_quantity = float(request.form.get("yield_quantity", 1))
@@ -81,35 +124,26 @@ def edit(id):
         recipe.estimated_time_minutes = int(request.form.get("estimated_time_minutes", 0))
 
         RecipeIngredient.query.filter_by(recipe_id=recipe.id).delete()
+        data_versions.bump(current_user.shop_id, "recipes")
 
-        idx = 0
-        while f"ingredient_id_{idx}" in request.form:
-            ing_id = request.form.get(f"ingredient_id_{idx}")
-            qty = request.form.get(f"ingredient_qty_{idx}")
-            unit = request.form.get(f"ingredient_unit_{idx}")
-            if ing_id and qty:
-                ri = RecipeIngredient(
-                    recipe_id=recipe.id,
-                    ingredient_id=int(ing_id),
-                    quantity=float(qty),
-                    unit=unit or "g",
-                )
-                db.session.add(ri)
-            idx += 1
+        for ing_id, qty, unit in lines:
+            db.session.add(RecipeIngredient(
+                recipe_id=recipe.id, ingredient_id=ing_id, quantity=qty, unit=unit))
 
         db.session.commit()
         flash(f"Recipe '{recipe.name}' updated!", "success")
         return redirect(url_for("recipes.detail", id=recipe.id))
 
-    ingredients = Ingredient.query.filter_by(shop_id=current_user.shop_id).order_by(Ingredient.name).all()
-    return render_template("recipes/form.html", recipe=recipe, ingredients=ingredients)
+    return _form(recipe)
 
 
 @bp.route("/<int:id>/delete", methods=["POST"])
+@query_budget(9)
 @login_required
 def delete(id):
     recipe = get_or_404(Recipe, id)
     name = recipe.name
+    record_deletion(recipe)
     db.session.delete(recipe)
     db.session.commit()
     flash(f"Recipe '{name}' deleted.", "warning")
@@ -117,7 +151,9 @@ def delete(id):
 
 
 @bp.route("/search_ingredients")
+@query_budget(5)
 @login_required
+@conditional("ingredients")
 def search_ingredients():
     """HTMX endpoint for ingredient search in recipe form."""
     q = request.args.get("q", "").strip()
@@ -130,9 +166,10 @@ def search_ingredients():
 
 
 @bp.route("/ingredient_units/<int:ingredient_id>")
+@query_budget(3)
 @login_required
+@conditional("ingredients")
 def ingredient_units(ingredient_id):
     """Return compatible units for an ingredient."""
     ingredient = get_or_404(Ingredient, ingredient_id)
-    units = get_compatible_units(ingredient.base_unit)
-    return jsonify(units)
+    return jsonify(registry(current_user.shop_id).compatible_units(ingredient))
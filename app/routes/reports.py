@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+from flask import Blueprint, render_template, request
+from flask_login import login_required, current_user
+from app.services.reports import (
+    PROFIT_GROUPINGS, gross_profit, ingredient_sensitivity, margin_report, simulate_prices,
+)
+from app.utils import query_budget
+
+bp = Blueprint("reports", __name__, url_prefix="/reports")
+
+
+def _date_range(default_days=30):
+    """(start, end) from ?start=&end=, defaulting to the last `default_days` days."""
+    today = date.today()
+    try:
+        end = date.fromisoformat(request.args.get("end", ""))
+    except ValueError:
+        end = today
+    try:
+        start = date.fromisoformat(request.args.get("start", ""))
+    except ValueError:
+        start = end - timedelta(days=default_days - 1)
+    return min(start, end), end
+
+
+@bp.route("/margins")
+@query_budget(7)
+@login_required
+def margins():
+    """Margins over a period, with each day's sales costed at that day's prices."""
+    start, end = _date_range()
+    report = margin_report(current_user.shop_id, start, end)
+    return render_template("reports/margins.html", report=report, start=start, end=end)
+
+
+@bp.route("/what-if")
+@query_budget(5)
+@login_required
+def what_if():
+    """Recipe and product margins under hypothetical ingredient price changes (?pct_<id>=30)."""
+    changes = {}
+    for key, value in request.args.items():
+        if not key.startswith("pct_") or not value.strip():
+            continue
+        try:
+            ingredient_id, pct = int(key[4:]), float(value)
+        except ValueError:
+            continue
+        if pct and pct > -100:
+            changes[ingredient_id] = pct
+    result = simulate_prices(current_user.shop_id, changes)
+    return render_template("reports/what_if.html", result=result, changes=changes)
+
+
+@bp.route("/sensitivity")
+@query_budget(5)
+@login_required
+def sensitivity():
+    """Ingredients ranked by how much a price rise would cost in margin, given recent sales."""
+    days = min(max(request.args.get("days", 30, type=int), 7), 365)
+    result = ingredient_sensitivity(current_user.shop_id, days)
+    return render_template("reports/sensitivity.html", result=result, days=days)
+
+
+@bp.route("/profit")
+@query_budget(4)
+@login_required
+def profit():
+    """Gross profit by day, product or category, from the costs captured at checkout."""
+    start, end = _date_range()
+    by = request.args.get("by", "day")
+    if by not in PROFIT_GROUPINGS:
+        by = "day"
+    report = gross_profit(current_user.shop_id, start, end, by)
+    return render_template("reports/profit.html", report=report, start=start, end=end, by=by,
+                           groupings=PROFIT_GROUPINGS)
@@ -1,18 +1,22 @@
 from datetime import date
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
+from app import cost_matrix, metrics
 from app.extensions import db
 from app.models import Sale, SaleItem, Product
-from app.utils import get_or_404
+from app.services.export import record_deletion
+from app.etags import conditional
+from app.utils import get_or_404, query_budget
 
 bp = Blueprint("sales", __name__, url_prefix="/sales")
 
 
 @bp.route("/")
+@query_budget(8, ms=500)
 @login_required
 def index():
     sale_date = request.args.get("date", "").strip()
-    query = Sale.query.filter_by(shop_id=current_user.shop_id)
+    query = Sale.query.options(db.selectinload(Sale.items)).filter_by(shop_id=current_user.shop_id)
     if sale_date:
         query = query.filter(Sale.sale_date == date.fromisoformat(sale_date))
     sales = query.order_by(Sale.created_at.desc()).all()
@@ -30,7 +34,9 @@ def index():
 
 
 @bp.route("/quick", methods=["GET"])
+@query_budget(5)
 @login_required
+@conditional("products", "ingredients")
 def quick_sale():
     """Quick sale page with Alpine.js cart."""
     products = Product.query.filter_by(shop_id=current_user.shop_id, is_active=True).order_by(Product.name).all()
@@ -38,11 +44,14 @@ def quick_sale():
 
 
 @bp.route("/checkout", methods=["POST"])
+@query_budget(11)
 @login_required
+@metrics.CHECKOUT_LATENCY.time()
 def checkout():
     """Process sale from quick sale form (JSON)."""
-    data = request.get_json()
-    if not data or not data.get("items"):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("items"), list) or not data["items"]:
+        metrics.CHECKOUTS.labels("empty").inc()
         return jsonify({"error": "No items in cart"}), 400
 
     sale = Sale(
@@ -55,13 +64,34 @@ def checkout():
 
     subtotal = 0
     vat_total = 0
+    # Cost of goods at today's prices, from the per-worker cost matrix; products
+    # whose recipe cost is incomplete are recorded uncosted rather than low
+    unit_costs = cost_matrix.get(current_user.shop_id).unit_costs()
 
+    cart = []
     for item_data in data["items"]:
-        product = db.session.get(Product, item_data["product_id"])
-        if not product or product.shop_id != current_user.shop_id:
+        try:
+            product_id = int(item_data["product_id"])
+            qty = float(item_data.get("quantity", 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            metrics.CHECKOUTS.labels("invalid").inc()
+            return jsonify({"error": "Invalid cart item"}), 400
+        if not qty > 0:
+            metrics.CHECKOUTS.labels("invalid").inc()
+            return jsonify({"error": "Quantities must be greater than zero"}), 400
+        cart.append((product_id, qty))
+
+    products = {p.id: p for p in Product.query.filter(
+        Product.shop_id == current_user.shop_id,
+        Product.id.in_([product_id for product_id, _ in cart]),
+    )}
+
+    uncosted = []
+    for product_id, qty in cart:
+        product = products.get(product_id)
+        if not product:
             continue
 
-        qty = float(item_data.get("quantity", 1))
         unit_price = product.selling_price
         vat_rate = product.vat_rate
         line_subtotal = unit_price * qty
@@ -74,7 +104,10 @@ def checkout():
             unit_price=unit_price,
             vat_rate=vat_rate,
             line_total=line_total,
+            unit_cost=unit_costs.get(product.id),
         )
+        if sale_item.unit_cost is None:
+            uncosted.append(product.name)
         sale.items.append(sale_item)
         subtotal += line_subtotal
         vat_total += line_vat
@@ -84,26 +117,32 @@ def checkout():
 
     db.session.add(sale)
     db.session.commit()
+    metrics.CHECKOUTS.labels("ok").inc()
+    metrics.SALES_AMOUNT.inc(sale.total_amount)
 
     return jsonify({
         "success": True,
         "sale_id": sale.id,
         "total": sale.total_amount,
         "vat": sale.vat_amount,
+        "uncosted": uncosted,
     })
 
 
 @bp.route("/<int:id>")
+@query_budget(6)
 @login_required
 def detail(id):
-    sale = get_or_404(Sale, id)
+    sale = get_or_404(Sale, id, db.selectinload(Sale.items).joinedload(SaleItem.product))
     return render_template("sales/detail.html", sale=sale)
 
 
 @bp.route("/<int:id>/delete", methods=["POST"])
+@query_budget(8)
 @login_required
 def delete(id):
     sale = get_or_404(Sale, id)
+    record_deletion(sale)
     db.session.delete(sale)
     db.session.commit()
     flash("Sale deleted.", "warning")
@@ -1,12 +1,17 @@
+import math
 from flask import Blueprint, render_template, request, redirect, url_for, flash, abort
 from flask_login import login_required, current_user
 from app.extensions import db
-from app.models import User, Shop
+from app.models import User, Shop, Ingredient, CustomUnit, RecipeIngredient
+from app import units as unit_registry
+from app.user_cache import invalidate_user, invalidate_shop
+from app.utils import query_budget
 
 bp = Blueprint("settings", __name__, url_prefix="/settings")
 
 
 @bp.route("/team")
+@query_budget(5)
 @login_required
 def team():
     members = User.query.filter_by(shop_id=current_user.shop_id).order_by(User.created_at).all()
@@ -14,6 +19,7 @@ def team():
 
 
 @bp.route("/team/regenerate-invite", methods=["POST"])
+@query_budget(4)
 @login_required
 def regenerate_invite():
     if current_user.role != "owner":
@@ -21,11 +27,13 @@ def regenerate_invite():
     shop = current_user.shop
     shop.invite_code = Shop.generate_invite_code()
     db.session.commit()
+    invalidate_shop(shop.id)
     flash("Invite code regenerated.", "success")
     return redirect(url_for("settings.team"))
 
 
 @bp.route("/team/remove/<int:id>", methods=["POST"])
+@query_budget(5)
 @login_required
 def remove_member(id):
     if current_user.role != "owner":
@@ -38,11 +46,13 @@ def remove_member(id):
     name = user.display_name
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(id)
     flash(f"Removed {name} from the team.", "warning")
     return redirect(url_for("settings.team"))
 
 
 @bp.route("/shop", methods=["GET", "POST"])
+@query_budget(4)
 @login_required
 def shop():
     if current_user.role != "owner":
@@ -54,7 +64,87 @@ def shop():
         s.currency = request.form.get("currency", s.currency).strip()
         s.default_vat_rate = float(request.form.get("default_vat_rate", s.default_vat_rate))
         db.session.commit()
+        invalidate_shop(s.id)
         flash("Shop settings updated.", "success")
         return redirect(url_for("settings.shop"))
 
     return render_template("settings/shop.html", shop=s)
+
+
+@bp.route("/units", methods=["GET", "POST"])
+@query_budget(8)
+@login_required
+def units():
+    """The shop's custom units: sacks, trays, a baker's own scoop."""
+    if request.method == "POST":
+        if current_user.role != "owner":
+            abort(403)
+        try:
+            unit = _custom_unit(request.form)
+        except unit_registry.UnitError as e:
+            flash(str(e), "error")
+            return redirect(url_for("settings.units"))
+        db.session.add(unit)
+        db.session.commit()
+        unit_registry.forget(current_user.shop_id)
+        flash(f"Unit '{unit.name}' added.", "success")
+        return redirect(url_for("settings.units"))
+
+    custom = CustomUnit.query.options(db.joinedload(CustomUnit.ingredient)).filter_by(
+        shop_id=current_user.shop_id).order_by(CustomUnit.name).all()
+    ingredients = Ingredient.query.filter_by(shop_id=current_user.shop_id).order_by(Ingredient.name).all()
+    return render_template("settings/units.html", units=custom, ingredients=ingredients,
+                           builtin=unit_registry.BUILTIN_UNITS,
+                           dimensions=unit_registry.BASE_UNITS)
+
+
+def _custom_unit(form):
+    name = form.get("name", "").strip()
+    if not name or len(name) > 30:
+        raise unit_registry.UnitError("Unit name must be 1-30 characters")
+    if name in unit_registry.BUILTIN_UNITS:
+        raise unit_registry.UnitError(f"'{name}' is a built-in unit")
+    dimension = form.get("dimension", "")
+    if dimension not in unit_registry.BASE_UNITS:
+        raise unit_registry.UnitError("Pick mass, volume or count")
+    try:
+        factor = float(form.get("factor", ""))
+    except ValueError:
+        factor = 0
+    if not (math.isfinite(factor) and factor > 0):
+        raise unit_registry.UnitError("Size must be a number greater than zero")
+
+    try:
+        ingredient_id = int(form["ingredient_id"]) if form.get("ingredient_id") else None
+    except ValueError:
+        raise unit_registry.UnitError("Unknown ingredient")
+    if ingredient_id and not Ingredient.query.filter_by(
+            id=ingredient_id, shop_id=current_user.shop_id).first():
+        raise unit_registry.UnitError("Unknown ingredient")
+    if CustomUnit.query.filter_by(shop_id=current_user.shop_id, name=name,
+                                  ingredient_id=ingredient_id).first():
+        raise unit_registry.UnitError(f"Unit '{name}' already exists")
+    return CustomUnit(shop_id=current_user.shop_id, ingredient_id=ingredient_id,
+                      name=name, dimension=dimension, factor=factor)
+
+
+@bp.route("/units/<int:id>/delete", methods=["POST"])
+@query_budget(5)
+@login_required
+def delete_unit(id):
+    if current_user.role != "owner":
+        abort(403)
+    unit = CustomUnit.query.filter_by(id=id, shop_id=current_user.shop_id).first_or_404()
+    name = unit.name
+    in_use = RecipeIngredient.query.join(Ingredient).filter(
+        Ingredient.shop_id == current_user.shop_id, RecipeIngredient.unit == name)
+    if unit.ingredient_id:
+        in_use = in_use.filter(Ingredient.id == unit.ingredient_id)
+    if in_use.first():
+        flash(f"Unit '{name}' is used in recipes; change those lines first.", "error")
+        return redirect(url_for("settings.units"))
+    db.session.delete(unit)
+    db.session.commit()
+    unit_registry.forget(current_user.shop_id)
+    flash(f"Unit '{name}' deleted.", "warning")
+    return redirect(url_for("settings.units"))
@@ -1,8 +1,13 @@
+import math
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from app.extensions import db
-from app.models import WasteLog, Ingredient, Product, convert_to_base
-from app.utils import get_or_404
+from app.models import WasteLog, Ingredient, Product, PRODUCT_COSTING
+from app.units import DISPLAY_UNITS
+from app.services.export import record_deletion
+from app.services.inventory import restock_ingredient
+from app.services.waste import GROUPINGS, record_product_waste, record_waste, waste_analytics
+from app.utils import get_or_404, query_budget
 
 bp = Blueprint("waste", __name__, url_prefix="/waste")
 
@@ -10,10 +15,13 @@ WASTE_CATEGORIES = ["expired", "spoiled", "failed_batch", "unsold", "other"]
 
 
 @bp.route("/")
+@query_budget(6)
 @login_required
 def index():
     category = request.args.get("category", "").strip()
-    query = WasteLog.query.filter_by(shop_id=current_user.shop_id)
+    query = WasteLog.query.options(
+        db.joinedload(WasteLog.ingredient), db.joinedload(WasteLog.product),
+    ).filter_by(shop_id=current_user.shop_id)
     if category:
         query = query.filter(WasteLog.category == category)
     logs = query.order_by(WasteLog.logged_at.desc()).all()
@@ -21,53 +29,112 @@ def index():
                            categories=WASTE_CATEGORIES, sel_category=category)
 
 
+@bp.route("/analytics")
+@query_budget(5)
+@login_required
+def analytics():
+    by = request.args.get("by", "category")
+    if by not in GROUPINGS:
+        by = "category"
+    period = "week" if request.args.get("period") == "week" else "month"
+    count = min(max(request.args.get("count", 12, type=int), 1), 104)
+    report = waste_analytics(current_user.shop_id, by, period, count)
+    return render_template("waste/analytics.html", report=report, by=by, period=period,
+                           count=count, groupings=GROUPINGS)
+
+
 @bp.route("/create", methods=["GET", "POST"])
+@query_budget(8)
 @login_required
 def create():
     if request.method == "POST":
         waste_type = request.form.get("waste_type", "ingredient")
-        ingredient_id = None
-        product_id = None
-        cost = float(request.form.get("cost_estimate", 0))
-
-        if waste_type == "ingredient":
-            ingredient_id = int(request.form["ingredient_id"]) if request.form.get("ingredient_id") else None
-            if ingredient_id and cost == 0:
-                ing = get_or_404(Ingredient, ingredient_id)
-                unit = request.form.get("unit", ing.base_unit)
-                qty = float(request.form.get("quantity", 0))
-                base_qty = convert_to_base(qty, unit, ing.base_unit)
-                cost = base_qty * ing.cost_per_base_unit
-        else:
-            product_id = int(request.form["product_id"]) if request.form.get("product_id") else None
+        ingredient = product = None
+        if waste_type == "ingredient" and request.form.get("ingredient_id"):
+            ingredient = get_or_404(Ingredient, int(request.form["ingredient_id"]))
+        elif waste_type != "ingredient" and request.form.get("product_id"):
+            product = get_or_404(Product, int(request.form["product_id"]), PRODUCT_COSTING)
 
-        log = WasteLog(
-            shop_id=current_user.shop_id,
-            ingredient_id=ingredient_id,
-            product_id=product_id,
-            quantity=float(request.form.get("quantity", 0)),
+        try:
+            quantity = float(request.form.get("quantity") or 0)
+            cost = float(request.form.get("cost_estimate") or 0)
+        except ValueError:
+            quantity = cost = -1
+        if not (math.isfinite(quantity) and math.isfinite(cost)) or not quantity > 0 or cost < 0:
+            # A negative quantity would put stock back and log negative waste cost
+            flash("Quantity must be greater than zero and cost can't be negative.", "error")
+            return redirect(url_for("waste.create"))
+
+        result = record_waste(
+            current_user.shop_id,
+            quantity=quantity,
             unit=request.form.get("unit", ""),
-            cost_estimate=cost,
             category=request.form.get("category", "other"),
             notes=request.form.get("notes", ""),
+            ingredient=ingredient,
+            product=product,
+            cost=cost,
         )
-        db.session.add(log)
+        if isinstance(result, str):
+            db.session.rollback()
+            flash(result, "error")
+            return redirect(url_for("waste.create"))
         db.session.commit()
-        flash("Waste entry logged.", "success")
+        flash("Waste entry logged." + (" Stock updated." if ingredient else ""), "success")
         return redirect(url_for("waste.index"))
 
     ingredients = Ingredient.query.filter_by(shop_id=current_user.shop_id).order_by(Ingredient.name).all()
     products = Product.query.filter_by(shop_id=current_user.shop_id).order_by(Product.name).all()
     return render_template("waste/form.html", waste=None,
                            ingredients=ingredients, products=products,
-                           categories=WASTE_CATEGORIES)
+                           categories=WASTE_CATEGORIES, units=DISPLAY_UNITS)
+
+
+@bp.route("/batch", methods=["GET", "POST"])
+@query_budget(10)
+@login_required
+def batch():
+    """End-of-day entry: every wasted product in one form and one commit."""
+    if request.method == "POST":
+        category = request.form.get("category", "unsold")
+        if category not in WASTE_CATEGORIES:
+            category = "other"
+        quantities = {}
+        for key, value in request.form.items():
+            if key.startswith("qty_") and value.strip():
+                try:
+                    product_id, qty = int(key[4:]), float(value)
+                except ValueError:
+                    continue
+                if math.isfinite(qty) and qty > 0:
+                    quantities[product_id] = qty
+
+        products = Product.query.options(PRODUCT_COSTING).filter(
+            Product.shop_id == current_user.shop_id, Product.id.in_(list(quantities)),
+        ).all() if quantities else []
+        total = record_product_waste(current_user.shop_id, products, quantities, category,
+                                     notes=request.form.get("notes", ""))
+        db.session.commit()
+        if products:
+            flash(f"Logged {len(products)} items as {category.replace('_', ' ')} "
+                  f"({total:.2f} in recipe cost).", "success")
+        else:
+            flash("Nothing to log.", "warning")
+        return redirect(url_for("waste.index"))
+
+    products = Product.query.filter_by(shop_id=current_user.shop_id, is_active=True).order_by(Product.name).all()
+    return render_template("waste/batch.html", products=products, categories=WASTE_CATEGORIES)
 
 
 @bp.route("/<int:id>/delete", methods=["POST"])
+@query_budget(6)
 @login_required
 def delete(id):
     log = get_or_404(WasteLog, id)
+    if log.ingredient_id and log.stock_deducted:
+        restock_ingredient(log.ingredient_id, log.stock_deducted)
+    record_deletion(log)
     db.session.delete(log)
     db.session.commit()
-    flash("Waste entry deleted.", "warning")
+    flash("Waste entry deleted." + (" Stock restored." if log.stock_deducted else ""), "warning")
     return redirect(url_for("waste.index"))
@@ -0,0 +1,68 @@
+"""Read-replica routing.
+
+When DATABASE_REPLICA_URL is configured, GET requests to read-only views
+read from the replica. Writes, and every request from a user who committed
+something in the last REPLICA_PIN_SECONDS, stay on the primary so users
+always see their own changes.
+"""
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = "replica"
+
+# Blueprints whose GET views only read
+REPLICA_BLUEPRINTS = {"dashboard", "exports"}
+
+# List views elsewhere that only read
+REPLICA_ENDPOINTS = {
+    "ingredients.index", "recipes.index", "products.index",
+    "production.index", "sales.index", "waste.index",
+    "api.list_resource", "api.get_resource",
+}
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica engine for requests marked by `init_app`."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and not isinstance(clause, UpdateBase)
+            and has_request_context()
+            and g.get("use_replica")
+        ):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        super().commit()
+        if has_request_context():
+            g.db_wrote = True
+
+
+def _wants_replica():
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if request.blueprint not in REPLICA_BLUEPRINTS and request.endpoint not in REPLICA_ENDPOINTS:
+        return False
+    return session.get("_primary_until", 0) < time.time()
+
+
+def init_app(app):
+    if REPLICA_BIND not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return
+    pin_seconds = app.config["REPLICA_PIN_SECONDS"]
+
+    @app.before_request
+    def route_reads():
+        g.use_replica = _wants_replica()
+
+    @app.after_request
+    def pin_to_primary(response):
+        # Read-your-writes: replica lag must not hide what this user just saved
+        if g.get("db_wrote"):
+            session["_primary_until"] = time.time() + pin_seconds
+        return response
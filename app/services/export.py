@@ -1,8 +1,18 @@
+import base64
 import csv
 import io
 import json
+from datetime import datetime, timedelta
 from openpyxl import Workbook
-from app.models import Ingredient, Recipe, Product, ProductionRun, Sale, SaleItem, WasteLog
+from sqlalchemy import and_, or_
+from app.extensions import db
+from app.models import (
+    Ingredient, Recipe, Product, ProductionRun, Sale, SaleItem, WasteLog, DeletedRecord,
+)
+
+# Rows touched within this window are held back from incremental pulls, so a
+# transaction that commits late with an older timestamp isn't skipped by a cursor.
+SETTLE_SECONDS = 5
 
 
 EXPORTABLE = {
@@ -38,6 +48,61 @@ EXPORTABLE = {
 }
 
 
+MODEL_ENTITIES = {info["model"]: entity for entity, info in EXPORTABLE.items()}
+
+
+def record_deletion(obj):
+    """Leave a tombstone for an exportable row that is about to be deleted."""
+    entity = MODEL_ENTITIES.get(type(obj))
+    if entity:
+        db.session.add(DeletedRecord(shop_id=obj.shop_id, entity=entity, entity_id=obj.id))
+
+
+def encode_cursor(cursor):
+    raw = json.dumps(cursor, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Parse a cursor from a previous incremental export. Empty means 'from the start'."""
+    if not token:
+        return {"ts": None, "id": 0, "dts": None, "did": 0}
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cursor = json.loads(raw)
+        for key in ("ts", "dts"):
+            if cursor.get(key) is not None:
+                datetime.fromisoformat(cursor[key])
+        return {
+            "ts": cursor.get("ts"),
+            "id": int(cursor.get("id", 0)),
+            "dts": cursor.get("dts"),
+            "did": int(cursor.get("did", 0)),
+        }
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Invalid cursor")
+
+
+def _after(ts_col, id_col, ts, last_id):
+    """Keyset predicate: strictly after (ts, last_id) in (ts_col, id_col) order."""
+    if ts is None:
+        return None
+    ts = datetime.fromisoformat(ts)
+    return or_(ts_col > ts, and_(ts_col == ts, id_col > last_id))
+
+
+def _serialize(item, columns):
+    row = {}
+    for col in columns:
+        val = getattr(item, col, "")
+        if val is None:
+            val = ""
+        elif hasattr(val, "isoformat"):
+            val = val.isoformat()
+        row[col] = val
+    return row
+
+
 def _get_rows(entity, shop_id):
     info = EXPORTABLE[entity]
     model = info["model"]
@@ -45,36 +110,87 @@ def _get_rows(entity, shop_id):
         items = model.query.filter_by(shop_id=shop_id).all()
     else:
         items = model.query.all()
+    rows = [_serialize(item, info["columns"]) for item in items]
+    return info["columns"], rows
+
+
+def _get_changes(entity, shop_id, since, limit=None):
+    """Rows changed and rows deleted after the `since` cursor, oldest first.
+
+    Returns (columns, rows, next_cursor). Deleted rows only carry their id and
+    `_deleted` = 1; upserted rows carry every column plus `updated_at`.
+    """
+    info = EXPORTABLE[entity]
+    model = info["model"]
+    cursor = decode_cursor(since)
+    horizon = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+
+    query = model.query.filter(model.shop_id == shop_id, model.updated_at <= horizon)
+    after = _after(model.updated_at, model.id, cursor["ts"], cursor["id"])
+    if after is not None:
+        query = query.filter(after)
+    query = query.order_by(model.updated_at, model.id)
+    if limit:
+        query = query.limit(limit)
+    items = query.all()
+
+    tomb_query = DeletedRecord.query.filter(
+        DeletedRecord.shop_id == shop_id,
+        DeletedRecord.entity == entity,
+        DeletedRecord.deleted_at <= horizon,
+    )
+    after = _after(DeletedRecord.deleted_at, DeletedRecord.id, cursor["dts"], cursor["did"])
+    if after is not None:
+        tomb_query = tomb_query.filter(after)
+    tomb_query = tomb_query.order_by(DeletedRecord.deleted_at, DeletedRecord.id)
+    if limit:
+        tomb_query = tomb_query.limit(limit)
+    tombstones = tomb_query.all()
+
+    columns = info["columns"] + ["updated_at", "_deleted"]
     rows = []
     for item in items:
-        row = {}
-        for col in info["columns"]:
-            val = getattr(item, col, "")
-            if val is None:
-                val = ""
-            elif hasattr(val, "isoformat"):
-                val = val.isoformat()
-            row[col] = val
+        row = _serialize(item, columns[:-1])
+        row["_deleted"] = 0
         rows.append(row)
-    return info["columns"], rows
+    for tomb in tombstones:
+        row = dict.fromkeys(columns, "")
+        row["id"] = tomb.entity_id
+        row["updated_at"] = tomb.deleted_at.isoformat()
+        row["_deleted"] = 1
+        rows.append(row)
+
+    if items:
+        cursor["ts"], cursor["id"] = items[-1].updated_at.isoformat(), items[-1].id
+    if tombstones:
+        cursor["dts"], cursor["did"] = tombstones[-1].deleted_at.isoformat(), tombstones[-1].id
+    return columns, rows, encode_cursor(cursor)
+
+
+def _rows_for(entity, shop_id, since, limit):
+    if since is None:
+        columns, rows = _get_rows(entity, shop_id)
+        return columns, rows, None
+    return _get_changes(entity, shop_id, since, limit)
 
 
-def export_csv(entity, shop_id):
-    columns, rows = _get_rows(entity, shop_id)
+def export_csv(entity, shop_id, since=None, limit=None):
+    """Returns (data, next_cursor). Pass `since` ("" for the first pull) for an incremental export."""
+    columns, rows, cursor = _rows_for(entity, shop_id, since, limit)
     output = io.StringIO()
     writer = csv.DictWriter(output, fieldnames=columns)
     writer.writeheader()
     writer.writerows(rows)
-    return output.getvalue()
+    return output.getvalue(), cursor
 
 
-def export_json(entity, shop_id):
-    _, rows = _get_rows(entity, shop_id)
-    return json.dumps(rows, indent=2, ensure_ascii=False)
+def export_json(entity, shop_id, since=None, limit=None):
+    _, rows, cursor = _rows_for(entity, shop_id, since, limit)
+    return json.dumps(rows, indent=2, ensure_ascii=False), cursor
 
 
-def export_excel(entity, shop_id):
-    columns, rows = _get_rows(entity, shop_id)
+def export_excel(entity, shop_id, since=None, limit=None):
+    columns, rows, cursor = _rows_for(entity, shop_id, since, limit)
     wb = Workbook()
     ws = wb.active
     ws.title = entity.replace("_", " ").title()
@@ -88,4 +204,4 @@ def export_excel(entity, shop_id):
     output = io.BytesIO()
     wb.save(output)
     output.seek(0)
-    return output.getvalue()
+    return output.getvalue(), cursor
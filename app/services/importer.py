@@ -0,0 +1,365 @@
+import csv
+import io
+import math
+from datetime import date, datetime
+from types import SimpleNamespace
+from zipfile import BadZipFile
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import insert, update, delete
+from app import data_versions, price_history
+from app.extensions import db
+from app.models import Ingredient, Recipe, RecipeIngredient, Product, ProductRecipe
+from app.units import BUILTIN_UNITS, UnitError, base_unit_for, recipe_unit_errors, registry
+
+# Rows per INSERT/UPDATE statement for bulk writes
+CHUNK_SIZE = 1000
+
+IMPORTABLE = {
+    "ingredients": {
+        "required": ["name", "unit"],
+        "optional": ["category", "quantity", "cost_per_unit", "min_stock", "expiry_date", "notes"],
+    },
+    "recipes": {
+        # One row per recipe line; recipe-level columns are read from the first row.
+        "required": ["recipe", "ingredient", "quantity", "unit"],
+        "optional": ["yield_quantity", "yield_unit", "description", "estimated_time_minutes"],
+    },
+    "products": {
+        # One row per product/recipe link; a product without recipes has an empty `recipe`.
+        "required": ["name", "selling_price"],
+        "optional": ["category", "vat_rate", "recipe", "recipe_qty"],
+    },
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(filename, data):
+    """Parse an uploaded CSV or XLSX file into a list of dicts keyed by lowercased header."""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        try:
+            wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        except (BadZipFile, InvalidFileException):
+            raise ValueError("not a valid Excel workbook")
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None) or []
+        keys = [str(h or "").strip().lower() for h in header]
+        result = []
+        for values in rows:
+            if not any(v not in (None, "") for v in values):
+                continue
+            result.append({k: v for k, v in zip(keys, values) if k})
+        wb.close()
+        return result
+
+    try:
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+        reader.fieldnames = [(f or "").strip().lower() for f in reader.fieldnames or []]
+        return [row for row in reader if any((v or "").strip() for v in row.values() if isinstance(v, str))]
+    except UnicodeDecodeError:
+        raise ValueError("not a UTF-8 CSV file")
+    except csv.Error as e:
+        raise ValueError(f"not a valid CSV file ({e})")
+
+
+def _text(row, key, default=""):
+    val = row.get(key)
+    if val is None:
+        return default
+    return str(val).strip() or default
+
+
+def _float(row, key, default=0.0):
+    val = row.get(key)
+    if val is None or (isinstance(val, str) and not val.strip()):
+        return default
+    try:
+        number = float(val)
+    except (TypeError, ValueError, OverflowError):
+        raise RowError(f"'{key}' must be a number, got '{val}'")
+    if not math.isfinite(number):
+        raise RowError(f"'{key}' must be a number, got '{val}'")
+    return number
+
+
+def _amount(row, key, default=0.0):
+    """A quantity, cost or price: a number that isn't negative."""
+    number = _float(row, key, default)
+    if number < 0:
+        raise RowError(f"'{key}' can't be negative, got '{row.get(key)}'")
+    return number
+
+
+def _date(row, key):
+    val = row.get(key)
+    if val is None or (isinstance(val, str) and not val.strip()):
+        return None
+    if isinstance(val, datetime):
+        return val.date()
+    if isinstance(val, date):
+        return val
+    try:
+        return date.fromisoformat(str(val).strip())
+    except ValueError:
+        raise RowError(f"'{key}' must be a date (YYYY-MM-DD), got '{val}'")
+
+
+def _unit(row, key):
+    unit = _text(row, key)
+    if unit not in BUILTIN_UNITS:
+        raise RowError(f"Unknown unit '{unit}' (use one of: {', '.join(BUILTIN_UNITS)})")
+    return unit
+
+
+def _chunks(items):
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+
+def _bulk_insert(model, rows, returning=None):
+    returned = []
+    for chunk in _chunks(rows):
+        stmt = insert(model)
+        if returning is not None:
+            returned.extend(db.session.execute(stmt.returning(*returning), chunk).all())
+        else:
+            db.session.execute(stmt, chunk)
+    return returned
+
+
+def _bulk_update(model, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(update(model), chunk)
+
+
+def _name_map(model, shop_id, *extra):
+    """Prefetch {lowercased name: row} for a shop in one query."""
+    rows = db.session.execute(
+        db.select(model.id, model.name, *extra).where(model.shop_id == shop_id)
+    ).all()
+    return {r.name.strip().lower(): r for r in rows}
+
+
+def _import_ingredients(rows, shop_id, errors):
+    existing = _name_map(Ingredient, shop_id, Ingredient.base_unit, Ingredient.density)
+    seen = set()
+    inserts, updates = [], []
+    for line, row in rows:
+        try:
+            name = _text(row, "name")
+            if not name:
+                raise RowError("'name' is required")
+            if name.lower() in seen:
+                raise RowError(f"Duplicate ingredient '{name}' in file")
+            seen.add(name.lower())
+
+            unit = _unit(row, "unit")
+            factor = BUILTIN_UNITS[unit][1]
+            values = {
+                "name": name,
+                "category": _text(row, "category"),
+                "base_unit": base_unit_for(unit),
+                "quantity_on_hand": _amount(row, "quantity") * factor,
+                "cost_per_base_unit": _amount(row, "cost_per_unit") / factor,
+                "min_stock_level": _amount(row, "min_stock") * factor,
+                "expiry_date": _date(row, "expiry_date"),
+                "notes": _text(row, "notes"),
+            }
+        except RowError as e:
+            errors.append((line, str(e)))
+            continue
+
+        match = existing.get(name.lower())
+        if match:
+            updates.append((line, {"id": match.id, **values}))
+        else:
+            inserts.append({"shop_id": shop_id, **values})
+
+    # A new base unit must still convert every recipe line using the ingredient
+    changed = {
+        row["id"]: SimpleNamespace(id=row["id"], name=row["name"], base_unit=row["base_unit"],
+                                   density=existing[row["name"].lower()].density)
+        for _, row in updates if row["base_unit"] != existing[row["name"].lower()].base_unit
+    }
+    unit_errors = recipe_unit_errors(shop_id, changed)
+    errors.extend((line, unit_errors[row["id"]]) for line, row in updates if row["id"] in unit_errors)
+    updates = [row for _, row in updates if row["id"] not in unit_errors]
+
+    def write():
+        _bulk_insert(Ingredient, inserts)
+        _bulk_update(Ingredient, updates)
+
+    return inserts, updates, write
+
+
+def _import_recipes(rows, shop_id, errors):
+    ingredients = _name_map(Ingredient, shop_id, Ingredient.base_unit, Ingredient.density)
+    units = registry(shop_id)
+    existing = _name_map(Recipe, shop_id)
+    recipes = {}  # lowercased name -> {"values": ..., "lines": [...]}
+    for line, row in rows:
+        try:
+            name = _text(row, "recipe")
+            if not name:
+                raise RowError("'recipe' is required")
+            ing_name = _text(row, "ingredient")
+            ing = ingredients.get(ing_name.lower())
+            if not ing:
+                raise RowError(f"Unknown ingredient '{ing_name}'")
+            # Recipe lines may also use the shop's custom units
+            unit = _text(row, "unit")
+            try:
+                units.factor(unit, ing)
+            except UnitError as e:
+                raise RowError(str(e))
+            qty = _float(row, "quantity")
+            if qty <= 0:
+                raise RowError("'quantity' must be greater than 0")
+
+            entry = recipes.get(name.lower())
+            if entry is None:
+                entry = recipes[name.lower()] = {
+                    "values": {
+                        "name": name,
+                        "description": _text(row, "description"),
+                        "yield_quantity": _float(row, "yield_quantity", 1.0),
+                        "yield_unit": _text(row, "yield_unit", "pcs"),
+                        "estimated_time_minutes": int(_float(row, "estimated_time_minutes", 0)),
+                    },
+                    "lines": [],
+                }
+            entry["lines"].append({"ingredient_id": ing.id, "quantity": qty, "unit": unit})
+        except RowError as e:
+            errors.append((line, str(e)))
+
+    inserts, updates = [], []
+    for key, entry in recipes.items():
+        match = existing.get(key)
+        if match:
+            updates.append({"id": match.id, **entry["values"]})
+        else:
+            inserts.append({"shop_id": shop_id, **entry["values"]})
+
+    def write():
+        _bulk_update(Recipe, updates)
+        ids = {key: existing[key].id for key in recipes if key in existing}
+        if ids:
+            db.session.execute(delete(RecipeIngredient).where(RecipeIngredient.recipe_id.in_(ids.values())))
+        for r in _bulk_insert(Recipe, inserts, returning=(Recipe.id, Recipe.name)):
+            ids[r.name.strip().lower()] = r.id
+        lines = [
+            {"recipe_id": ids[key], **ln}
+            for key, entry in recipes.items()
+            for ln in entry["lines"]
+        ]
+        _bulk_insert(RecipeIngredient, lines)
+
+    return inserts, updates, write
+
+
+def _import_products(rows, shop_id, errors):
+    recipe_map = _name_map(Recipe, shop_id)
+    existing = _name_map(Product, shop_id)
+    products = {}
+    for line, row in rows:
+        try:
+            name = _text(row, "name")
+            if not name:
+                raise RowError("'name' is required")
+            recipe_name = _text(row, "recipe")
+            recipe = None
+            if recipe_name:
+                recipe = recipe_map.get(recipe_name.lower())
+                if not recipe:
+                    raise RowError(f"Unknown recipe '{recipe_name}'")
+
+            entry = products.get(name.lower())
+            if entry is None:
+                entry = products[name.lower()] = {
+                    "values": {
+                        "name": name,
+                        "category": _text(row, "category"),
+                        "selling_price": _amount(row, "selling_price"),
+                        "vat_rate": _amount(row, "vat_rate", 20.0),
+                    },
+                    "recipes": {},
+                }
+            if recipe:
+                if recipe.id in entry["recipes"]:
+                    raise RowError(f"Recipe '{recipe.name}' listed twice for '{name}'")
+                entry["recipes"][recipe.id] = _amount(row, "recipe_qty", 1.0)
+        except RowError as e:
+            errors.append((line, str(e)))
+
+    inserts, updates = [], []
+    for key, entry in products.items():
+        match = existing.get(key)
+        if match:
+            updates.append({"id": match.id, **entry["values"]})
+        else:
+            inserts.append({"shop_id": shop_id, **entry["values"]})
+
+    def write():
+        _bulk_update(Product, updates)
+        ids = {key: existing[key].id for key in products if key in existing}
+        if ids:
+            db.session.execute(delete(ProductRecipe).where(ProductRecipe.product_id.in_(ids.values())))
+        for r in _bulk_insert(Product, inserts, returning=(Product.id, Product.name)):
+            ids[r.name.strip().lower()] = r.id
+        links = [
+            {"product_id": ids[key], "recipe_id": rid, "quantity_needed": qty}
+            for key, entry in products.items()
+            for rid, qty in entry["recipes"].items()
+        ]
+        _bulk_insert(ProductRecipe, links)
+
+    return inserts, updates, write
+
+
+IMPORTERS = {
+    "ingredients": _import_ingredients,
+    "recipes": _import_recipes,
+    "products": _import_products,
+}
+
+
+def import_rows(entity, rows, shop_id, dry_run=False):
+    """Validate and bulk-import parsed rows for a shop.
+
+    Nothing is written if any row fails validation or `dry_run` is set.
+    Returns a dict with created/updated counts and a list of (line, message) errors.
+    """
+    spec = IMPORTABLE[entity]
+    result = {"entity": entity, "rows": len(rows), "created": 0, "updated": 0,
+              "errors": [], "dry_run": dry_run}
+    if not rows:
+        result["errors"].append((0, "File has no data rows"))
+        return result
+
+    missing = [c for c in spec["required"] if c not in rows[0]]
+    if missing:
+        result["errors"].append((1, f"Missing column(s): {', '.join(missing)}"))
+        return result
+
+    # Line numbers as the user sees them in the file (header is line 1)
+    numbered = list(enumerate(rows, start=2))
+    inserts, updates, write = IMPORTERS[entity](numbered, shop_id, result["errors"])
+    result["created"], result["updated"] = len(inserts), len(updates)
+
+    if result["errors"] or dry_run:
+        db.session.rollback()
+        return result
+
+    try:
+        write()
+        data_versions.bump(shop_id, entity)
+        if entity == "ingredients":
+            price_history.sync(shop_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
@@ -1,5 +1,6 @@
 from app.extensions import db
-from app.models import Ingredient, convert_to_base
+from app.models import Ingredient
+from app.units import UnitError, registry
 
 
 def deduct_ingredient(ingredient_id, quantity, unit):
@@ -8,7 +9,10 @@ def deduct_ingredient(ingredient_id, quantity, unit):
     if not ingredient:
         return f"Ingredient #{ingredient_id} not found"
 
-    base_qty = convert_to_base(quantity, unit, ingredient.base_unit)
+    try:
+        base_qty = registry(ingredient.shop_id).to_base(quantity, unit, ingredient)
+    except UnitError as e:
+        return str(e)
     if ingredient.quantity_on_hand < base_qty:
         return (
             f"Insufficient stock for {ingredient.name}: "
@@ -20,12 +24,24 @@ def deduct_ingredient(ingredient_id, quantity, unit):
     return True
 
 
+def restock_ingredient(ingredient_id, base_quantity):
+    """Put base units back into stock, e.g. when a waste entry is deleted."""
+    ingredient = db.session.get(Ingredient, ingredient_id)
+    if ingredient:
+        ingredient.quantity_on_hand += base_quantity
+
+
 def check_recipe_stock(recipe, multiplier=1.0):
     """Check if all ingredients are available for a recipe * multiplier.
     Returns list of shortage dicts or empty list if OK."""
     shortages = []
+    units = registry(recipe.shop_id)
     for ri in recipe.ingredients:
-        needed = convert_to_base(ri.quantity * multiplier, ri.unit, ri.ingredient.base_unit)
+        try:
+            needed = units.to_base(ri.quantity * multiplier, ri.unit, ri.ingredient)
+        except UnitError as e:
+            shortages.append({"ingredient": ri.ingredient.name, "error": str(e)})
+            continue
         available = ri.ingredient.quantity_on_hand
         if available < needed:
             shortages.append({
@@ -1,6 +1,8 @@
+from collections import defaultdict
 from datetime import datetime
 from app.extensions import db
-from app.models import ProductionRun, convert_to_base
+from app.models import ProductionRun, Recipe, RecipeIngredient, Ingredient, RECIPE_COSTING
+from app.units import UnitError, registry
 from app.services.inventory import deduct_ingredient, check_recipe_stock
 
 
@@ -13,13 +15,15 @@ def complete_production_run(run_id):
     if run.status == "completed":
         return "Production run already completed"
 
-    recipe = run.recipe
+    # Lines and their ingredients in two queries instead of one per line
+    recipe = db.session.get(Recipe, run.recipe_id, options=[RECIPE_COSTING])
     multiplier = run.quantity_produced / recipe.yield_quantity if recipe.yield_quantity else run.quantity_produced
 
     # Check stock first
     shortages = check_recipe_stock(recipe, multiplier)
     if shortages:
-        msgs = [f"{s['ingredient']}: need {s['needed']:.1f} {s['unit']}, have {s['available']:.1f}" for s in shortages]
+        msgs = [s.get("error") or f"{s['ingredient']}: need {s['needed']:.1f} {s['unit']}, have {s['available']:.1f}"
+                for s in shortages]
         return "Insufficient stock:\n" + "\n".join(msgs)
 
     # Deduct all ingredients
@@ -34,13 +38,75 @@ def complete_production_run(run_id):
             return result
 
     # Calculate cost
-    cost = 0.0
-    for ri in recipe.ingredients:
-        base_qty = convert_to_base(ri.quantity * multiplier, ri.unit, ri.ingredient.base_unit)
-        cost += base_qty * ri.ingredient.cost_per_base_unit
+    lines = recipe.ingredients
+    base_qtys = registry(recipe.shop_id).to_base_column(
+        [ri.quantity * multiplier for ri in lines], [ri.unit for ri in lines], [ri.ingredient for ri in lines])
+    cost = sum(qty * ri.ingredient.cost_per_base_unit for qty, ri in zip(base_qtys, lines))
 
     run.status = "completed"
     run.cost_total = cost
     run.produced_at = datetime.utcnow()
     db.session.commit()
     return True
+
+
+def production_sheet(shop_id, quantities):
+    """Scale several recipes at once and merge what they need into a pick list.
+
+    `quantities` maps recipe id -> quantity to produce. Every line of every
+    recipe comes back in one query; requirements are summed per ingredient in
+    base units and grouped by ingredient category. Lines whose unit can't be
+    converted are listed under "problems" instead of being guessed.
+    """
+    rows = db.session.execute(
+        db.select(
+            Recipe.id.label("recipe_id"), Recipe.name.label("recipe_name"),
+            Recipe.yield_quantity, Recipe.yield_unit,
+            RecipeIngredient.quantity, RecipeIngredient.unit,
+            Ingredient.id, Ingredient.name, Ingredient.category, Ingredient.base_unit,
+            Ingredient.density, Ingredient.quantity_on_hand, Ingredient.cost_per_base_unit,
+        )
+        .outerjoin(RecipeIngredient, RecipeIngredient.recipe_id == Recipe.id)
+        .outerjoin(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .where(Recipe.shop_id == shop_id, Recipe.id.in_(list(quantities)))
+        .order_by(Recipe.name)
+    ).all()
+
+    units = registry(shop_id)
+    recipes, items, problems = {}, {}, []
+    for row in rows:
+        qty = quantities[row.recipe_id]
+        multiplier = qty / row.yield_quantity if row.yield_quantity else qty
+        recipe = recipes.setdefault(row.recipe_id, {
+            "name": row.recipe_name, "quantity": qty, "unit": row.yield_unit,
+            "batches": multiplier, "cost": 0.0,
+        })
+        if row.id is None:
+            continue
+        try:
+            needed = units.to_base(row.quantity * multiplier, row.unit, row)
+        except UnitError as e:
+            problems.append(f"{row.recipe_name}: {e}")
+            continue
+        item = items.setdefault(row.id, {
+            "ingredient": row.name, "category": row.category or "Uncategorized",
+            "unit": row.base_unit, "needed": 0.0, "available": row.quantity_on_hand or 0.0,
+            "cost": 0.0, "recipes": [],
+        })
+        cost = needed * (row.cost_per_base_unit or 0.0)
+        item["needed"] += needed
+        item["cost"] += cost
+        if row.recipe_name not in item["recipes"]:
+            item["recipes"].append(row.recipe_name)
+        recipe["cost"] += cost
+
+    categories = defaultdict(list)
+    for item in sorted(items.values(), key=lambda i: i["ingredient"].lower()):
+        item["short"] = max(item["needed"] - item["available"], 0.0)
+        categories[item["category"]].append(item)
+    return {
+        "recipes": list(recipes.values()),
+        "categories": sorted(categories.items()),
+        "total_cost": sum(r["cost"] for r in recipes.values()),
+        "problems": problems,
+    }
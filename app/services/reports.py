@@ -0,0 +1,269 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from app import cost_matrix, price_history
+from app.extensions import db
+from app.models import Ingredient, Product, ProductRecipe, Recipe, RecipeIngredient, Sale, SaleItem
+from app.units import UnitError, format_quantity, registry
+
+
+def product_usage(shop_id, product_ids=None):
+    """Base units of each ingredient in one unit of each product, from one query
+    over the product -> recipe -> ingredient explosion.
+
+    Returns ({product id: {ingredient id: base quantity}}, [problems]); lines
+    whose unit can't be converted are left out and reported.
+    """
+    query = (
+        db.select(
+            ProductRecipe.product_id, ProductRecipe.quantity_needed, Recipe.name.label("recipe"),
+            Recipe.yield_quantity, RecipeIngredient.quantity, RecipeIngredient.unit,
+            Ingredient.id, Ingredient.name, Ingredient.base_unit, Ingredient.density,
+        )
+        .join(Recipe, Recipe.id == ProductRecipe.recipe_id)
+        .join(RecipeIngredient, RecipeIngredient.recipe_id == Recipe.id)
+        .join(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .where(Recipe.shop_id == shop_id)
+    )
+    if product_ids is not None:
+        query = query.where(ProductRecipe.product_id.in_(list(product_ids)))
+
+    units = registry(shop_id)
+    usage = defaultdict(lambda: defaultdict(float))
+    problems = []
+    for row in db.session.execute(query):
+        try:
+            base = units.to_base(row.quantity, row.unit, row)
+        except UnitError as e:
+            problems.append(f"{row.recipe}: {e}")
+            continue
+        per_batch = row.yield_quantity if row.yield_quantity and row.yield_quantity > 0 else 1
+        usage[row.product_id][row.id] += base / per_batch * (row.quantity_needed or 0)
+    return usage, problems
+
+
+def margin_report(shop_id, start, end):
+    """Revenue, cost and margin per product for sales between two dates.
+
+    Each day's sales are costed at the ingredient prices of that day, looked
+    up in the cached price history, and compared with today's prices.
+    """
+    sales = db.session.execute(
+        db.select(
+            SaleItem.product_id, Product.name, Product.category, Sale.sale_date,
+            db.func.sum(SaleItem.quantity), db.func.sum(SaleItem.quantity * SaleItem.unit_price),
+        )
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .join(Product, Product.id == SaleItem.product_id)
+        .where(Sale.shop_id == shop_id, Sale.sale_date >= start, Sale.sale_date <= end)
+        .group_by(SaleItem.product_id, Product.name, Product.category, Sale.sale_date)
+    ).all()
+    usage, problems = product_usage(shop_id, {row[0] for row in sales}) if sales else ({}, [])
+    prices = price_history.history(shop_id)
+
+    products = {}
+    for product_id, name, category, day, qty, revenue in sales:
+        recipe = usage.get(product_id, {})
+        unit_cost = sum(q * prices.cost_as_of(ing, day) for ing, q in recipe.items())
+        item = products.get(product_id)
+        if item is None:
+            item = products[product_id] = {
+                "name": name, "category": category or "", "quantity": 0.0, "revenue": 0.0, "cost": 0.0,
+                "unit_cost_now": sum(q * prices.current(ing) for ing, q in recipe.items()),
+            }
+        item["quantity"] += qty or 0.0
+        item["revenue"] += revenue or 0.0
+        item["cost"] += unit_cost * (qty or 0.0)
+
+    for item in products.values():
+        item["cost_now"] = item["unit_cost_now"] * item["quantity"]
+        item["margin"] = item["revenue"] - item["cost"]
+        item["margin_pct"] = item["margin"] / item["revenue"] * 100 if item["revenue"] else None
+    revenue = sum(i["revenue"] for i in products.values())
+    cost = sum(i["cost"] for i in products.values())
+    return {
+        "products": sorted(products.values(), key=lambda i: -i["revenue"]),
+        "revenue": revenue,
+        "cost": cost,
+        "cost_now": sum(i["cost_now"] for i in products.values()),
+        "margin": revenue - cost,
+        "margin_pct": (revenue - cost) / revenue * 100 if revenue else None,
+        "problems": problems,
+    }
+
+
+def _margin(price, cost):
+    return (price - cost) / price * 100 if price > 0 else 0.0
+
+
+def simulate_prices(shop_id, changes):
+    """Recipe and product costs and margins if ingredients cost something else.
+
+    `changes` maps ingredient ids to a price change in percent (+30 for butter
+    up 30%). Costs come from the cached cost matrix and nothing is written. Active products
+    whose cost moves come first, the largest margin change leading.
+    """
+    matrix = cost_matrix.get(shop_id)
+    prices = matrix.prices_with({
+        ingredient_id: matrix.prices[matrix.column[ingredient_id]] * (1 + pct / 100)
+        for ingredient_id, pct in changes.items() if ingredient_id in matrix.column
+    })
+
+    products = []
+    for product, cost, new_cost in zip(matrix.products, matrix.product_costs, matrix.product_rows.dot(prices)):
+        if not product["is_active"]:
+            continue
+        price = product["selling_price"]
+        margin, new_margin = _margin(price, cost), _margin(price, new_cost)
+        products.append({**product, "cost": cost, "new_cost": new_cost, "cost_delta": new_cost - cost,
+                         "margin": margin, "new_margin": new_margin, "margin_delta": new_margin - margin})
+    products.sort(key=lambda p: (abs(p["cost_delta"]) <= 1e-9, -abs(p["margin_delta"]), p["name"]))
+
+    recipes = []
+    for recipe, cost, new_cost in zip(matrix.recipes, matrix.recipe_costs, matrix.recipe_rows.dot(prices)):
+        if abs(new_cost - cost) > 1e-9:
+            recipes.append({**recipe, "cost": cost, "new_cost": new_cost,
+                            "delta_pct": (new_cost - cost) / cost * 100 if cost else None})
+    recipes.sort(key=lambda r: -abs(r["new_cost"] - r["cost"]))
+
+    return {
+        "ingredients": [{**ing, "cost": matrix.prices[col], "new_cost": prices[col]}
+                        for col, ing in enumerate(matrix.ingredients)],
+        "products": products,
+        "affected": sum(1 for p in products if abs(p["cost_delta"]) > 1e-9),
+        "recipes": recipes,
+        "problems": matrix.problems,
+    }
+
+
+def _sensitivity(shop_id, matrix, start, end):
+    volumes = dict(db.session.execute(
+        db.select(SaleItem.product_id, db.func.sum(SaleItem.quantity))
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .where(Sale.shop_id == shop_id, Sale.sale_date >= start, Sale.sale_date <= end)
+        .group_by(SaleItem.product_id)
+    ).all())
+    sold = [volumes.get(p["id"]) or 0.0 for p in matrix.products]
+    units = sum(sold)
+    # Per product: units sold, and units sold / total units / price, which turns
+    # a cost change per unit into its volume-weighted share of margin points
+    per_price = [qty / units / p["selling_price"] * 100 if units and p["selling_price"] > 0 else 0.0
+                 for qty, p in zip(sold, matrix.products)]
+    used, points = matrix.product_rows.tdot(len(matrix.ingredients), sold, per_price)
+
+    revenue = sum(qty * p["selling_price"] for qty, p in zip(sold, matrix.products))
+    cost = sum(qty * c for qty, c in zip(sold, matrix.product_costs))
+    ingredients = []
+    for col, ing in enumerate(matrix.ingredients):
+        spend = used[col] * matrix.prices[col]
+        if not spend:
+            continue
+        ingredients.append({
+            **ing, "cost": matrix.prices[col], "used": format_quantity(used[col], ing["base_unit"]), "spend": spend,
+            "share": spend / cost * 100 if cost else 0.0,
+            "per_pct": spend / 100,  # margin lost over the window per +1% price
+            "points_per_pct": points[col] * matrix.prices[col] / 100,
+        })
+    ingredients.sort(key=lambda i: -i["spend"])
+    return {"ingredients": ingredients, "units": units, "revenue": revenue, "cost": cost,
+            "start": start, "end": end, "problems": matrix.problems}
+
+
+def ingredient_sensitivity(shop_id, days=30):
+    """How exposed margins are to each ingredient's price.
+
+    For every ingredient: the margin lost over the last `days` full days' sales
+    for each +1% on its price, and the resulting change in the sales-weighted
+    average product margin, in points. Computed in one pass over the cost
+    matrix weighted by units sold per product, and kept with the matrix until
+    prices, recipes or products change (the window ends yesterday, so today's
+    sales don't move it).
+    """
+    matrix = cost_matrix.get(shop_id)
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    return matrix.memo(("sensitivity", start, end), lambda: _sensitivity(shop_id, matrix, start, end))
+
+
+PROFIT_GROUPINGS = ("day", "product", "category")
+
+
+def gross_profit(shop_id, start, end, by="day"):
+    """Revenue, cost of goods and gross profit per day, product or category.
+
+    One aggregate over the sale lines, using the unit cost each line captured
+    at checkout. Lines sold before costs were captured count in `uncosted`
+    and add no cost.
+    """
+    if by == "product":
+        keys = (SaleItem.product_id, Product.name)
+    elif by == "category":
+        keys = (db.func.coalesce(Product.category, ""),)
+    else:
+        keys = (Sale.sale_date,)
+    revenue = db.func.sum(SaleItem.quantity * SaleItem.unit_price)
+    query = (
+        db.select(
+            *keys,
+            db.func.sum(SaleItem.quantity).label("quantity"),
+            revenue.label("revenue"),
+            db.func.sum(SaleItem.quantity * SaleItem.unit_cost).label("cost"),
+            db.func.sum(db.case((SaleItem.unit_cost.is_(None), 1), else_=0)).label("uncosted"),
+        )
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .where(Sale.shop_id == shop_id, Sale.sale_date >= start, Sale.sale_date <= end)
+        .group_by(*keys)
+        .order_by(Sale.sale_date if by == "day" else revenue.desc())
+    )
+    if by != "day":
+        query = query.join(Product, Product.id == SaleItem.product_id)
+
+    rows = []
+    for row in db.session.execute(query):
+        revenue, cost = row.revenue or 0.0, row.cost or 0.0
+        label = row[1] if by == "product" else row[0]
+        rows.append({
+            "label": label if label != "" else "Uncategorized", "quantity": row.quantity or 0.0,
+            "revenue": revenue, "cost": cost, "profit": revenue - cost,
+            "margin_pct": (revenue - cost) / revenue * 100 if revenue else None, "uncosted": row.uncosted,
+        })
+    revenue = sum(r["revenue"] for r in rows)
+    cost = sum(r["cost"] for r in rows)
+    return {
+        "rows": rows,
+        "revenue": revenue,
+        "cost": cost,
+        "profit": revenue - cost,
+        "margin_pct": (revenue - cost) / revenue * 100 if revenue else None,
+        "uncosted": sum(r["uncosted"] for r in rows),
+    }
+
+
+def backfill_unit_costs(shop_id):
+    """Fill in unit_cost on sale lines that predate its capture (no commit).
+
+    Each line is costed from today's recipes at the ingredient prices of its
+    sale date, like margin_report. Products whose recipes have a line that
+    doesn't convert stay uncosted. Returns the number of lines updated.
+    """
+    lines = db.session.execute(
+        db.select(SaleItem.id, SaleItem.product_id, Sale.sale_date)
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .where(Sale.shop_id == shop_id, SaleItem.unit_cost.is_(None))
+    ).all()
+    if lines:
+        incomplete = cost_matrix.get(shop_id).incomplete_products
+        lines = [line for line in lines if line.product_id not in incomplete]
+    if not lines:
+        return 0
+    usage, _ = product_usage(shop_id, {line.product_id for line in lines})
+    prices = price_history.history(shop_id)
+    costs = {}
+    updates = []
+    for line in lines:
+        key = (line.product_id, line.sale_date)
+        if key not in costs:
+            costs[key] = sum(q * prices.cost_as_of(ing, line.sale_date)
+                             for ing, q in usage.get(line.product_id, {}).items())
+        updates.append({"id": line.id, "unit_cost": costs[key]})
+    db.session.execute(db.update(SaleItem), updates)
+    return len(updates)
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert
+from app import rollups
+from app.extensions import db
+from app.models import ActivityRollup, Ingredient, Product, WasteLog, WasteRollup
+from app.rollups import period_start
+from app.services.inventory import deduct_ingredient
+from app.units import UnitError, registry
+
+GROUPINGS = ("category", "ingredient", "product")
+
+
+def record_waste(shop_id, quantity, unit, category, notes="", ingredient=None, product=None, cost=0.0):
+    """Log waste and take it out of stock in the caller's transaction (no commit).
+
+    Wasted ingredients leave stock through deduct_ingredient, and the entry
+    remembers how much so deleting it can put that back. Wasted products are
+    costed from their recipes; their ingredients already left stock when
+    the production run completed, so stock is not touched twice.
+    Returns the WasteLog, or an error string.
+    """
+    deducted = 0.0
+    if ingredient is not None:
+        try:
+            deducted = registry(shop_id).to_base(quantity, unit, ingredient)
+        except UnitError as e:
+            return str(e)
+        result = deduct_ingredient(ingredient.id, quantity, unit)
+        if result is not True:
+            return result
+        cost = cost or deducted * ingredient.cost_per_base_unit
+    elif product is not None:
+        cost = cost or product.total_recipe_cost * quantity
+        unit = unit or "pcs"
+
+    log = WasteLog(
+        shop_id=shop_id,
+        ingredient_id=ingredient.id if ingredient is not None else None,
+        product_id=product.id if product is not None else None,
+        quantity=quantity,
+        unit=unit,
+        cost_estimate=cost,
+        category=category,
+        notes=notes,
+        stock_deducted=deducted,
+    )
+    db.session.add(log)
+    return log
+
+
+def record_product_waste(shop_id, products, quantities, category, notes=""):
+    """Log many wasted products (no commit) with one bulk insert, e.g. the
+    unsold items at closing. `products` must be loaded with PRODUCT_COSTING.
+    Returns the total recipe cost logged."""
+    now = datetime.utcnow()
+    rows = [{
+        "shop_id": shop_id, "ingredient_id": None, "product_id": product.id,
+        "quantity": quantities[product.id], "unit": "pcs",
+        "cost_estimate": product.total_recipe_cost * quantities[product.id],
+        "category": category, "notes": notes, "stock_deducted": 0.0,
+        "logged_at": now, "updated_at": now,
+    } for product in products]
+    if rows:
+        db.session.execute(insert(WasteLog), rows)
+        rollups.add(WasteLog, rows)
+    return sum(row["cost_estimate"] for row in rows)
+
+
+def _periods(period, count, today=None):
+    """Start dates of the last `count` weeks or months, oldest first."""
+    start = period_start(today or date.today(), period)
+    starts = [start]
+    for _ in range(count - 1):
+        if period == "week":
+            start -= timedelta(days=7)
+        else:
+            start = (start - timedelta(days=1)).replace(day=1)
+        starts.append(start)
+    return starts[::-1]
+
+
+def waste_analytics(shop_id, by="category", period="month", count=12):
+    """Waste cost per period grouped by category, ingredient or product, with
+    waste as a share of completed production cost and of net sales.
+
+    Reads only the rollup tables: one query for waste, one for activity.
+    """
+    starts = _periods(period, count)
+    filters = [WasteRollup.shop_id == shop_id, WasteRollup.period == period,
+               WasteRollup.period_start >= starts[0]]
+    if by == "ingredient":
+        label = Ingredient.name
+        query = db.select(WasteRollup.period_start, WasteRollup.ingredient_id, label).outerjoin(
+            Ingredient, Ingredient.id == WasteRollup.ingredient_id)
+        filters.append(WasteRollup.ingredient_id != 0)
+        group = (WasteRollup.ingredient_id, label)
+    elif by == "product":
+        label = Product.name
+        query = db.select(WasteRollup.period_start, WasteRollup.product_id, label).outerjoin(
+            Product, Product.id == WasteRollup.product_id)
+        filters.append(WasteRollup.product_id != 0)
+        group = (WasteRollup.product_id, label)
+    else:
+        query = db.select(WasteRollup.period_start, WasteRollup.category, WasteRollup.category)
+        group = (WasteRollup.category,)
+    rows = db.session.execute(
+        query.add_columns(db.func.sum(WasteRollup.cost), db.func.sum(WasteRollup.entries))
+        .where(*filters)
+        .group_by(WasteRollup.period_start, *group)
+    ).all()
+
+    index = {start: i for i, start in enumerate(starts)}
+    series = {}
+    for start, key, name, cost, entries in rows:
+        if start not in index:
+            continue
+        if key not in series:
+            if by == "category":
+                name = (name or "other").replace("_", " ").title()
+            series[key] = {"name": name or f"Deleted {by}", "costs": [0.0] * count,
+                           "entries": 0, "total": 0.0}
+        item = series[key]
+        item["costs"][index[start]] += cost or 0.0
+        item["entries"] += entries or 0
+        item["total"] += cost or 0.0
+
+    activity = defaultdict(lambda: (0.0, 0.0))
+    for start, production_cost, sales in db.session.execute(
+        db.select(ActivityRollup.period_start, ActivityRollup.production_cost, ActivityRollup.sales)
+        .where(ActivityRollup.shop_id == shop_id, ActivityRollup.period == period,
+               ActivityRollup.period_start >= starts[0])
+    ):
+        activity[start] = (production_cost or 0.0, sales or 0.0)
+
+    waste = [sum(s["costs"][i] for s in series.values()) for i in range(count)]
+    production = [activity[start][0] for start in starts]
+    sales = [activity[start][1] for start in starts]
+    return {
+        "periods": starts,
+        "series": sorted(series.values(), key=lambda s: -s["total"]),
+        "waste": waste,
+        "production": production,
+        "sales": sales,
+        "pct_production": [w / p * 100 if p else None for w, p in zip(waste, production)],
+        "pct_sales": [w / s * 100 if s else None for w, s in zip(waste, sales)],
+        "total_waste": sum(waste),
+        "total_pct_production": sum(waste) / sum(production) * 100 if sum(production) else None,
+        "total_pct_sales": sum(waste) / sum(sales) * 100 if sum(sales) else None,
+    }
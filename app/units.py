@@ -0,0 +1,241 @@
+"""Units of measure.
+
+Every unit has a dimension (mass, volume or count) and a factor to that
+dimension's base unit (g, mL, pcs); ingredients keep their stock and cost in a
+base unit. Besides the built-in units, a shop can define its own ("sack" =
+25000 g), optionally for one ingredient only ("tray" = 30 pcs of eggs), and
+an ingredient with a density (g per mL) converts between mass and volume
+("cup" of flour to g).
+
+A `Registry` holds every unit a shop can use in a dense factor matrix, one
+row per unit and one column per dimension, so converting a whole column of
+(quantity, unit, ingredient) triples is a list of index lookups. Custom units
+are only queried the first time a shop uses a unit that is not built in.
+Conversions that make no sense (kg of eggs counted in pcs, an unknown unit)
+raise UnitError instead of guessing.
+"""
+from flask import g, has_app_context
+from sqlalchemy import and_, case, literal, select
+
+BASE_UNITS = {"mass": "g", "volume": "mL", "count": "pcs"}
+DIMENSIONS = list(BASE_UNITS)
+
+# name -> (dimension, factor to the dimension's base unit)
+BUILTIN_UNITS = {
+    "g": ("mass", 1.0),
+    "kg": ("mass", 1000.0),
+    "mL": ("volume", 1.0),
+    "ml": ("volume", 1.0),
+    "L": ("volume", 1000.0),
+    "l": ("volume", 1000.0),
+    "tsp": ("volume", 5.0),
+    "tbsp": ("volume", 15.0),
+    "cup": ("volume", 240.0),
+    "pcs": ("count", 1.0),
+    "dozen": ("count", 12.0),
+}
+
+# Offered in pickers; the lowercase aliases stay accepted for old data and imports
+DISPLAY_UNITS = ["g", "kg", "mL", "L", "tsp", "tbsp", "cup", "pcs", "dozen"]
+
+
+class UnitError(ValueError):
+    pass
+
+
+def dimension_of(base_unit):
+    for dimension, base in BASE_UNITS.items():
+        if base == base_unit:
+            return dimension
+    raise UnitError(f"'{base_unit}' is not a base unit (use one of {', '.join(BASE_UNITS.values())})")
+
+
+def base_unit_for(unit):
+    """The base unit a built-in unit converts to, e.g. kg -> g."""
+    if unit not in BUILTIN_UNITS:
+        raise UnitError(f"Unknown unit '{unit}'")
+    return BASE_UNITS[BUILTIN_UNITS[unit][0]]
+
+
+class Registry:
+    """The units one shop can use, as a dense factor matrix."""
+
+    def __init__(self, shop_id=None):
+        self.shop_id = shop_id
+        self._custom_loaded = shop_id is None
+        self._index = {}  # (name, ingredient id or None) -> row
+        self._dimensions = []  # row -> dimension
+        self._matrix = []  # row * len(DIMENSIONS) + column -> factor, None across dimensions
+        self._factors = {}  # (name, ingredient id, base unit, density) -> factor
+        for name, (dimension, factor) in BUILTIN_UNITS.items():
+            self._add(name, None, dimension, factor)
+
+    def _add(self, name, ingredient_id, dimension, factor):
+        self._index[(name, ingredient_id)] = len(self._dimensions)
+        self._dimensions.append(dimension)
+        self._matrix.extend(factor if d == dimension else None for d in DIMENSIONS)
+
+    def _load_custom(self):
+        from app.extensions import db
+        from app.models import CustomUnit
+        self._custom_loaded = True
+        rows = db.session.execute(
+            select(CustomUnit.name, CustomUnit.ingredient_id, CustomUnit.dimension, CustomUnit.factor)
+            .where(CustomUnit.shop_id == self.shop_id)
+        )
+        for row in rows:
+            self._add(row.name, row.ingredient_id, row.dimension, row.factor)
+
+    def _row(self, unit, ingredient_id):
+        for key in ((unit, ingredient_id), (unit, None)):
+            if key in self._index:
+                return self._index[key]
+        if not self._custom_loaded:
+            self._load_custom()
+            return self._row(unit, ingredient_id)
+        raise UnitError(f"Unknown unit '{unit}'")
+
+    def factor(self, unit, ingredient):
+        """Multiplier from `unit` to the ingredient's base unit."""
+        key = (unit, ingredient.id, ingredient.base_unit, ingredient.density)
+        if key in self._factors:
+            return self._factors[key]
+        row = self._row(unit, ingredient.id)
+        target = dimension_of(ingredient.base_unit)
+        factor = self._matrix[row * len(DIMENSIONS) + DIMENSIONS.index(target)]
+        if factor is None:
+            source = self._dimensions[row]
+            own = self._matrix[row * len(DIMENSIONS) + DIMENSIONS.index(source)]
+            density = ingredient.density
+            if density and {source, target} == {"mass", "volume"}:
+                factor = own * density if source == "volume" else own / density
+            else:
+                hint = " without a density" if {source, target} == {"mass", "volume"} else ""
+                raise UnitError(f"Can't convert {unit} ({source}) to {ingredient.base_unit} "
+                                f"for {ingredient.name}{hint}")
+        self._factors[key] = factor
+        return factor
+
+    def to_base(self, quantity, unit, ingredient):
+        return quantity * self.factor(unit, ingredient)
+
+    def to_base_column(self, quantities, units, ingredients):
+        """Convert parallel columns at once; returns base quantities in order."""
+        return [q * self.factor(u, ing) for q, u, ing in zip(quantities, units, ingredients)]
+
+    def compatible_units(self, ingredient):
+        """Unit names usable with an ingredient, built-in ones first."""
+        if not self._custom_loaded:
+            self._load_custom()
+        names = []
+        for (name, ingredient_id), _ in sorted(self._index.items(), key=lambda item: item[1]):
+            if ingredient_id not in (None, ingredient.id) or name in names:
+                continue
+            if ingredient_id is None and name in BUILTIN_UNITS and name not in DISPLAY_UNITS:
+                continue
+            try:
+                self.factor(name, ingredient)
+            except UnitError:
+                continue
+            names.append(name)
+        return names
+
+
+def registry(shop_id):
+    """The shop's registry, shared for the rest of the request (or app context)."""
+    if not has_app_context():
+        return Registry(shop_id)
+    registries = g.setdefault("unit_registries", {})
+    if shop_id not in registries:
+        registries[shop_id] = Registry(shop_id)
+    return registries[shop_id]
+
+
+def forget(shop_id):
+    """Drop the memoized registry after the shop's custom units change."""
+    if has_app_context():
+        g.get("unit_registries", {}).pop(shop_id, None)
+
+
+def recipe_unit_errors(shop_id, changed):
+    """{ingredient id: error} for ingredients whose recipe lines would stop converting.
+
+    `changed` maps ingredient ids to the ingredient as a bulk write would leave
+    it (anything with id, name, base_unit and density). Bulk writes skip the
+    check the ingredient form makes on save, so they run this first; the units
+    recipes use come from one query.
+    """
+    from app.extensions import db
+    from app.models import RecipeIngredient
+    if not changed:
+        return {}
+    units = registry(shop_id)
+    errors = {}
+    rows = db.session.execute(
+        select(RecipeIngredient.ingredient_id, RecipeIngredient.unit).distinct()
+        .where(RecipeIngredient.ingredient_id.in_(list(changed)))
+    )
+    for ingredient_id, unit in rows:
+        if ingredient_id in errors:
+            continue
+        try:
+            units.factor(unit, changed[ingredient_id])
+        except UnitError as e:
+            errors[ingredient_id] = f"{e}; recipes use it in that unit"
+    return errors
+
+
+def sql_factor(unit_col, ingredient):
+    """SQL expression for Registry.factor, for aggregating costs in the database.
+
+    `ingredient` is the Ingredient entity (or an alias) joined to the row
+    holding `unit_col`. Shop and ingredient custom units are looked up with a
+    correlated subquery; units that can't be converted give NULL.
+    """
+    from app.models import CustomUnit
+    target = case({base: literal(dimension) for dimension, base in BASE_UNITS.items()},
+                  value=ingredient.base_unit)
+    whens = []
+    for name, (dimension, factor) in BUILTIN_UNITS.items():
+        whens.append((and_(unit_col == name, target == dimension), literal(factor)))
+        if dimension in ("mass", "volume"):
+            other = "volume" if dimension == "mass" else "mass"
+            converted = factor * ingredient.density if dimension == "volume" else factor / ingredient.density
+            whens.append((and_(unit_col == name, target == other), converted))
+    across = case(
+        (CustomUnit.dimension == target, 1.0),
+        (and_(CustomUnit.dimension == "volume", target == "mass"), ingredient.density),
+        (and_(CustomUnit.dimension == "mass", target == "volume"), 1.0 / ingredient.density),
+    )
+    custom = (
+        select(CustomUnit.factor * across)
+        .where(
+            CustomUnit.shop_id == ingredient.shop_id,
+            CustomUnit.name == unit_col,
+            (CustomUnit.ingredient_id == ingredient.id) | CustomUnit.ingredient_id.is_(None),
+        )
+        # The ingredient's own unit wins over a shop-wide one of the same name
+        .order_by(CustomUnit.ingredient_id.is_(None))
+        .limit(1)
+        .scalar_subquery()
+    )
+    return case(*whens, else_=custom)
+
+
+# --- Display ---
+
+def convert_from_base(quantity, base_unit):
+    """Convert from base unit to a readable display unit."""
+    if base_unit == "g" and quantity >= 1000:
+        return quantity / 1000, "kg"
+    if base_unit == "mL" and quantity >= 1000:
+        return quantity / 1000, "L"
+    return quantity, base_unit
+
+
+def format_quantity(quantity, base_unit):
+    """Format a base-unit quantity for display."""
+    val, unit = convert_from_base(quantity, base_unit)
+    if val == int(val):
+        return f"{int(val)} {unit}"
+    return f"{val:.2f} {unit}"
@@ -0,0 +1,102 @@
+"""Per-worker cache of logged-in users and their shops.
+
+Flask-Login's user loader and the template globals need the user and shop
+rows on every request, and they rarely change. Each worker keeps a snapshot
+of their columns for USER_CACHE_TTL seconds and attaches it to the request's
+session without a query; `current_user.shop` then resolves from the identity
+map.
+
+Routes that change a user or shop call `invalidate_user` / `invalidate_shop`
+after committing. That drops the local copy and touches USER_CACHE_STAMP,
+whose mtime every worker on the host checks (one stat call per request) to
+drop theirs too. Workers on other hosts catch up when their copies expire.
+"""
+import os
+import threading
+import time
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from .extensions import db
+from .models import Shop, User
+
+_users = {}  # user id -> (expires at, column values)
+_shops = {}  # shop id -> (expires at, column values)
+_lock = threading.Lock()
+_seen_stamp = None
+
+
+def _snapshot(obj):
+    return {attr.key: getattr(obj, attr.key) for attr in obj.__mapper__.column_attrs}
+
+
+def _attach(model, values):
+    """Add a cached row to the current session as if it had just been loaded."""
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+
+def _check_stamp():
+    """Forget everything if any worker has invalidated since we last looked."""
+    global _seen_stamp
+    try:
+        stamp = os.stat(current_app.config["USER_CACHE_STAMP"]).st_mtime_ns
+    except FileNotFoundError:
+        stamp = None
+    if stamp != _seen_stamp:
+        with _lock:
+            _users.clear()
+            _shops.clear()
+            _seen_stamp = stamp
+
+
+def _signal_workers():
+    path = current_app.config["USER_CACHE_STAMP"]
+    now = time.time_ns()
+    try:
+        with open(path, "a"):
+            pass
+        os.utime(path, ns=(now, now))
+    except OSError:
+        current_app.logger.warning("Could not touch %s; other workers keep cached users until they expire", path)
+
+
+def load_user(user_id):
+    """Flask-Login user loader: the user (with their shop) from cache, else one query."""
+    ttl = current_app.config["USER_CACHE_TTL"]
+    if not ttl:
+        return db.session.get(User, user_id)
+
+    _check_stamp()
+    now = time.monotonic()
+    user = _users.get(user_id)
+    if user and user[0] > now:
+        shop = _shops.get(user[1]["shop_id"])
+        if shop and shop[0] > now:
+            obj = _attach(User, user[1])
+            # As loaded state, not a change; also keeps the shop alive in the
+            # session's weak-referencing identity map.
+            set_committed_value(obj, "shop", _attach(Shop, shop[1]))
+            return obj
+
+    obj = db.session.get(User, user_id, options=[db.joinedload(User.shop)])
+    if obj is not None:
+        with _lock:
+            _users[user_id] = (now + ttl, _snapshot(obj))
+            _shops[obj.shop_id] = (now + ttl, _snapshot(obj.shop))
+    return obj
+
+
+def invalidate_user(user_id):
+    """Call after committing a change to a user (removal, role change, ...)."""
+    with _lock:
+        _users.pop(user_id, None)
+    _signal_workers()
+
+
+def invalidate_shop(shop_id):
+    """Call after committing a change to a shop's settings or invite code."""
+    with _lock:
+        _shops.pop(shop_id, None)
+    _signal_workers()
@@ -3,9 +3,21 @@ from flask_login import current_user
 from .extensions import db
 
 
-def get_or_404(model, id):
-    """Get by ID, 404 if not found or wrong shop."""
-    obj = db.session.get(model, id)
+def get_or_404(model, id, *options):
+    """Get by ID, 404 if not found or wrong shop. `options` are loader options."""
+    obj = db.session.get(model, id, options=options)
     if not obj or (hasattr(obj, 'shop_id') and obj.shop_id != current_user.shop_id):
         abort(404)
     return obj
+
+
+def query_budget(queries, ms=250):
+    """Declare the most SQL statements and milliseconds a view may use.
+
+    Checked by check_query_budgets.py against a seeded shop; a route without
+    a budget fails the check.
+    """
+    def decorator(view):
+        view.query_budget = (queries, ms)
+        return view
+    return decorator
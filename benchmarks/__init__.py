@@ -0,0 +1 @@
+"""Synthetic data generation and timed benchmarks; see benchmarks/run.py."""
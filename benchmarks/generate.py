@@ -0,0 +1,277 @@
+"""Bulk synthetic shops for benchmarks and load tests.
+
+Writes straight through Core INSERTs in large chunks with ids assigned up
+front, so millions of sale lines take seconds rather than the ORM's minutes.
+Each call adds new shops; existing data is left alone.
+
+Usage:
+    python -m benchmarks.generate --scale medium
+    python -m benchmarks.generate --database-url postgresql://... --shops 2 --sales 500000
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+
+SCALES = {
+    # Per shop; sales average three lines each
+    "small": dict(shops=1, users=3, ingredients=300, recipes=150, products=100,
+                  runs=1_000, sales=10_000, waste=1_000, days=90),
+    "medium": dict(shops=3, users=3, ingredients=2_000, recipes=1_000, products=500,
+                   runs=5_000, sales=100_000, waste=5_000, days=365),
+    "large": dict(shops=5, users=5, ingredients=5_000, recipes=3_000, products=1_500,
+                  runs=20_000, sales=400_000, waste=20_000, days=365),
+}
+
+PASSWORD = "benchpass"
+CHUNK_SIZE = 10_000
+
+UNITS = {"g": ["g", "kg"], "mL": ["mL", "L"], "pcs": ["pcs", "dozen"]}
+CATEGORIES = ["Flour & Grains", "Dairy", "Sweeteners", "Nuts & Dried Fruits",
+              "Fats & Oils", "Eggs", "Flavorings", "Chocolate", "Fruits", "Other"]
+PRODUCT_CATEGORIES = ["Pastries", "Cakes", "Cookies", "Bread", "Viennoiserie", "Drinks"]
+PAYMENT_METHODS = ["cash", "cash", "card", "card", "mobile"]
+
+
+def user_email(shop_id, n):
+    """Login for the n-th user of a generated shop (0 is the owner)."""
+    return f"bench{shop_id}-{n}@bench.test"
+
+
+class _Writer:
+    """Buffers rows per table and flushes them as executemany INSERTs."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffers = {}
+        self.counts = {}
+
+    def next_id(self, table):
+        return (self.conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+    def add(self, table, row):
+        buf = self.buffers.setdefault(table, [])
+        buf.append(row)
+        if len(buf) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        # Tables flush in the order they were first added to, parents before
+        # children, so foreign keys hold on databases that check them per statement.
+        for table, rows in self.buffers.items():
+            if rows:
+                self.conn.execute(table.insert(), rows)
+                self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+                self.buffers[table] = []
+
+
+def generate_shop(writer, rng, sizes, tables, password_hash):
+    """Insert one complete shop; returns its id."""
+    (shops, users, ingredients, recipes, recipe_ingredients, products,
+     product_recipes, runs, sales, sale_items, waste) = tables
+    now = datetime.utcnow()
+
+    shop_id = writer.next_id(shops)
+    writer.conn.execute(shops.insert(), [{
+        "id": shop_id, "name": f"Bench Shop {shop_id}", "currency": "DH",
+        "default_vat_rate": 20.0, "invite_code": f"BENCH{shop_id:03d}", "created_at": now,
+    }])
+    uid = writer.next_id(users)
+    for n in range(sizes["users"]):
+        writer.add(users, {
+            "id": uid + n, "email": user_email(shop_id, n), "password_hash": password_hash,
+            "display_name": f"Bench {n}", "role": "owner" if n == 0 else "member",
+            "shop_id": shop_id, "created_at": now,
+        })
+
+    ing_start = writer.next_id(ingredients)
+    ing_units = []
+    for n in range(sizes["ingredients"]):
+        base = rng.choices(["g", "mL", "pcs"], weights=[6, 3, 1])[0]
+        ing_units.append(base)
+        low = rng.random() < 0.05
+        writer.add(ingredients, {
+            "id": ing_start + n, "shop_id": shop_id, "name": f"Ingredient {n:05d}",
+            "category": CATEGORIES[n % len(CATEGORIES)], "base_unit": base,
+            # Plenty on hand so production completions in benchmarks succeed
+            "quantity_on_hand": 50.0 if low else 1e9, "cost_per_base_unit": rng.uniform(0.001, 0.08),
+            "min_stock_level": 100.0, "expiry_date": None, "notes": "",
+            "created_at": now, "updated_at": now,
+        })
+
+    recipe_start = writer.next_id(recipes)
+    ri_id = writer.next_id(recipe_ingredients)
+    for n in range(sizes["recipes"]):
+        writer.add(recipes, {
+            "id": recipe_start + n, "shop_id": shop_id, "name": f"Recipe {n:05d}",
+            "description": "", "yield_quantity": float(rng.choice([1, 6, 12, 24, 48])),
+            "yield_unit": "pcs", "estimated_time_minutes": rng.randint(10, 240),
+            "is_active": True, "created_at": now, "updated_at": now,
+        })
+        for offset in rng.sample(range(sizes["ingredients"]), min(rng.randint(4, 12), sizes["ingredients"])):
+            unit, qty = ing_units[offset], round(rng.uniform(1, 500), 1)
+            if rng.random() < 0.25:
+                unit, qty = UNITS[unit][1], round(rng.uniform(0.1, 2), 2)
+            writer.add(recipe_ingredients, {
+                "id": ri_id, "recipe_id": recipe_start + n, "ingredient_id": ing_start + offset,
+                "quantity": qty, "unit": unit,
+            })
+            ri_id += 1
+
+    product_start = writer.next_id(products)
+    pr_id = writer.next_id(product_recipes)
+    prices = []
+    for n in range(sizes["products"]):
+        price = round(rng.uniform(4, 80), 2)
+        prices.append(price)
+        writer.add(products, {
+            "id": product_start + n, "shop_id": shop_id, "name": f"Product {n:05d}",
+            "category": PRODUCT_CATEGORIES[n % len(PRODUCT_CATEGORIES)], "selling_price": price,
+            "vat_rate": 20.0, "is_active": True, "created_at": now, "updated_at": now,
+        })
+        for offset in rng.sample(range(sizes["recipes"]), rng.choice([1, 1, 1, 2, 3])):
+            writer.add(product_recipes, {
+                "id": pr_id, "product_id": product_start + n,
+                "recipe_id": recipe_start + offset, "quantity_needed": 1.0,
+            })
+            pr_id += 1
+
+    horizon = sizes["days"] * 86400
+    run_start = writer.next_id(runs)
+    for n in range(sizes["runs"]):
+        created = now - timedelta(seconds=rng.randrange(horizon))
+        completed = rng.random() < 0.9
+        writer.add(runs, {
+            "id": run_start + n, "shop_id": shop_id,
+            "recipe_id": recipe_start + rng.randrange(sizes["recipes"]),
+            "quantity_produced": float(rng.choice([6, 12, 24, 48])),
+            "status": "completed" if completed else "planned",
+            "produced_at": created if completed else None, "notes": "",
+            "cost_total": round(rng.uniform(5, 200), 2), "created_at": created, "updated_at": created,
+        })
+
+    sale_start = writer.next_id(sales)
+    item_id = writer.next_id(sale_items)
+    for n in range(sizes["sales"]):
+        created = now - timedelta(seconds=rng.randrange(horizon))
+        lines = []
+        for _ in range(rng.choice([1, 1, 2, 3, 3, 4, 5, 5])):
+            offset = rng.randrange(sizes["products"])
+            lines.append((offset, float(rng.choice([1, 1, 1, 2, 3, 6]))))
+        subtotal = sum(prices[offset] * qty for offset, qty in lines)
+        writer.add(sales, {
+            "id": sale_start + n, "shop_id": shop_id, "sale_date": created.date(),
+            "total_amount": round(subtotal * 1.2, 2), "vat_amount": round(subtotal * 0.2, 2),
+            "payment_method": rng.choice(PAYMENT_METHODS), "customer_name": "", "notes": "",
+            "created_at": created, "updated_at": created,
+        })
+        for offset, qty in lines:
+            writer.add(sale_items, {
+                "id": item_id, "sale_id": sale_start + n, "product_id": product_start + offset,
+                "quantity": qty, "unit_price": prices[offset], "vat_rate": 20.0,
+                "line_total": round(prices[offset] * qty * 1.2, 2), "unit_cost": round(prices[offset] * 0.35, 2),
+            })
+            item_id += 1
+
+    waste_start = writer.next_id(waste)
+    for n in range(sizes["waste"]):
+        logged = now - timedelta(seconds=rng.randrange(horizon))
+        is_ingredient = rng.random() < 0.5
+        offset = rng.randrange(sizes["ingredients"] if is_ingredient else sizes["products"])
+        writer.add(waste, {
+            "id": waste_start + n, "shop_id": shop_id,
+            "ingredient_id": ing_start + offset if is_ingredient else None,
+            "product_id": None if is_ingredient else product_start + offset,
+            "quantity": float(rng.randint(1, 500)),
+            "unit": ing_units[offset] if is_ingredient else "pcs",
+            "cost_estimate": round(rng.uniform(0.5, 40), 2),
+            "category": rng.choice(["expired", "spoiled", "failed_batch", "unsold", "other"]),
+            "notes": "", "logged_at": logged, "updated_at": logged,
+        })
+
+    writer.flush()
+    return shop_id
+
+
+def generate(db, sizes, seed=0, log=print):
+    """Add `sizes["shops"]` shops to the app's database; returns their ids."""
+    from werkzeug.security import generate_password_hash
+    from app.models import (
+        Shop, User, Ingredient, Recipe, RecipeIngredient, Product, ProductRecipe,
+        ProductionRun, Sale, SaleItem, WasteLog,
+    )
+    tables = [m.__table__ for m in (Shop, User, Ingredient, Recipe, RecipeIngredient, Product,
+                                    ProductRecipe, ProductionRun, Sale, SaleItem, WasteLog)]
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(PASSWORD)
+    shop_ids = []
+    start = time.perf_counter()
+    with db.engine.begin() as conn:
+        writer = _Writer(conn)
+        for _ in range(sizes["shops"]):
+            shop_ids.append(generate_shop(writer, rng, sizes, tables, password_hash))
+            log(f"  shop {shop_ids[-1]} done ({time.perf_counter() - start:.1f}s)")
+        if conn.dialect.name == "postgresql":
+            # Ids were assigned here, so move the sequences past them
+            for table in tables:
+                conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"(SELECT MAX(id) FROM {table.name}))"
+                )
+    elapsed = time.perf_counter() - start
+    total = sum(writer.counts.values())
+    log(f"Inserted {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s): "
+        + ", ".join(f"{name} {n:,}" for name, n in writer.counts.items()))
+
+    # Core inserts bypass the session listeners that maintain these
+    from app import price_history, rollups
+    start = time.perf_counter()
+    for shop_id in shop_ids:
+        rollups.rebuild(shop_id)
+        price_history.sync(shop_id)
+        db.session.commit()
+    log(f"Built rollups and price history in {time.perf_counter() - start:.1f}s")
+    return shop_ids
+
+
+def add_size_arguments(parser):
+    parser.add_argument("--scale", choices=SCALES, default="small", help="Preset sizes (default: small)")
+    for key in SCALES["small"]:
+        parser.add_argument(f"--{key}", type=int, help=f"Override the preset's {key} (per shop)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+
+
+def sizes_from_args(args):
+    sizes = dict(SCALES[args.scale])
+    for key in sizes:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL", ""),
+                        help="Target database (default: DATABASE_URL, else the local SQLite file)")
+    add_size_arguments(parser)
+    args = parser.parse_args()
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    from app import create_app
+    from app.extensions import db
+
+    sizes = sizes_from_args(args)
+    app = create_app()
+    with app.app_context():
+        print(f"Generating {sizes['shops']} shop(s) on {db.engine.dialect.name}: "
+              + ", ".join(f"{k} {v:,}" for k, v in sizes.items() if k != "shops"))
+        shop_ids = generate(db, sizes, args.seed)
+    print(f"Log in as {user_email(shop_ids[0], 0)} / {PASSWORD} "
+          f"(users bench<shop>-<n>@bench.test, n=0 is the owner)")
+
+
+if __name__ == "__main__":
+    main()
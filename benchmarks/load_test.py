@@ -0,0 +1,294 @@
+"""Replay a busy-day traffic mix against a locally started gunicorn and report
+throughput, latency percentiles and errors per endpoint.
+
+Several users per generated shop log in and loop over a weighted mix of
+quick-sale checkouts, HTMX product searches, dashboard refreshes and
+production completions. Completions of runs for the same shop compete for
+the same ingredient rows, so lock contention in stock deduction shows up as
+latency spikes or errors on that endpoint.
+
+The default database is a temporary SQLite file, which serializes all writes;
+point --database-url at a PostgreSQL database for numbers that mean anything
+for production sizing.
+
+Usage:
+    python -m benchmarks.load_test                                  # 2 workers, 30 s
+    python -m benchmarks.load_test --workers 4 --users-per-shop 5 --duration 60
+    python -m benchmarks.load_test --database-url postgresql://... --scale medium
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --database-url ...  # server already running
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+
+from benchmarks.generate import PASSWORD, add_size_arguments, generate, sizes_from_args, user_email
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "checkout=40,search=35,dashboard=15,production=10"
+# Planned production runs created per shop for the completion endpoint
+PLANNED_RUNS = 2000
+SEARCH_TERMS = ["Product", "Product 0", "Product 00", "12", "3", "Product 001", "7"]
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects as responses; following them would time a second request."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Shop:
+    def __init__(self, shop_id, product_ids, run_ids):
+        self.id = shop_id
+        self.product_ids = product_ids
+        self.run_ids = run_ids
+        self.lock = threading.Lock()
+
+    def next_run(self):
+        with self.lock:
+            return self.run_ids.pop() if self.run_ids else None
+
+
+class VirtualUser(threading.Thread):
+    """One logged-in browser session looping over the traffic mix."""
+
+    def __init__(self, base_url, shop, email, mix, think):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.shop = shop
+        self.email = email
+        self.actions, self.weights = zip(*mix.items())
+        self.think = think
+        # Set just before the users start
+        self.record_after = self.deadline = None
+        self.rng = random.Random(email)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.opener = urllib.request.build_opener(
+            _NoRedirect, urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, path, data=None, json_body=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def login(self):
+        status = self.request("/login", data={"email": self.email, "password": PASSWORD})
+        if status != 302:
+            raise RuntimeError(f"login as {self.email} failed with HTTP {status}")
+
+    def checkout(self):
+        items = [{"product_id": pid, "quantity": self.rng.choice([1, 1, 2, 3])}
+                 for pid in self.rng.sample(self.shop.product_ids, self.rng.randint(1, 4))]
+        return self.request("/sales/checkout", json_body={"items": items, "payment_method": "card"})
+
+    def search(self):
+        q = urllib.parse.quote(self.rng.choice(SEARCH_TERMS))
+        return self.request(f"/products/search?q={q}", headers={"HX-Request": "true"})
+
+    def dashboard(self):
+        return self.request("/")
+
+    def production(self):
+        run_id = self.shop.next_run()
+        if run_id is None:
+            return None
+        return self.request(f"/production/{run_id}/complete", data={})
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            action = self.rng.choices(self.actions, self.weights)[0]
+            start = time.monotonic()
+            try:
+                status = getattr(self, action)()
+            except (OSError, urllib.error.URLError) as e:
+                status = type(e).__name__
+            elapsed = (time.monotonic() - start) * 1000
+            if status is not None and start >= self.record_after:
+                self.latencies[action].append(elapsed)
+                if not isinstance(status, int) or status >= 400:
+                    self.errors[action][status] += 1
+            if self.think:
+                time.sleep(self.rng.uniform(0, 2 * self.think))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("checkout", "search", "dashboard", "production"):
+            raise ValueError(f"unknown action '{name.strip()}'")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def report(users, measured_seconds):
+    latencies = defaultdict(list)
+    errors = defaultdict(Counter)
+    for user in users:
+        for action, values in user.latencies.items():
+            latencies[action].extend(values)
+        for action, counts in user.errors.items():
+            errors[action].update(counts)
+    latencies["total"] = [v for values in latencies.values() for v in values]
+    for counts in list(errors.values()):
+        errors["total"].update(counts)
+
+    print(f"\n{'endpoint':<12} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}   (ms)")
+    for action in sorted(latencies, key=lambda a: (a == "total", a)):
+        values = sorted(latencies[action])
+        if not values:
+            continue
+        n_errors = sum(errors[action].values())
+        print(f"{action:<12} {len(values):>9} {n_errors:>7} {len(values) / measured_seconds:>8.1f} "
+              f"{percentile(values, 50):>8.1f} {percentile(values, 95):>8.1f} "
+              f"{percentile(values, 99):>8.1f} {values[-1]:>8.1f}")
+    for action, counts in sorted(errors.items()):
+        if action != "total" and counts:
+            print(f"  {action} errors: " + ", ".join(f"{status} x{n}" for status, n in counts.most_common()))
+
+
+def prepare(args, sizes):
+    """Find or generate the bench shops and queue planned runs; returns [Shop]."""
+    from app import create_app
+    from app.extensions import db
+    from app.models import Product, ProductionRun, Recipe, Shop as ShopModel
+
+    app = create_app()
+    with app.app_context():
+        shop_ids = db.session.scalars(
+            db.select(ShopModel.id).where(ShopModel.name.like("Bench Shop %")).order_by(ShopModel.id)
+        ).all()[:args.shops]
+        if not shop_ids:
+            print(f"Generating {sizes['shops']} {args.scale} shop(s) on {db.engine.dialect.name}...")
+            shop_ids = generate(db, sizes, args.seed)
+        shops = []
+        rng = random.Random(args.seed)
+        for shop_id in shop_ids:
+            recipe_ids = db.session.scalars(db.select(Recipe.id).where(Recipe.shop_id == shop_id)).all()
+            # A few hot recipes, so completions contend for the same ingredient rows
+            hot = rng.sample(recipe_ids, min(10, len(recipe_ids)))
+            runs = [ProductionRun(shop_id=shop_id, recipe_id=rng.choice(hot), quantity_produced=12)
+                    for _ in range(PLANNED_RUNS)]
+            db.session.add_all(runs)
+            db.session.commit()
+            product_ids = db.session.scalars(
+                db.select(Product.id).where(Product.shop_id == shop_id, Product.is_active == True)).all()
+            shops.append(Shop(shop_id, product_ids, [r.id for r in runs]))
+    return shops
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, threads):
+    port = _free_port()
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(prefix="pastrycloud-load-metrics-"))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+         "-b", f"127.0.0.1:{port}", "--log-level", "warning", "wsgi:application"],
+        cwd=ROOT, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            urllib.request.urlopen(url + "/health/", timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become healthy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Database the app runs against (default: a temporary SQLite file)")
+    parser.add_argument("--url", help="Use an already running server instead of starting gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers (default: 2)")
+    parser.add_argument("--threads", type=int, default=1, help="Threads per gunicorn worker (default: 1)")
+    parser.add_argument("--users-per-shop", type=int, default=3, help="Concurrent logged-in users per shop")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of measured traffic (default: 30)")
+    parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds before that (default: 3)")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between a user's requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Action weights (default: {DEFAULT_MIX})")
+    add_size_arguments(parser)
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    database_url = args.database_url
+    if not database_url:
+        if args.url:
+            parser.error("--url needs --database-url pointing at the server's database")
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="pastrycloud-load-"), "load.db")
+    os.environ["DATABASE_URL"] = database_url
+
+    sizes = sizes_from_args(args)
+    shops = prepare(args, sizes)
+
+    proc = None
+    url = args.url
+    if not url:
+        proc, url = start_gunicorn(args.workers, args.threads)
+        print(f"Started gunicorn on {url} ({args.workers} workers x {args.threads} threads)")
+    try:
+        users = [
+            VirtualUser(url, shop, user_email(shop.id, n % sizes["users"]), mix, args.think_ms / 1000)
+            for shop in shops for n in range(args.users_per_shop)
+        ]
+        for user in users:
+            user.login()
+        print(f"Replaying {args.mix} with {len(users)} users across {len(shops)} shop(s) "
+              f"for {args.warmup:g}+{args.duration:g} s...")
+        record_after = time.monotonic() + args.warmup
+        for user in users:
+            user.record_after, user.deadline = record_after, record_after + args.duration
+            user.start()
+        for user in users:
+            user.join()
+        report(users, args.duration)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""Time the hot paths against a generated shop and record the results per commit.
+
+Without --database-url a temporary SQLite database is generated at the chosen
+scale. With one, an existing generated shop is reused (run benchmarks.generate
+first) and a new one is generated only if none is found.
+
+Each run appends a line to benchmarks/results.jsonl with the git commit, the
+dataset size and per-benchmark timings; --compare shows the change against an
+earlier commit's results.
+
+Usage:
+    python -m benchmarks.run                        # small dataset, 5 repeats
+    python -m benchmarks.run --scale medium --repeat 3
+    python -m benchmarks.run --database-url postgresql://... --only export
+    python -m benchmarks.run --compare HEAD~1       # compare with that commit's last run
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.generate import PASSWORD, add_size_arguments, generate, sizes_from_args, user_email
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+# Work per timed repetition
+RECIPES_CHECKED = 100
+RUNS_COMPLETED = 20
+CHECKOUTS = 20
+ITEMS_PER_CHECKOUT = 3
+
+
+class Context:
+    """What the benchmarks share: the app, a logged-in client and the shop's ids."""
+
+    def __init__(self, app, shop_id):
+        from app.extensions import db
+        from app.models import Product, Recipe
+
+        self.app = app
+        self.shop_id = shop_id
+        self.rng = random.Random(0)
+        with app.app_context():
+            self.recipe_ids = db.session.scalars(
+                db.select(Recipe.id).where(Recipe.shop_id == shop_id)).all()
+            self.product_ids = db.session.scalars(
+                db.select(Product.id).where(Product.shop_id == shop_id)).all()
+        # Requests must not run inside an outer app context, or they would
+        # share its session and Flask-Login's cached user.
+        self.client = app.test_client()
+        response = self.client.post("/login", data={"email": user_email(shop_id, 0), "password": PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f"Could not log in as the owner of shop {shop_id}")
+
+
+def bench_recipe_costing(ctx, _):
+    """Cost every recipe of the shop, as the recipes list does."""
+    from app.models import Recipe, RECIPE_COSTING
+    recipes = Recipe.query.options(RECIPE_COSTING).filter_by(shop_id=ctx.shop_id).all()
+    return sum(r.total_cost for r in recipes)
+
+
+def bench_product_costing(ctx, _):
+    """Cost every product through its recipes, as the products list does."""
+    from app.models import Product, PRODUCT_COSTING
+    products = Product.query.options(PRODUCT_COSTING).filter_by(shop_id=ctx.shop_id).all()
+    return sum(p.total_recipe_cost for p in products)
+
+
+def bench_check_recipe_stock(ctx, _):
+    from app.extensions import db
+    from app.models import RECIPE_COSTING, Recipe
+    from app.services.inventory import check_recipe_stock
+    for rid in ctx.rng.sample(ctx.recipe_ids, min(RECIPES_CHECKED, len(ctx.recipe_ids))):
+        check_recipe_stock(db.session.get(Recipe, rid, options=[RECIPE_COSTING]), 2.0)
+
+
+def setup_production_runs(ctx):
+    from app.extensions import db
+    from app.models import ProductionRun
+    runs = [ProductionRun(shop_id=ctx.shop_id, recipe_id=ctx.rng.choice(ctx.recipe_ids), quantity_produced=12)
+            for _ in range(RUNS_COMPLETED)]
+    db.session.add_all(runs)
+    db.session.commit()
+    return [run.id for run in runs]
+
+
+def bench_complete_production_run(ctx, run_ids):
+    from app.services.production import complete_production_run
+    for run_id in run_ids:
+        complete_production_run(run_id)
+
+
+def bench_checkout(ctx, _):
+    for _ in range(CHECKOUTS):
+        items = [{"product_id": pid, "quantity": 1}
+                 for pid in ctx.rng.sample(ctx.product_ids, ITEMS_PER_CHECKOUT)]
+        response = ctx.client.post("/sales/checkout", json={"items": items})
+        if response.status_code != 200:
+            raise RuntimeError(f"checkout failed with HTTP {response.status_code}")
+
+
+def bench_dashboard(ctx, _):
+    response = ctx.client.get("/")
+    if response.status_code != 200:
+        raise RuntimeError(f"dashboard failed with HTTP {response.status_code}")
+
+
+def _page(path):
+    def bench(ctx, _):
+        response = ctx.client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} failed with HTTP {response.status_code}")
+    bench.__doc__ = f"GET {path}"
+    return bench
+
+
+def _export(fmt):
+    def bench(ctx, _):
+        from app.services import export
+        getattr(export, f"export_{fmt}")("sales", ctx.shop_id)
+    bench.__doc__ = f"Full {fmt} export of the shop's sales."
+    return bench
+
+
+# name -> (setup, benchmark, over HTTP). Setup runs untimed before each
+# repetition; service-level benchmarks get a fresh app context (and session)
+# per repetition, HTTP ones go through the test client as a full request.
+BENCHMARKS = {
+    "recipe_costing": (None, bench_recipe_costing, False),
+    "product_costing": (None, bench_product_costing, False),
+    "check_recipe_stock": (None, bench_check_recipe_stock, False),
+    "complete_production_run": (setup_production_runs, bench_complete_production_run, False),
+    "checkout": (None, bench_checkout, True),
+    "dashboard": (None, bench_dashboard, True),
+    "waste_analytics": (None, _page("/waste/analytics?by=ingredient&period=week&count=52"), True),
+    "margin_report": (None, _page("/reports/margins?start=2000-01-01"), True),
+    "export_csv": (None, _export("csv"), False),
+    "export_json": (None, _export("json"), False),
+    "export_excel": (None, _export("excel"), False),
+}
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset_counts(db, shop_id):
+    from app.models import Ingredient, Recipe, RecipeIngredient, Product, Sale, SaleItem, ProductionRun
+    counted = {
+        "ingredients": (Ingredient, Ingredient),
+        "recipes": (Recipe, Recipe),
+        "recipe_lines": (RecipeIngredient, Recipe),
+        "products": (Product, Product),
+        "production_runs": (ProductionRun, ProductionRun),
+        "sales": (Sale, Sale),
+        "sale_lines": (SaleItem, Sale),
+    }
+    counts = {}
+    for name, (model, owner) in counted.items():
+        stmt = db.select(db.func.count(model.id))
+        if owner is not model:
+            stmt = stmt.join(owner)
+        counts[name] = db.session.scalar(stmt.where(owner.shop_id == shop_id))
+    return counts
+
+
+def _timed(ctx, bench, arg):
+    start = time.perf_counter()
+    bench(ctx, arg)
+    return (time.perf_counter() - start) * 1000
+
+
+def run_benchmarks(ctx, names, repeat):
+    results = {}
+    for name in names:
+        setup, bench, over_http = BENCHMARKS[name]
+        timings = []
+        for _ in range(repeat):
+            arg = None
+            if setup:
+                with ctx.app.app_context():
+                    arg = setup(ctx)
+            if over_http:
+                timings.append(_timed(ctx, bench, arg))
+            else:
+                with ctx.app.app_context():
+                    timings.append(_timed(ctx, bench, arg))
+        results[name] = {
+            "median_ms": round(statistics.median(timings), 2),
+            "min_ms": round(min(timings), 2),
+            "max_ms": round(max(timings), 2),
+            "repeat": repeat,
+        }
+        print(f"  {name:<26} median {results[name]['median_ms']:>10.1f} ms   "
+              f"min {results[name]['min_ms']:>10.1f} ms")
+    return results
+
+
+def load_results():
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(record, ref, history):
+    sha = _git("rev-parse", ref)
+    if not sha:
+        print(f"Unknown git ref '{ref}'.")
+        return
+    previous = [r for r in history if r["commit"] == sha]
+    if not previous:
+        print(f"No stored results for {ref} ({sha[:10]}); check it out and run the benchmarks there first.")
+        return
+    base = previous[-1]
+    print(f"\nCompared with {ref} ({sha[:10]}, {base['timestamp']}):")
+    if base["dataset"] != record["dataset"] or base["database"] != record["database"]:
+        print("  warning: datasets differ, timings are not directly comparable")
+    for name, result in record["results"].items():
+        old = base["results"].get(name)
+        if not old:
+            print(f"  {name:<26} new")
+            continue
+        change = (result["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0.0
+        print(f"  {name:<26} {old['median_ms']:>10.1f} -> {result['median_ms']:>10.1f} ms  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Reuse a generated database instead of a temporary one")
+    add_size_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions per benchmark (default: 5)")
+    parser.add_argument("--only", action="append", default=[],
+                        help="Run benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--compare", metavar="REF", help="Compare with stored results of a git ref")
+    parser.add_argument("--no-save", action="store_true", help=f"Don't append to {os.path.relpath(RESULTS_FILE, ROOT)}")
+    args = parser.parse_args()
+
+    names = [n for n in BENCHMARKS if not args.only or any(o in n for o in args.only)]
+    if not names:
+        parser.error(f"no benchmark matches {args.only}; choose from {', '.join(BENCHMARKS)}")
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="pastrycloud-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["SCHEMA_CHECK"] = "auto"
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import Shop
+
+    app = create_app()
+    with app.app_context():
+        shop_id = db.session.scalar(
+            db.select(Shop.id).where(Shop.name.like("Bench Shop %")).order_by(Shop.id))
+        if shop_id is None:
+            sizes = sizes_from_args(args)
+            print(f"Generating a {args.scale} dataset on {db.engine.dialect.name}...")
+            shop_id = generate(db, sizes, args.seed)[0]
+        dataset = dataset_counts(db, shop_id)
+        database = db.engine.dialect.name
+    print(f"Benchmarking shop {shop_id} on {database}: "
+          + ", ".join(f"{k} {v:,}" for k, v in dataset.items()))
+    results = run_benchmarks(Context(app, shop_id), names, args.repeat)
+
+    record = {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "database": database,
+        "python": sys.version.split()[0],
+        "dataset": dataset,
+        "results": results,
+    }
+    history = load_results()
+    if not args.no_save:
+        with open(RESULTS_FILE, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Results appended to {os.path.relpath(RESULTS_FILE, ROOT)}")
+    if args.compare:
+        compare(record, args.compare, history)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""Hit every route against a realistically sized shop and fail if a view runs
+more SQL statements or takes longer than the budget declared next to it.
+
+Budgets are declared on the views with @query_budget (app/utils.py). The check
+runs on a throwaway SQLite database with PROFILING on, and reads each
+response's Server-Timing header. A route without a budget, or one this script
+does not exercise, also fails the check.
+
+Usage:
+    python check_query_budgets.py            # Check all routes, exit 1 on regressions
+    python check_query_budgets.py --verbose  # Also print routes within budget
+"""
+import argparse
+import io
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="pastrycloud-budgets-"), "budgets.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["PROFILING"] = "1"
+os.environ["PROFILING_SAMPLE_RATE"] = "1"
+os.environ["SCHEMA_CHECK"] = "auto"
+
+from flask import url_for
+from sqlalchemy import insert, select
+
+from app import create_app, price_history, rollups
+from app.extensions import db
+from app.models import (
+    Shop, User, Ingredient, Recipe, RecipeIngredient, Product, ProductRecipe,
+    ProductionRun, Sale, SaleItem, WasteLog, CustomUnit,
+)
+
+EMAIL = "owner@budget.test"
+PASSWORD = "budget-pass"
+
+# Shop size the budgets are checked against
+N_INGREDIENTS = 150
+N_RECIPES = 60
+LINES_PER_RECIPE = 6
+N_PRODUCTS = 80
+N_RUNS = 120
+SALES_PER_DAY = 15
+DAYS = 30
+N_WASTE = 150
+
+_SQL = re.compile(r'sql;dur=[\d.]+;desc="(\d+) queries"')
+_TOTAL = re.compile(r'app;dur=([\d.]+)')
+
+
+def seed():
+    """Create the measured shop plus a neighbour shop; returns ids the scenarios need."""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    today = date.today()
+
+    shop = Shop(name="Budget Bakery", invite_code="BUDGET01")
+    other = Shop(name="Neighbour", invite_code="BUDGET02")
+    db.session.add_all([shop, other])
+    db.session.flush()
+    owner = User(email=EMAIL, display_name="Owner", role="owner", shop_id=shop.id)
+    owner.set_password(PASSWORD)
+    db.session.add(owner)
+    for i in range(4):
+        member = User(email=f"member{i}@budget.test", display_name=f"Member {i}",
+                      role="member", shop_id=shop.id)
+        member.set_password(PASSWORD)
+        db.session.add(member)
+    db.session.flush()
+
+    units = ["g", "g", "g", "mL", "pcs"]
+    ingredients = []
+    for shop_id, count in ((shop.id, N_INGREDIENTS), (other.id, 20)):
+        for i in range(count):
+            qty = rng.choice([0, 50, 500, 5000, 20000])
+            ingredients.append({
+                "shop_id": shop_id, "name": f"Ingredient {i:03d}", "category": "Other",
+                "base_unit": units[i % len(units)], "quantity_on_hand": qty,
+                "cost_per_base_unit": rng.uniform(0.001, 0.05), "min_stock_level": 100,
+            })
+    db.session.execute(insert(Ingredient), ingredients)
+    ing = db.session.execute(
+        select(Ingredient.id, Ingredient.base_unit).where(Ingredient.shop_id == shop.id)
+    ).all()
+
+    db.session.execute(insert(Recipe), [
+        {"shop_id": shop.id, "name": f"Recipe {i:03d}", "yield_quantity": rng.choice([1, 6, 12, 24])}
+        for i in range(N_RECIPES)
+    ])
+    recipe_ids = db.session.scalars(select(Recipe.id).where(Recipe.shop_id == shop.id)).all()
+    db.session.execute(insert(RecipeIngredient), [
+        {"recipe_id": rid, "ingredient_id": i.id, "quantity": rng.uniform(5, 300), "unit": i.base_unit}
+        for rid in recipe_ids for i in rng.sample(ing, LINES_PER_RECIPE)
+    ])
+
+    db.session.execute(insert(Product), [
+        {"shop_id": shop.id, "name": f"Product {i:03d}", "category": "Pastries",
+         "selling_price": rng.uniform(5, 60)}
+        for i in range(N_PRODUCTS)
+    ])
+    product_ids = db.session.scalars(select(Product.id).where(Product.shop_id == shop.id)).all()
+    db.session.execute(insert(ProductRecipe), [
+        {"product_id": pid, "recipe_id": rid, "quantity_needed": 1.0}
+        for pid in product_ids for rid in rng.sample(recipe_ids, rng.choice([1, 1, 2]))
+    ])
+
+    db.session.execute(insert(ProductionRun), [
+        {"shop_id": shop.id, "recipe_id": rng.choice(recipe_ids), "quantity_produced": 12,
+         "status": "completed" if i > 10 else "planned", "cost_total": 10.0,
+         "created_at": now - timedelta(hours=6 * i)}
+        for i in range(N_RUNS)
+    ])
+
+    sales = [
+        {"shop_id": shop.id, "sale_date": today - timedelta(days=d), "total_amount": 0.0,
+         "vat_amount": 0.0, "created_at": now - timedelta(days=d, minutes=n)}
+        for d in range(DAYS) for n in range(SALES_PER_DAY)
+    ]
+    db.session.execute(insert(Sale), sales)
+    sale_ids = db.session.scalars(select(Sale.id).where(Sale.shop_id == shop.id)).all()
+    db.session.execute(insert(SaleItem), [
+        {"sale_id": sid, "product_id": pid, "quantity": 2, "unit_price": 10.0,
+         "vat_rate": 20.0, "line_total": 24.0, "unit_cost": 3.5}
+        for sid in sale_ids for pid in rng.sample(product_ids, 3)
+    ])
+
+    db.session.execute(insert(WasteLog), [
+        {"shop_id": shop.id, "ingredient_id": rng.choice(ing).id if i % 2 else None,
+         "product_id": None if i % 2 else rng.choice(product_ids), "quantity": 100,
+         "unit": "g", "cost_estimate": 1.5, "category": "spoiled",
+         "logged_at": now - timedelta(hours=5 * i)}
+        for i in range(N_WASTE)
+    ])
+    # Bulk inserts bypass the rollup and price history listeners
+    rollups.rebuild(shop.id)
+    price_history.sync(shop.id)
+
+    # Rows the delete scenarios can remove without touching the ones above
+    spare_ing = Ingredient(shop_id=shop.id, name="Spare ingredient", base_unit="g")
+    spare_recipe = Recipe(shop_id=shop.id, name="Spare recipe")
+    spare_product = Product(shop_id=shop.id, name="Spare product", selling_price=1)
+    api_spares = [Ingredient(shop_id=shop.id, name=f"API spare {i}", base_unit="g") for i in range(2)]
+    sack = CustomUnit(shop_id=shop.id, name="sack", dimension="mass", factor=25000)
+    spare_unit = CustomUnit(shop_id=shop.id, name="spare scoop", dimension="volume", factor=80)
+    db.session.add_all([spare_ing, spare_recipe, spare_product, *api_spares, sack, spare_unit])
+    db.session.commit()
+
+    planned = db.session.scalars(
+        select(ProductionRun.id).where(ProductionRun.status == "planned").order_by(ProductionRun.id)
+    ).all()
+    member = User.query.filter_by(email="member0@budget.test").one()
+    return {
+        "ingredient": ing[0].id, "recipe": recipe_ids[0], "product": product_ids[0],
+        "products": product_ids[:3], "recipes": recipe_ids[:30], "batch_products": product_ids[:40], "sale": sale_ids[0], "waste": 1,
+        "run_complete": planned[0], "run_delete": planned[1], "member": member.id,
+        "spare_ingredient": spare_ing.id, "spare_recipe": spare_recipe.id,
+        "spare_product": spare_product.id, "api_spares": [i.id for i in api_spares],
+        "spare_unit": spare_unit.id,
+    }
+
+
+def _import_file():
+    rows = ["name,unit,quantity,cost_per_unit"]
+    rows += [f"Imported {i},kg,{i},{i / 10}" for i in range(200)]
+    return (io.BytesIO("\n".join(rows).encode()), "ingredients.csv")
+
+
+def anonymous_scenarios():
+    """(endpoint, method, url args, request kwargs) for a logged-out visitor."""
+    return [
+        ("auth.landing", "GET", {}, {}),
+        ("auth.login", "GET", {}, {}),
+        ("auth.register", "GET", {}, {}),
+        ("auth.login", "POST", {}, {"data": {"email": EMAIL, "password": PASSWORD}}),
+    ]
+
+
+def owner_scenarios(ids):
+    """(endpoint, method, url args, request kwargs) for the shop owner, in run order."""
+    htmx = {"headers": {"HX-Request": "true"}}
+    recipe_form = {
+        "name": "Budget recipe", "yield_quantity": "12",
+        **{f"ingredient_id_{i}": str(ids["ingredient"]) for i in range(5)},
+        **{f"ingredient_qty_{i}": "100" for i in range(5)},
+        **{f"ingredient_unit_{i}": "g" for i in range(4)},
+        "ingredient_unit_4": "sack",
+    }
+    product_form = {"name": "Budget product", "selling_price": "12",
+                    "recipe_ids": [str(ids["recipe"])], "recipe_qtys": ["1"]}
+    ingredient_form = {"name": "Budget ingredient", "display_unit": "kg",
+                       "quantity_on_hand": "5", "cost_per_unit": "2"}
+    scenarios = [
+        ("dashboard.index", "GET", {}, {}),
+        ("ingredients.index", "GET", {}, {}),
+        ("ingredients.index", "GET", {"status": "low"}, htmx),
+        ("ingredients.create", "GET", {}, {}),
+        ("ingredients.edit", "GET", {"id": ids["ingredient"]}, {}),
+        ("recipes.index", "GET", {}, {}),
+        ("recipes.index", "GET", {"search": "Recipe", "partial": 1}, htmx),
+        ("recipes.create", "GET", {}, {}),
+        ("recipes.detail", "GET", {"id": ids["recipe"]}, {}),
+        ("recipes.edit", "GET", {"id": ids["recipe"]}, {}),
+        ("recipes.search_ingredients", "GET", {"q": "Ingredient"}, htmx),
+        ("recipes.ingredient_units", "GET", {"ingredient_id": ids["ingredient"]}, {}),
+        ("products.index", "GET", {}, {}),
+        ("products.index", "GET", {"search": "Product", "partial": 1}, htmx),
+        ("products.create", "GET", {}, {}),
+        ("products.edit", "GET", {"id": ids["product"]}, {}),
+        ("products.search", "GET", {"q": "Product"}, {}),
+        ("products.search", "GET", {"q": "Product"}, htmx),
+        ("production.index", "GET", {}, {}),
+        ("production.create", "GET", {}, {}),
+        ("production.check_stock", "GET", {"recipe_id": ids["recipe"], "qty": 24}, htmx),
+        ("production.sheet", "GET", {}, {}),
+        ("production.sheet", "GET", {**{f"qty_{rid}": 24 for rid in ids["recipes"]}}, {}),
+        ("sales.index", "GET", {}, {}),
+        ("sales.index", "GET", {"date": date.today().isoformat()}, {}),
+        ("sales.quick_sale", "GET", {}, {}),
+        ("sales.detail", "GET", {"id": ids["sale"]}, {}),
+        ("waste.index", "GET", {}, {}),
+        ("waste.create", "GET", {}, {}),
+        ("waste.analytics", "GET", {}, {}),
+        ("waste.batch", "GET", {}, {}),
+        ("waste.analytics", "GET", {"by": "ingredient", "period": "week", "count": 104}, {}),
+        ("reports.margins", "GET", {}, {}),
+        ("reports.margins", "GET", {"start": (date.today() - timedelta(days=365)).isoformat()}, {}),
+        ("reports.what_if", "GET", {}, {}),
+        ("reports.what_if", "GET", {f"pct_{ids['ingredient']}": 30, "pct_999999": 10}, {}),
+        ("reports.sensitivity", "GET", {}, {}),
+        ("reports.sensitivity", "GET", {"days": 365}, {}),
+        ("reports.profit", "GET", {}, {}),
+        ("reports.profit", "GET", {"by": "product", "start": (date.today() - timedelta(days=365)).isoformat()}, {}),
+        ("reports.profit", "GET", {"by": "category"}, {}),
+        ("exports.index", "GET", {}, {}),
+        ("imports.index", "GET", {}, {}),
+        ("settings.team", "GET", {}, {}),
+        ("settings.shop", "GET", {}, {}),
+        ("settings.units", "GET", {}, {}),
+        ("ops.health", "GET", {}, {}),
+        ("ops.pool", "GET", {}, {}),
+        ("ops.prometheus", "GET", {}, {}),
+        ("api.list_resource", "GET", {"resource": "ingredients"}, {}),
+        ("api.list_resource", "GET", {"resource": "recipes", "fields": "id,name,total_cost,cost_per_unit"}, {}),
+        ("api.list_resource", "GET", {"resource": "products", "q": "Product", "limit": 1000}, {}),
+        ("api.list_resource", "GET", {"resource": "sales", "fields": "id,total_amount,items", "limit": 450}, {}),
+        ("api.list_resource", "GET", {"resource": "production_runs", "status": "completed"}, {}),
+        ("api.list_resource", "GET", {"resource": "waste", "category": "spoiled"}, {}),
+        ("api.get_resource", "GET", {"resource": "products", "id": ids["product"]}, {}),
+        ("api.get_resource", "GET", {"resource": "sales", "id": ids["sale"], "fields": "items"}, {}),
+    ]
+    for entity in ("ingredients", "recipes", "products", "production_runs", "sales", "waste_logs"):
+        scenarios.append(("exports.download", "GET", {"entity": entity, "format": "csv"}, {}))
+    scenarios += [
+        ("exports.download", "GET", {"entity": "sales", "format": "json"}, {}),
+        ("exports.download", "GET", {"entity": "sales", "format": "excel"}, {}),
+        ("exports.download", "GET", {"entity": "sales", "format": "json", "since": ""}, {}),
+
+        ("ingredients.create", "POST", {}, {"data": ingredient_form}),
+        ("ingredients.edit", "POST", {"id": ids["ingredient"]}, {"data": ingredient_form}),
+        ("recipes.create", "POST", {}, {"data": recipe_form}),
+        ("recipes.edit", "POST", {"id": ids["recipe"]}, {"data": recipe_form}),
+        ("products.create", "POST", {}, {"data": product_form}),
+        ("products.edit", "POST", {"id": ids["product"]}, {"data": product_form}),
+        ("production.create", "POST", {}, {"data": {"recipe_id": ids["recipe"], "quantity_produced": "12"}}),
+        ("production.complete", "POST", {"id": ids["run_complete"]}, {}),
+        ("sales.checkout", "POST", {}, {"json": {"items": [
+            {"product_id": pid, "quantity": 2} for pid in ids["products"]
+        ]}}),
+        ("waste.create", "POST", {}, {"data": {
+            "waste_type": "ingredient", "ingredient_id": ids["ingredient"],
+            "quantity": "100", "unit": "g", "category": "spoiled",
+        }}),
+        ("waste.batch", "POST", {}, {"data": {
+            "category": "unsold", **{f"qty_{pid}": "3" for pid in ids["batch_products"]},
+        }}),
+        ("api.bulk_create", "POST", {"resource": "ingredients"}, {"json": [
+            {"name": f"API ingredient {i}", "base_unit": "g", "quantity_on_hand": 500} for i in range(200)
+        ]}),
+        ("api.bulk_update", "PATCH", {"resource": "products"}, {"json": [
+            {"id": pid, "selling_price": 9.5} for pid in ids["products"]
+        ]}),
+        ("api.bulk_delete", "DELETE", {"resource": "ingredients"}, {"json": {"ids": ids["api_spares"]}}),
+        ("imports.index", "POST", {}, {"data": {"entity": "ingredients", "dry_run": "1",
+                                                 "file": _import_file()}}),
+        ("settings.shop", "POST", {}, {"data": {"name": "Budget Bakery", "currency": "DH",
+                                                "default_vat_rate": "20"}}),
+        ("settings.regenerate_invite", "POST", {}, {}),
+        ("settings.units", "POST", {}, {"data": {"name": "tray", "dimension": "count", "factor": "30",
+                                                 "ingredient_id": ids["ingredient"]}}),
+        ("settings.delete_unit", "POST", {"id": ids["spare_unit"]}, {}),
+        ("settings.remove_member", "POST", {"id": ids["member"]}, {}),
+        ("production.delete", "POST", {"id": ids["run_delete"]}, {}),
+        ("sales.delete", "POST", {"id": ids["sale"]}, {}),
+        ("waste.delete", "POST", {"id": ids["waste"]}, {}),
+        ("products.delete", "POST", {"id": ids["spare_product"]}, {}),
+        ("recipes.delete", "POST", {"id": ids["spare_recipe"]}, {}),
+        ("ingredients.delete", "POST", {"id": ids["spare_ingredient"]}, {}),
+        ("auth.logout", "GET", {}, {}),
+    ]
+    return scenarios
+
+
+def _register_scenario():
+    return ("auth.register", "POST", {}, {"data": {
+        "email": "new@budget.test", "password": PASSWORD,
+        "display_name": "New", "invite_code": "BUDGET02",
+    }})
+
+
+def measure(app, client, scenario):
+    """Run one request; returns (status, queries, ms)."""
+    endpoint, method, args, kwargs = scenario
+    with app.test_request_context():
+        url = url_for(endpoint, **args)
+    response = client.open(url, method=method, **kwargs)
+    timing = response.headers.get("Server-Timing", "")
+    sql, total = _SQL.search(timing), _TOTAL.search(timing)
+    if not sql or not total:
+        raise RuntimeError(f"{endpoint}: no Server-Timing header; is PROFILING on?")
+    return response.status_code, int(sql.group(1)), float(total.group(1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="Print routes within budget too")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        ids = seed()
+
+    owner = app.test_client()
+    runs = [(app.test_client(), s) for s in anonymous_scenarios()]
+    runs.append((app.test_client(), _register_scenario()))
+    runs += [(owner, s) for s in owner_scenarios(ids)]
+
+    # Compile templates and warm caches with the read-only requests first,
+    # so timings reflect steady state rather than the first hit.
+    measure(app, owner, ("auth.login", "POST", {}, {"data": {"email": EMAIL, "password": PASSWORD}}))
+    for client, scenario in runs:
+        if scenario[1] == "GET" and client is owner and scenario[0] != "auth.logout":
+            measure(app, client, scenario)
+
+    failures = []
+    exercised = set()
+    print(f"Checking query budgets on {len(runs)} requests...")
+    for client, scenario in runs:
+        endpoint, method = scenario[0], scenario[1]
+        exercised.add(endpoint)
+        budget = getattr(app.view_functions[endpoint], "query_budget", None)
+        status, queries, ms = measure(app, client, scenario)
+        problems = []
+        if budget is None:
+            problems.append("no @query_budget declared")
+        else:
+            max_queries, max_ms = budget
+            if queries > max_queries:
+                problems.append(f"{queries} queries > {max_queries}")
+            if ms > max_ms:
+                problems.append(f"{ms:.0f} ms > {max_ms} ms")
+        if status >= 400:
+            problems.append(f"HTTP {status}")
+
+        label = f"{method} {endpoint}"
+        params = {k: v for k, v in scenario[2].items() if k not in ("id", "recipe_id", "ingredient_id")}
+        if params:
+            label += " " + " ".join(f"{k}={v}" for k, v in params.items())
+        if problems:
+            failures.append(label)
+            print(f"  [FAIL] {label}: {queries} queries, {ms:.0f} ms  ({'; '.join(problems)})")
+        elif args.verbose:
+            print(f"  [  ok] {label}: {queries}/{budget[0]} queries, {ms:.0f}/{budget[1]} ms")
+
+    for endpoint in sorted(set(app.view_functions) - exercised - {"static"}):
+        failures.append(endpoint)
+        print(f"  [FAIL] {endpoint}: not exercised by check_query_budgets.py")
+
+    if failures:
+        print(f"{len(failures)} route check(s) failed.")
+        sys.exit(1)
+    print("All routes are within their query budgets.")
+
+
+if __name__ == "__main__":
+    main()
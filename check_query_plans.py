@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""EXPLAIN the hot tenant-scoped queries and fail if any falls back to a full table scan.
+
+Runs against DATABASE_URL (SQLite or PostgreSQL). On PostgreSQL sequential
+scans are disabled for the check, so a "Seq Scan" in the plan means no usable
+index exists rather than the planner preferring a scan on a small table.
+
+Usage:
+    python check_query_plans.py            # Check all queries, exit 1 on regressions
+    python check_query_plans.py --verbose  # Also print every plan
+"""
+import argparse
+import os
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, select
+
+from app import create_app
+from app.extensions import db
+from app.models import (
+    Ingredient, Recipe, RecipeIngredient, Product, ProductRecipe, ProductionRun,
+    Sale, SaleItem, WasteLog, DeletedRecord,
+)
+
+SHOP_ID = 1
+TODAY = date.today()
+NOW = datetime.utcnow()
+
+
+def hot_queries():
+    """(label, statement) pairs mirroring what the routes and services issue."""
+    low_stock = Ingredient.quantity_on_hand <= Ingredient.min_stock_level
+    return [
+        ("ingredients.index", select(Ingredient).where(Ingredient.shop_id == SHOP_ID)
+            .order_by(Ingredient.name)),
+        ("low stock badge", select(func.count()).select_from(Ingredient).where(
+            Ingredient.shop_id == SHOP_ID, low_stock, Ingredient.quantity_on_hand > 0)),
+        ("get_low_stock_ingredients", select(Ingredient).where(Ingredient.shop_id == SHOP_ID, low_stock)
+            .order_by(Ingredient.quantity_on_hand)),
+        ("recipes.index", select(Recipe).where(Recipe.shop_id == SHOP_ID).order_by(Recipe.name)),
+        ("recipe lines", select(RecipeIngredient).where(RecipeIngredient.recipe_id == 1)),
+        ("products.index", select(Product).where(Product.shop_id == SHOP_ID).order_by(Product.name)),
+        ("products.search", select(Product).where(
+            Product.shop_id == SHOP_ID, Product.is_active == True, Product.name.ilike("%cr%"),
+        ).order_by(Product.name).limit(10)),
+        ("product recipes", select(ProductRecipe).where(ProductRecipe.product_id == 1)),
+        ("production.index", select(ProductionRun).where(ProductionRun.shop_id == SHOP_ID)
+            .order_by(ProductionRun.created_at.desc())),
+        ("dashboard today production", select(func.count()).select_from(ProductionRun).where(
+            ProductionRun.shop_id == SHOP_ID, ProductionRun.created_at >= NOW - timedelta(days=1),
+            ProductionRun.created_at < NOW)),
+        ("sales.index", select(Sale).where(Sale.shop_id == SHOP_ID).order_by(Sale.created_at.desc())),
+        ("sales of the day", select(Sale).where(Sale.shop_id == SHOP_ID, Sale.sale_date == TODAY)),
+        ("sale lines", select(SaleItem).where(SaleItem.sale_id == 1)),
+        ("dashboard top products", select(Product.name, func.sum(SaleItem.quantity))
+            .join(SaleItem, SaleItem.product_id == Product.id)
+            .join(Sale, Sale.id == SaleItem.sale_id)
+            .where(Sale.shop_id == SHOP_ID, Sale.sale_date >= TODAY - timedelta(days=30))
+            .group_by(Product.name)),
+        ("waste.index", select(WasteLog).where(WasteLog.shop_id == SHOP_ID)
+            .order_by(WasteLog.logged_at.desc())),
+        ("dashboard waste cost", select(func.sum(WasteLog.cost_estimate)).where(
+            WasteLog.shop_id == SHOP_ID, WasteLog.logged_at >= NOW - timedelta(days=30))),
+        ("incremental export", select(Sale).where(Sale.shop_id == SHOP_ID, Sale.updated_at > NOW)
+            .order_by(Sale.updated_at, Sale.id)),
+        ("export tombstones", select(DeletedRecord).where(
+            DeletedRecord.shop_id == SHOP_ID, DeletedRecord.entity == "sales",
+            DeletedRecord.deleted_at > NOW).order_by(DeletedRecord.deleted_at, DeletedRecord.id)),
+    ]
+
+
+def _run(conn, prefix, stmt):
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[k] for k in compiled.positiontup)
+    return conn.exec_driver_sql(prefix + str(compiled), params).all()
+
+
+def _sqlite_plan(conn, stmt):
+    rows = _run(conn, "EXPLAIN QUERY PLAN ", stmt)
+    lines = [r[-1] for r in rows]
+    scans = []
+    for line in lines:
+        m = re.match(r"SCAN (\w+)", line)
+        if m and "USING" not in line and m.group(1) != "CONSTANT":
+            scans.append(m.group(1))
+    return lines, scans
+
+
+def _walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def _postgres_plan(conn, stmt):
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    plan = _run(conn, "EXPLAIN (FORMAT JSON) ", stmt)[0][0][0]["Plan"]
+    nodes = list(_walk(plan))
+    lines = [f"{n['Node Type']} {n.get('Relation Name', '')} {n.get('Index Name', '')}".strip() for n in nodes]
+    scans = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+    return lines, scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="Print every query plan")
+    args = parser.parse_args()
+
+    app = create_app()
+    failures = 0
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        explain = _postgres_plan if dialect == "postgresql" else _sqlite_plan
+        print(f"Checking query plans on {dialect}...")
+        for label, stmt in hot_queries():
+            with db.engine.begin() as conn:
+                lines, scans = explain(conn, stmt)
+                conn.rollback()
+            status = "FAIL" if scans else "ok"
+            print(f"  [{status:>4}] {label}" + (f"  (full scan on {', '.join(scans)})" if scans else ""))
+            if args.verbose or scans:
+                for line in lines:
+                    print(f"           {line}")
+            failures += bool(scans)
+
+    if failures:
+        print(f"{failures} query plan(s) regressed to sequential scans.")
+        sys.exit(1)
+    print("All query plans use indexes.")
+
+
+if __name__ == "__main__":
+    main()
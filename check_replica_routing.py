@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Check read-replica routing (app/routing.py) and fail if reads go to the wrong database.
+
+Runs on two throwaway SQLite files, the replica a copy of the primary, and
+records which one every statement of a request runs on. It checks that:
+
+- GETs to the allowlisted views (REPLICA_BLUEPRINTS, REPLICA_ENDPOINTS) read
+  only from the replica;
+- a request that commits runs on the primary and pins the user's following
+  requests, allowlisted or not, to the primary (read-your-writes);
+- views outside the allowlist always use the primary.
+
+Usage:
+    python check_replica_routing.py            # Exit 1 on any misrouted request
+    python check_replica_routing.py --verbose  # Also print requests routed correctly
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DB_DIR = tempfile.mkdtemp(prefix="pastrycloud-replica-")
+PRIMARY_PATH = os.path.join(DB_DIR, "primary.db")
+REPLICA_PATH = os.path.join(DB_DIR, "replica.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY_PATH}"
+os.environ["DATABASE_REPLICA_URL"] = f"sqlite:///{REPLICA_PATH}"
+os.environ["SCHEMA_CHECK"] = "auto"
+
+from flask import url_for
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app, routing
+from app.extensions import db
+from app.models import Shop, User, Ingredient, Recipe, Product, Sale
+
+EMAIL = "replica@check.test"
+PASSWORD = "replica-check"
+
+_databases = []  # database file of every statement in the current request
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _record(conn, cursor, statement, parameters, context, executemany):
+    _databases.append(os.path.basename(conn.engine.url.database or ""))
+
+
+def seed():
+    shop = Shop(name="Replica Check", invite_code="REPLICA1")
+    db.session.add(shop)
+    db.session.flush()
+    user = User(email=EMAIL, display_name="Owner", role="owner", shop_id=shop.id)
+    user.set_password(PASSWORD)
+    ingredient = Ingredient(shop_id=shop.id, name="Flour", base_unit="g", cost_per_base_unit=0.01)
+    recipe = Recipe(shop_id=shop.id, name="Bread")
+    product = Product(shop_id=shop.id, name="Baguette", selling_price=3.0)
+    db.session.add_all([user, ingredient, recipe, product, Sale(shop_id=shop.id, sale_date=date.today())])
+    db.session.commit()
+    return {"ingredient": ingredient.id, "recipe": recipe.id, "product": product.id}
+
+
+def allowlisted(endpoint):
+    return endpoint in routing.REPLICA_ENDPOINTS or endpoint.partition(".")[0] in routing.REPLICA_BLUEPRINTS
+
+
+def replica_reads(app, ids):
+    """(endpoint, url) for every allowlisted view, and the allowlisted endpoints left out."""
+    with app.test_request_context():
+        urls = {
+            "api.list_resource": url_for("api.list_resource", resource="products"),
+            "api.get_resource": url_for("api.get_resource", resource="products", id=ids["product"]),
+            "exports.download": url_for("exports.download", entity="sales", format="csv"),
+        }
+        for rule in app.url_map.iter_rules():
+            if "GET" in rule.methods and not rule.arguments and allowlisted(rule.endpoint):
+                urls.setdefault(rule.endpoint, url_for(rule.endpoint))
+    expected = {endpoint for endpoint in app.view_functions if allowlisted(endpoint)}
+    return sorted(urls.items()), sorted(expected - set(urls))
+
+
+def primary_reads(app, ids):
+    """(endpoint, url) for GET views outside the allowlist."""
+    with app.test_request_context():
+        return [(endpoint, url_for(endpoint, **args)) for endpoint, args in [
+            ("products.create", {}),
+            ("products.edit", {"id": ids["product"]}),
+            ("recipes.detail", {"id": ids["recipe"]}),
+            ("ingredients.edit", {"id": ids["ingredient"]}),
+            ("sales.quick_sale", {}),
+            ("reports.margins", {}),
+            ("settings.team", {}),
+        ]]
+
+
+def request_databases(client, method, url, **kwargs):
+    _databases.clear()
+    response = getattr(client, method)(url, **kwargs)
+    return response.status_code, set(_databases)
+
+
+def unpin(client):
+    with client.session_transaction() as session:
+        session.pop("_primary_until", None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="Print correctly routed requests too")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        ids = seed()
+        for engine in db.engines.values():
+            engine.dispose()
+    shutil.copy(PRIMARY_PATH, REPLICA_PATH)
+    primary, replica = os.path.basename(PRIMARY_PATH), os.path.basename(REPLICA_PATH)
+
+    client = app.test_client()
+    client.post("/login", data={"email": EMAIL, "password": PASSWORD})
+
+    failures = []
+
+    def check(label, status, used, want):
+        problems = []
+        if status >= 400:
+            problems.append(f"HTTP {status}")
+        if used != {want}:
+            problems.append(f"ran on {', '.join(sorted(used)) or 'no database'}, expected only {want}")
+        if problems:
+            failures.append(label)
+            print(f"  [FAIL] {label}: {'; '.join(problems)}")
+        elif args.verbose:
+            print(f"  [  ok] {label}: {want}")
+
+    reads, missing = replica_reads(app, ids)
+    for endpoint in missing:
+        failures.append(endpoint)
+        print(f"  [FAIL] {endpoint}: allowlisted but not exercised by check_replica_routing.py")
+    others = primary_reads(app, ids)
+    print(f"Checking replica routing on {(len(reads) + len(others)) * 2 + 1} requests...")
+
+    # (a) Allowlisted reads go to the replica once the login's pin is cleared
+    for endpoint, url in reads:
+        unpin(client)
+        check(f"GET {endpoint}", *request_databases(client, "get", url), replica)
+
+    # (c) Everything else stays on the primary, pinned or not
+    for endpoint, url in others:
+        unpin(client)
+        check(f"GET {endpoint} (unpinned)", *request_databases(client, "get", url), primary)
+
+    # (b) A write runs on the primary and pins the following reads to it
+    unpin(client)
+    status, used = request_databases(client, "post", "/sales/checkout",
+                                     json={"items": [{"product_id": ids["product"], "quantity": 1}]})
+    check("POST sales.checkout", status, used, primary)
+    with client.session_transaction() as session:
+        if "_primary_until" not in session:
+            failures.append("pin")
+            print("  [FAIL] POST sales.checkout: did not pin the session to the primary")
+    for endpoint, url in reads + others:
+        check(f"GET {endpoint} (after a write)", *request_databases(client, "get", url), primary)
+
+    if failures:
+        print(f"{len(failures)} routing check(s) failed.")
+        sys.exit(1)
+    print("Reads are routed to the replica and primary as configured.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 import os
+import tempfile
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "atelier-alami-secret-key-change-me")
 
@@ -16,4 +25,59 @@ class Config:
     else:
         SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(BASE_DIR, 'instance', 'pastry_shop.db')}"
 
+    # Optional read replica for dashboard, exports and list views
+    SQLALCHEMY_BINDS = {}
+    replica_url = os.environ.get("DATABASE_REPLICA_URL", "")
+    if replica_url:
+        if replica_url.startswith("postgres://"):
+            replica_url = replica_url.replace("postgres://", "postgresql://", 1)
+        SQLALCHEMY_BINDS = {"replica": replica_url}
+    # After a user saves something, keep their reads on the primary this long
+    REPLICA_PIN_SECONDS = env_int("REPLICA_PIN_SECONDS", 10)
+
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool (PostgreSQL only; SQLite keeps SQLAlchemy's defaults).
+    # Size workers so that gunicorn workers * (POOL_SIZE + MAX_OVERFLOW) stays
+    # under the database's connection limit.
+    DB_POOL_SIZE = env_int("DB_POOL_SIZE", 5)
+    DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 5)
+    DB_POOL_TIMEOUT = env_int("DB_POOL_TIMEOUT", 10)  # seconds to wait for a free connection
+    # Neon closes idle connections after ~5 minutes; recycle before that and
+    # ping on checkout so a dropped connection is replaced, not surfaced as an error.
+    DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", 240)
+    DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+    # Set when DATABASE_URL points at PgBouncer (e.g. Neon's "-pooler" host):
+    # the bouncer does the pooling, so connections are opened per checkout.
+    DB_PGBOUNCER = env_bool("DB_PGBOUNCER", False)
+
+    # Request profiling (SQL count/time, template time, N+1 warnings, Server-Timing header)
+    PROFILING = env_bool("PROFILING", False)
+    PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 1.0))
+    # Same statement this many times in one request is reported as a likely N+1
+    PROFILING_N_PLUS_ONE = env_int("PROFILING_N_PLUS_ONE", 5)
+
+    # Bearer token for /health/* and /metrics; owners can always view them when logged in
+    OPS_TOKEN = os.environ.get("OPS_TOKEN", "")
+
+    # Logged-in user and shop rows are cached per worker this long (0 disables).
+    # Invalidations reach the other workers on this host through the stamp file.
+    USER_CACHE_TTL = env_int("USER_CACHE_TTL", 60)
+    USER_CACHE_STAMP = os.environ.get(
+        "USER_CACHE_STAMP", os.path.join(tempfile.gettempdir(), "pastrycloud-user-cache.stamp"))
+
+    # Rendered HTMX list partials kept per worker (0 disables); see app/fragments.py
+    FRAGMENT_CACHE_SIZE = env_int("FRAGMENT_CACHE_SIZE", 500)
+
+    # Shops whose ingredient price history is kept in memory per worker; see app/price_history.py
+    PRICE_HISTORY_CACHE_SIZE = env_int("PRICE_HISTORY_CACHE_SIZE", 100)
+    # Shops whose recipe x ingredient cost matrix is kept per worker; see app/cost_matrix.py
+    COST_MATRIX_CACHE_SIZE = env_int("COST_MATRIX_CACHE_SIZE", 100)
+
+    # gzip/brotli for text responses; turn off when a proxy in front already compresses
+    COMPRESS_RESPONSES = env_bool("COMPRESS_RESPONSES", True)
+    COMPRESS_MIN_SIZE = env_int("COMPRESS_MIN_SIZE", 1024)  # bytes; smaller bodies go out as is
+
+    # Boot-time schema check: "auto" (one version query, migrate if behind) or
+    # "off" when migrations run as a deploy step (flask --app wsgi migrate).
+    SCHEMA_CHECK = os.environ.get("SCHEMA_CHECK", "auto")
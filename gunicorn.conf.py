@@ -0,0 +1,18 @@
+"""Gunicorn settings (picked up automatically from the working directory)."""
+import os
+import shutil
+
+# Shared directory where each worker writes its Prometheus samples; /metrics
+# aggregates them. Must be set before workers import the app.
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/pastrycloud-metrics")
+
+
+def on_starting(server):
+    # Samples from a previous run would be double-counted
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)